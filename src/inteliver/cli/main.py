@@ -1,9 +1,14 @@
+import os
+from pathlib import Path
+
 import typer
 
 from inteliver.cli.minio import cli as subcommand_minio
 from inteliver.cli.minio import setup_minio
+from inteliver.cli.models import cli as subcommand_models
 from inteliver.cli.postgres import cli as subcommand_postgres
 from inteliver.cli.postgres import migrate_postgres, setup_postgres
+from inteliver.cli.process import process_images
 from inteliver.cli.user import cli as subcommand_adminuser
 from inteliver.cli.user import create_admin
 from inteliver.cli.utils import print_inteliver_logo
@@ -32,19 +37,71 @@ cli.add_typer(
     help="All subcommands related to admin user",
 )
 
+cli.add_typer(
+    subcommand_models,
+    name="models",
+    help="All subcommands related to image models",
+)
+
 
 @cli.command()
-def run(host: str = settings.app_api_host, port: int = settings.app_api_port):
+def run(
+    host: str = settings.app_api_host,
+    port: int = settings.app_api_port,
+    workers: int = typer.Option(
+        settings.server_workers,
+        "--workers",
+        help="Number of pre-forked worker processes.",
+    ),
+):
     """
     Run inteliver service.
     """
     print_inteliver_logo()
 
+    from inteliver.image.threads import ThreadBudget
+
+    if workers > 1:
+        from inteliver.prefork import run_prefork_service
+
+        run_prefork_service(host, port, workers)
+        return
+
+    # before numpy is imported with the app
+    ThreadBudget.configure_environment()
     from inteliver.main import run_service
 
     run_service(host, port)
 
 
+@cli.command()
+def process(
+    source: str = typer.Argument(
+        ..., help="Source directory or MinIO location (s3://bucket/prefix)."
+    ),
+    destination: str = typer.Argument(
+        ..., help="Destination directory or MinIO location (s3://bucket/prefix)."
+    ),
+    commands: str = typer.Option(
+        ...,
+        "--commands",
+        help="Commands to apply to every image (e.g. i_h_200,i_o_resize/i_o_format_webp).",
+    ),
+    workers: int = typer.Option(
+        os.cpu_count() or 1, "--workers", help="Number of worker processes."
+    ),
+    checkpoint: Path = typer.Option(
+        Path("inteliver-process.checkpoint"),
+        "--checkpoint",
+        help="File of processed keys, used to resume an interrupted run.",
+    ),
+):
+    """
+    Process every image of a directory or bucket prefix offline.
+    """
+    process_images(source, destination, commands, workers, checkpoint)
+
+
 @cli.command()
 def init(
     non_interactive: bool = typer.Option(
@@ -0,0 +1,98 @@
+from enum import Enum
+from pathlib import Path
+
+import typer
+
+from inteliver.config import settings
+from inteliver.config.utils import save_config_to_yaml
+
+cli = typer.Typer()
+
+
+class ExportFormat(str, Enum):
+    ONNX = "onnx"
+    OPENVINO = "openvino"
+
+
+def export_detector(
+    model_path: str, export_format: ExportFormat, imgsz: int, int8: bool
+) -> str:
+    """
+    Export the YOLO model for the onnxruntime or openvino detector backend.
+
+    The models have a dynamic batch axis for the batched inference, the
+        int8 ONNX variant is quantized dynamically with ONNX Runtime. The int8
+        OpenVINO model is quantized by the ultralytics exporter, which
+        calibrates it on a small sample dataset.
+
+    Args:
+        model_path (str): The PyTorch YOLO model path.
+        export_format (ExportFormat): The export format.
+        imgsz (int): The model input size.
+        int8 (bool): Quantize the model weights to int8.
+
+    Returns:
+        str: The path of the exported model.
+    """
+    from ultralytics import YOLO
+
+    model = YOLO(model_path)
+    if export_format == ExportFormat.OPENVINO:
+        return model.export(format="openvino", imgsz=imgsz, dynamic=True, int8=int8)
+
+    exported = model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    if not int8:
+        return exported
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized = str(Path(exported).with_name(f"{Path(exported).stem}_int8.onnx"))
+    quantize_dynamic(exported, quantized, weight_type=QuantType.QUInt8)
+    return quantized
+
+
+@cli.command()
+def export(
+    export_format: ExportFormat = typer.Option(
+        ExportFormat.ONNX.value, "--format", help="Export format of the model."
+    ),
+    model_path: str = typer.Option(
+        settings.image_yolo_model_path, "--model", help="PyTorch YOLO model path."
+    ),
+    imgsz: int = typer.Option(
+        settings.image_detect_imgsz, "--imgsz", help="Model input size in pixels."
+    ),
+    int8: bool = typer.Option(False, "--int8", help="Quantize the model to int8."),
+    save_config: bool = typer.Option(
+        False,
+        "--save-config",
+        help="Select the exported model and its backend in the config file.",
+    ),
+):
+    """
+    Export the object detection model for the onnxruntime or openvino backend.
+    """
+    typer.secho(
+        f"Exporting {model_path} to {export_format.value}...", fg=typer.colors.BLUE
+    )
+    try:
+        exported = export_detector(model_path, export_format, imgsz, int8)
+    except ImportError as e:
+        typer.secho(
+            f"Model export failed, a dependency is missing: {e}", fg=typer.colors.RED
+        )
+        raise typer.Exit(code=1)
+
+    backend = "openvino" if export_format == ExportFormat.OPENVINO else "onnxruntime"
+    typer.secho(f"Exported model: {exported}", fg=typer.colors.GREEN)
+    if save_config:
+        save_config_to_yaml(
+            {"image_detector_backend": backend, "image_detector_model_path": exported}
+        )
+        typer.secho("Updated config file.", fg=typer.colors.GREEN)
+    else:
+        typer.secho(
+            f"Set image_detector_backend: {backend} and "
+            f"image_detector_model_path: {exported} to use it.",
+            fg=typer.colors.CYAN,
+        )
@@ -0,0 +1,289 @@
+import mimetypes
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from io import BytesIO
+from pathlib import Path
+from typing import Iterator
+
+import typer
+from rich.progress import Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
+
+S3_SCHEME = "s3://"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+# output file extension of each encoded mime subtype
+FORMAT_EXTENSIONS = {"jpeg": "jpg", "png": "png", "webp": "webp"}
+# source extensions which are kept as output extension of each mime subtype
+FORMAT_SUFFIXES = {"jpeg": (".jpg", ".jpeg"), "png": (".png",), "webp": (".webp",)}
+# separates the commands and the key of a checkpoint line
+CHECKPOINT_SEPARATOR = "\t"
+
+
+def parse_location(location: str) -> tuple[str | None, str]:
+    """
+    Split a processing location into its bucket and path parts.
+
+    Args:
+        location (str): A local directory or a 's3://bucket/prefix' location.
+
+    Returns:
+        tuple[str | None, str]: The bucket name (None for local
+            directories) and the local path or object key prefix.
+    """
+    if not location.startswith(S3_SCHEME):
+        return None, location
+    bucket, _, prefix = location[len(S3_SCHEME) :].partition("/")
+    return bucket, prefix
+
+
+def iter_image_keys(location: str) -> Iterator[str]:
+    """
+    Yield the keys of all the images under a location.
+
+    Keys are relative to the location, so they can be joined with the
+        destination to build the output key.
+
+    Args:
+        location (str): A local directory or a 's3://bucket/prefix' location.
+
+    Yields:
+        str: The relative key of each image.
+    """
+    bucket, path = parse_location(location)
+    if bucket is None:
+        root = Path(path)
+        # one directory listing at a time, in a stable order
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield (Path(dirpath) / filename).relative_to(root).as_posix()
+        return
+
+    from inteliver.storage.service import MinIOService
+
+    # 'photos' must not match 'photos2/...'
+    prefix = f"{path.rstrip('/')}/" if path else ""
+    for obj in MinIOService.client.list_objects(bucket, prefix=prefix, recursive=True):
+        if obj.object_name.lower().endswith(IMAGE_EXTENSIONS):
+            yield obj.object_name[len(prefix) :]
+
+
+def output_key(key: str, mime_type: str) -> str:
+    """
+    The output key of a processed image.
+
+    The source extension is kept, the extension of the output format is
+        appended unless the source already has it, so 'a.jpg' and 'a.png'
+        never overwrite each other.
+
+    Args:
+        key (str): The source key.
+        mime_type (str): The mime type of the encoded output.
+
+    Returns:
+        str: The output key.
+    """
+    subtype = mime_type.split("/")[-1]
+    if key.lower().endswith(FORMAT_SUFFIXES.get(subtype, ())):
+        return key
+    return f"{key}.{FORMAT_EXTENSIONS.get(subtype, 'jpg')}"
+
+
+def _join_key(prefix: str, key: str) -> str:
+    if not prefix:
+        return key
+    return f"{prefix.rstrip('/')}/{key}"
+
+
+def read_image(location: str, key: str) -> tuple[BytesIO, str]:
+    """
+    Read an image from a local directory or a MinIO bucket.
+
+    Returns:
+        tuple[BytesIO, str]: The image binary data and its content type.
+    """
+    bucket, path = parse_location(location)
+    if bucket is None:
+        file_path = Path(path) / key
+        content_type = mimetypes.guess_type(file_path.name)[0] or "image/jpeg"
+        return BytesIO(file_path.read_bytes()), content_type
+
+    from inteliver.storage.service import MinIOService
+
+    data, headers = MinIOService.get_object(bucket, _join_key(path, key))
+    return data, str(headers.get("Content-Type"))
+
+
+def write_image(location: str, key: str, data: bytes, mime_type: str):
+    """
+    Write an encoded image to a local directory or a MinIO bucket.
+    """
+    bucket, path = parse_location(location)
+    if bucket is None:
+        file_path = Path(path) / key
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(data)
+        return
+
+    from inteliver.storage.service import MinIOService
+
+    MinIOService.put_object(
+        bucket, _join_key(path, key), BytesIO(data), len(data), mime_type
+    )
+
+
+def process_one(
+    source: str, destination: str, key: str, commands: str
+) -> tuple[str, str | None, str | None]:
+    """
+    Process a single image, runs inside a worker process.
+
+    Errors are returned instead of raised, since the HTTP exceptions of
+        the image service are not picklable across processes.
+
+    Returns:
+        tuple[str, str | None, str | None]: The source key, the output
+            key if successful and the error message if failed.
+    """
+    from inteliver.image.service import ImageService
+
+    try:
+        data, image_format = read_image(source, key)
+        encoded, image_format = ImageService.render_image(data, commands, image_format)
+        mime_type = image_format.split(";")[0]
+        processed_key = output_key(key, mime_type)
+        write_image(destination, processed_key, encoded, mime_type)
+    except Exception as e:
+        detail = getattr(e, "detail", None) or str(e)
+        return key, None, f"{type(e).__name__}: {detail}"
+    return key, processed_key, None
+
+
+def load_checkpoint(checkpoint: Path, commands: str) -> set[str]:
+    """
+    Load the keys that are already processed with the commands from a
+        checkpoint file.
+
+    Every line of the checkpoint is the commands and the key of a
+        processed image, so a run with other commands processes the
+        images again.
+    """
+    if not checkpoint.exists():
+        return set()
+    done = set()
+    with open(checkpoint, "r") as file:
+        for line in file:
+            line_commands, _, key = line.rstrip("\n").partition(CHECKPOINT_SEPARATOR)
+            if key and line_commands == commands:
+                done.add(key)
+    return done
+
+
+def run_process(
+    source: str,
+    destination: str,
+    commands: str,
+    workers: int,
+    checkpoint: Path,
+) -> tuple[int, int, int]:
+    """
+    Process all the images of the source with a process pool.
+
+    Submissions are bounded to a few jobs per worker, so libraries with
+        millions of images are streamed instead of queued in memory. Every
+        successful key is appended to the checkpoint file, a restarted run
+        skips those keys if its commands are the same.
+
+    Args:
+        source (str): The source directory or 's3://bucket/prefix'.
+        destination (str): The destination directory or 's3://bucket/prefix'.
+        commands (str): The commands to apply to each image.
+        workers (int): Number of worker processes.
+        checkpoint (Path): The checkpoint file path.
+
+    Returns:
+        tuple[int, int, int]: The number of processed, skipped and failed images.
+    """
+    done = load_checkpoint(checkpoint, commands)
+    processed, skipped, failed = 0, 0, 0
+    max_in_flight = workers * 4
+
+    progress = Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        TimeElapsedColumn(),
+    )
+    with (
+        progress,
+        open(checkpoint, "a") as checkpoint_file,
+        ProcessPoolExecutor(max_workers=workers) as pool,
+    ):
+        task = progress.add_task("Processing images...", total=None)
+        in_flight: set[Future] = set()
+
+        def collect(futures: set[Future]):
+            nonlocal processed, failed
+            for future in futures:
+                key, output_key, error = future.result()
+                if error is None:
+                    processed += 1
+                    checkpoint_file.write(f"{commands}{CHECKPOINT_SEPARATOR}{key}\n")
+                    checkpoint_file.flush()
+                else:
+                    failed += 1
+                    progress.console.print(f"[red]Failed {key}: {error}")
+            progress.update(
+                task,
+                description=f"processed={processed} skipped={skipped} failed={failed}",
+            )
+
+        for key in iter_image_keys(source):
+            if key in done:
+                skipped += 1
+                continue
+            if len(in_flight) >= max_in_flight:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+            in_flight.add(pool.submit(process_one, source, destination, key, commands))
+
+        finished, _ = wait(in_flight)
+        collect(finished)
+
+    return processed, skipped, failed
+
+
+def process_images(
+    source: str,
+    destination: str,
+    commands: str,
+    workers: int,
+    checkpoint: Path,
+):
+    """
+    Validate the processing options and run the bulk processing.
+    """
+    if parse_location(source)[0] is None and not Path(source).is_dir():
+        typer.secho(f"Source directory not found: {source}", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+
+    destination_bucket = parse_location(destination)[0]
+    if destination_bucket is not None:
+        from inteliver.storage.service import MinIOService
+
+        if not MinIOService.bucket_exists(destination_bucket):
+            MinIOService.make_bucket(destination_bucket)
+
+    typer.secho(
+        f"Processing {source} -> {destination} with {workers} workers "
+        f"(checkpoint: {checkpoint})",
+        fg=typer.colors.BLUE,
+    )
+    processed, skipped, failed = run_process(
+        source, destination, commands, workers, checkpoint
+    )
+    typer.secho(
+        f"Done. processed={processed} skipped={skipped} failed={failed}",
+        fg=typer.colors.GREEN if failed == 0 else typer.colors.YELLOW,
+    )
+    if failed:
+        raise typer.Exit(code=1)
@@ -13,10 +13,14 @@ from pydantic_settings import (
 )
 from tabulate import tabulate
 
-from inteliver.config.schema import AppEnvEnum
+from inteliver.config.schema import AppEnvEnum, DetectorBackendEnum
 from inteliver.config.utils import get_yaml_config_path
 from inteliver.utils.logger import setup_logging
 
+# model files are looked up in the package, not the working directory (see
+# assets/models/README.md for the expected layout)
+MODELS_DIR = Path(__file__).resolve().parents[1] / "assets" / "models"
+
 
 class InteliverSettings(BaseSettings):
     """
@@ -38,6 +42,21 @@ class InteliverSettings(BaseSettings):
         default=AppEnvEnum.DEVELOPMENT, alias="APP_RUNNING_ENV"
     )
 
+    # server settings
+    # number of pre-forked worker processes of `inteliver run`
+    server_workers: int = Field(default=1)
+    # recycle a worker after this many requests or once its resident
+    # memory exceeds this many MB (0 means never)
+    server_max_requests: int = Field(default=0)
+    server_max_rss_mb: int = Field(default=0)
+    # pin every worker to its share of the cpus
+    server_cpu_affinity: bool = Field(default=False)
+    # seconds a stopping worker gets to finish its requests
+    server_graceful_timeout_seconds: float = Field(default=30.0)
+    # stop the server once a worker crashed right after its spawn this many
+    # times in a row (0 means keep respawning it)
+    server_worker_crash_limit: int = Field(default=5)
+
     # postgresql settings
     postgres_host: str = Field(default="localhost")
     postgres_port: int = Field(default=5432)
@@ -61,6 +80,97 @@ class InteliverSettings(BaseSettings):
     # default jwt token expire time is 1 hour
     email_confirmation_token_expires_minutes: int = Field(60)
 
+    # image processing settings
+    # number of worker threads used for cpu bound image work (0 means cpu count)
+    image_worker_pool_size: int = Field(default=0)
+    # threads of one opencv, blas and torch (or onnxruntime / openvino)
+    # call, every image worker thread makes its own calls (0 means cpus /
+    # image_worker_pool_size)
+    image_opencv_threads: int = Field(default=0)
+    image_blas_threads: int = Field(default=0)
+    image_torch_threads: int = Field(default=0)
+    image_torch_interop_threads: int = Field(default=1)
+    # maximum number of items accepted in one batch request
+    image_batch_max_items: int = Field(default=100)
+    # maximum number of concurrent source fetches for one batch request
+    image_batch_fetch_concurrency: int = Field(default=8)
+    # memory budget of one request for operator intermediates, larger
+    # images are processed band by band with tile-safe operators
+    image_memory_budget_mb: int = Field(default=256)
+    # deep zoom tile size and overlap in pixels
+    image_tile_size: int = Field(default=254)
+    image_tile_overlap: int = Field(default=1)
+    # apply flips, right angle rotations and block aligned crops of jpeg
+    # images with jpegtran (if installed) without re-encoding
+    image_lossless_jpeg: bool = Field(default=True)
+    # apply the EXIF orientation of the source images on decode
+    image_auto_orient: bool = Field(default=True)
+    # drop EXIF, ICC and comment segments from losslessly transformed jpeg
+    # images (re-encoded images never carry metadata)
+    image_strip_metadata: bool = Field(default=True)
+    # add a Server-Timing header with the image request stages to responses
+    image_server_timing: bool = Field(default=False)
+    # abandon image requests after this many seconds (0 means no limit),
+    # clients can ask for a shorter deadline with the X-Request-Timeout
+    # header
+    image_request_timeout_seconds: float = Field(default=0.0)
+    # shed image requests with a 503 when the estimated cost of the queued
+    # and running jobs exceeds image_admission_cost_per_worker per worker,
+    # the cost unit is one decoded or processed megapixel
+    image_admission_enabled: bool = Field(default=True)
+    image_admission_cost_per_worker: float = Field(default=200.0)
+    # weighted fair scheduling of the image worker pool, between the
+    # interactive, batch and precompute lanes and between the cloudnames
+    # of a lane (cloudnames not listed have a weight of 1)
+    image_lane_weights: dict[str, float] = Field(
+        default={"interactive": 8.0, "batch": 2.0, "precompute": 1.0}
+    )
+    image_tenant_weights: dict[str, float] = Field(default={})
+    # maximum number of concurrent image jobs of one cloudname (0 means no
+    # cap), the image_max_concurrency column of a user overrides it
+    image_default_tenant_max_concurrency: int = Field(default=0)
+    image_tenant_max_concurrency: dict[str, int] = Field(default={})
+    # number of i_c_auto crop gravities (per image and aspect ratio) kept
+    # in memory
+    image_saliency_cache_size: int = Field(default=1024)
+
+    # image models are loaded on first use, the models listed here
+    # (dlib_face, yolo) are loaded at startup instead
+    image_model_warmup: list[str] = Field(default=[])
+    # times the face detector upsamples an image before detection, higher
+    # values find smaller faces at a higher cost
+    image_face_upsample: int = Field(default=1)
+    image_yolo_model_path: str = Field(default=str(MODELS_DIR / "yolo" / "yolov8n.pt"))
+    # backend of the object detector: ultralytics (the pytorch model),
+    # onnxruntime or openvino (a model exported with `inteliver models
+    # export`, found at image_detector_model_path)
+    image_detector_backend: DetectorBackendEnum = Field(
+        default=DetectorBackendEnum.ULTRALYTICS
+    )
+    image_detector_model_path: str = Field(
+        default=str(MODELS_DIR / "yolo" / "yolov8n.onnx")
+    )
+    # object detection input size in pixels (models exported with a static
+    # shape keep their size), images are downscaled to it before detection
+    image_detect_imgsz: int = Field(default=640)
+    image_detect_confidence: float = Field(default=0.25)
+    image_detect_iou: float = Field(default=0.7)
+    # detected classes, e.g. ["person", "car"] (empty means all classes)
+    image_detect_classes: list[str] = Field(default=[])
+    # concurrent object detections are run in batches of up to
+    # image_detect_batch_size images (1 disables batching), a batch waits
+    # at most image_detect_batch_window_ms for more images
+    image_detect_batch_size: int = Field(default=8)
+    image_detect_batch_window_ms: float = Field(default=5.0)
+
+    # metrics settings
+    # expose the service metrics on /metrics
+    metrics_enabled: bool = Field(default=True)
+    # directory where the worker processes share their metrics, needed to
+    # report the metrics of all the workers of a multi worker server
+    metrics_multiprocess_dir: str = Field(default="")
+    metrics_dump_interval_seconds: float = Field(default=5.0)
+
     model_config = SettingsConfigDict(
         env_prefix="inteliver_",
         yaml_file=get_yaml_config_path(),
@@ -8,3 +8,11 @@ class AppEnvEnum(str, Enum):
     DEVELOPMENT_DOCKER = "development_docker"
     # STAGING = "staging"
     PRODUCTION = "production"
+
+
+class DetectorBackendEnum(str, Enum):
+    """Enum representing the backends running the object detector."""
+
+    ULTRALYTICS = "ultralytics"
+    ONNXRUNTIME = "onnxruntime"
+    OPENVINO = "openvino"
@@ -1,13 +1,28 @@
+import time
+
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 from inteliver.config import settings
+from inteliver.metrics.collectors import POSTGRES_QUERY_SECONDS
 
 DATABASE_URL = f"postgresql+asyncpg://{settings.postgres_user}:{settings.postgres_password}@{settings.postgres_host}/{settings.postgres_db}"
 
 # TODO: depending on the setting.app_running_env set the logging level (echo) of engine.
 engine = create_async_engine(DATABASE_URL, echo=False)
 
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    POSTGRES_QUERY_SECONDS.observe(time.perf_counter() - context._query_start)
+
+
 SessionLocal = sessionmaker(
     autocommit=False, autoflush=False, bind=engine, class_=AsyncSession
 )
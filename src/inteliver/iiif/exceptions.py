@@ -0,0 +1,17 @@
+from fastapi import HTTPException, status
+
+
+class InvalidIIIFParameterException(HTTPException):
+    def __init__(self, detail: str = "Invalid IIIF image request parameter"):
+        super().__init__(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=detail,
+        )
+
+
+class UnsupportedIIIFParameterException(HTTPException):
+    def __init__(self, detail: str = "Unsupported IIIF image request parameter"):
+        super().__init__(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail=detail,
+        )
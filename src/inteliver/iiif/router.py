@@ -0,0 +1,76 @@
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from inteliver.database.dependencies import get_db
+from inteliver.iiif.schemas import IIIFInfo
+from inteliver.iiif.service import IIIFService
+from inteliver.image.deadline import Deadline, run_until_deadline
+
+router = APIRouter()
+
+
+@router.get(
+    "/{cloudname}/{object_key}/info.json",
+    response_model=IIIFInfo,
+    tags=["IIIF"],
+)
+async def get_image_info(
+    request: Request,
+    cloudname: str,
+    object_key: str,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Get the IIIF image information document of an image.
+
+    Args:
+        cloudname (str): The user's cloud name.
+        object_key (str): The key of the image.
+
+    Returns:
+        IIIFInfo: The image information document.
+    """
+    image_id = str(request.url).removesuffix("/info.json")
+    return await IIIFService.get_info(db, cloudname, object_key, image_id)
+
+
+@router.get(
+    "/{cloudname}/{object_key}/{region}/{size}/{rotation}/{quality}.{fmt}",
+    tags=["IIIF"],
+)
+async def process_image(
+    cloudname: str,
+    object_key: str,
+    region: str,
+    size: str,
+    rotation: str,
+    quality: str,
+    fmt: str,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+) -> StreamingResponse:
+    """
+    Process an image with IIIF image API parameters.
+
+    Args:
+        cloudname (str): The user's cloud name.
+        object_key (str): The key of the image.
+        region (str): full, square, x,y,w,h or pct:x,y,w,h.
+        size (str): max, w,, ,h, pct:n, w,h or !w,h.
+        rotation (str): Clockwise degrees, mirrored first if prefixed by '!'.
+        quality (str): default, color or gray.
+        fmt (str): jpg, png or webp.
+
+    Returns:
+        StreamingResponse: The modified image.
+    """
+    deadline = Deadline.from_request(request)
+    data, media_type = await run_until_deadline(
+        request,
+        IIIFService.process_image(
+            db, cloudname, object_key, region, size, rotation, quality, fmt, deadline
+        ),
+        deadline,
+    )
+    return StreamingResponse(data, media_type=media_type)
@@ -0,0 +1,23 @@
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class IIIFInfo(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    context: str = Field(
+        default="http://iiif.io/api/image/3/context.json", alias="@context"
+    )
+    id: str
+    type: str = "ImageService3"
+    protocol: str = "http://iiif.io/api/image"
+    profile: str = "level2"
+    width: int
+    height: int
+    extraQualities: list[str] = ["gray"]
+    extraFormats: list[str] = ["webp"]
+    extraFeatures: list[str] = [
+        "mirroring",
+        "rotationArbitrary",
+        "rotationBy90s",
+        "sizeUpscaling",
+    ]
@@ -0,0 +1,295 @@
+from io import BytesIO
+
+from PIL import Image
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from inteliver.config import settings
+from inteliver.iiif.exceptions import (
+    InvalidIIIFParameterException,
+    UnsupportedIIIFParameterException,
+)
+from inteliver.iiif.schemas import IIIFInfo
+from inteliver.image.admission import AdmissionController, estimate_cost
+from inteliver.image.deadline import Deadline
+from inteliver.image.orientation import EXIF_ORIENTATION_TAG, oriented_size
+from inteliver.image.scheduler import JobSchedule, Lane
+from inteliver.image.schemas import ImageSource
+from inteliver.image.service import ImageService
+
+# inteliver format operator argument of each IIIF format
+IIIF_FORMATS = {"jpg": "jpg", "png": "png", "webp": "webp"}
+
+
+class IIIFService:
+    """
+    IIIFService class
+
+    Serves the IIIF Image API by translating the region, size, rotation,
+        quality and format parameters into an inteliver command string,
+        so IIIF requests run on the same command pipeline as every other
+        image request.
+    """
+
+    @staticmethod
+    async def process_image(
+        db: AsyncSession,
+        cloudname: str,
+        object_key: str,
+        region: str,
+        size: str,
+        rotation: str,
+        quality: str,
+        fmt: str,
+        deadline: Deadline | None = None,
+    ) -> tuple[BytesIO, str]:
+        """
+        Process an IIIF image request.
+
+        Args:
+            db (AsyncSession): The database session.
+            cloudname (str): The user's cloud name.
+            object_key (str): The key of the image.
+            region (str): The IIIF region parameter.
+            size (str): The IIIF size parameter.
+            rotation (str): The IIIF rotation parameter.
+            quality (str): The IIIF quality parameter.
+            fmt (str): The IIIF format parameter.
+            deadline (Deadline): The request deadline.
+
+        Returns:
+            tuple[BytesIO, str]: The modified image and its media type.
+        """
+        user = await ImageService.check_cloudname(db, cloudname)
+        data, image_format = await ImageService.fetch_image(
+            cloudname, object_key, ImageSource.S3
+        )
+        width, height = IIIFService.probe_size(data)
+        commands = IIIFService.to_commands(
+            width, height, region, size, rotation, quality, fmt
+        )
+        schedule = JobSchedule(
+            cloudname=cloudname,
+            lane=Lane.INTERACTIVE,
+            cost=estimate_cost(data, commands),
+            max_concurrency=user.image_max_concurrency,
+        )
+        encoded, image_format = await AdmissionController.run(
+            schedule,
+            ImageService.render_image,
+            data,
+            commands,
+            image_format,
+            None,
+            deadline,
+        )
+        return BytesIO(encoded), image_format.split(";")[0]
+
+    @staticmethod
+    async def get_info(
+        db: AsyncSession,
+        cloudname: str,
+        object_key: str,
+        image_id: str,
+    ) -> IIIFInfo:
+        """
+        Get the IIIF image information of an image.
+
+        The image size is read from the image header, the pixels are not
+            decoded.
+
+        Args:
+            db (AsyncSession): The database session.
+            cloudname (str): The user's cloud name.
+            object_key (str): The key of the image.
+            image_id (str): The base URI of the image service.
+
+        Returns:
+            IIIFInfo: The image information document.
+        """
+        await ImageService.check_cloudname(db, cloudname)
+        data, _ = await ImageService.fetch_image(cloudname, object_key, ImageSource.S3)
+        width, height = IIIFService.probe_size(data)
+        return IIIFInfo(id=image_id, width=width, height=height)
+
+    @staticmethod
+    def probe_size(data: BytesIO) -> tuple[int, int]:
+        """
+        Read the image width and height from its header, after applying
+            the EXIF orientation like the image decoder does.
+
+        Args:
+            data (BytesIO): The image binary data, rewound after probing.
+
+        Returns:
+            tuple[int, int]: The image width and height.
+        """
+        try:
+            with Image.open(data) as image:
+                width, height = image.size
+                orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+        except Exception as e:
+            raise InvalidIIIFParameterException(
+                detail=f"Can not read the image header: {str(e)}"
+            )
+        data.seek(0)
+        if settings.image_auto_orient:
+            return oriented_size(width, height, orientation)
+        return width, height
+
+    @staticmethod
+    def to_commands(
+        width: int,
+        height: int,
+        region: str,
+        size: str,
+        rotation: str,
+        quality: str,
+        fmt: str,
+    ) -> str:
+        """
+        Translate IIIF image request parameters into an inteliver command.
+
+        The command groups are applied in the IIIF order: region, size,
+            rotation, quality and format.
+
+        Args:
+            width (int): The source image width.
+            height (int): The source image height.
+            region (str): The IIIF region parameter.
+            size (str): The IIIF size parameter.
+            rotation (str): The IIIF rotation parameter.
+            quality (str): The IIIF quality parameter.
+            fmt (str): The IIIF format parameter.
+
+        Returns:
+            str: The inteliver command string.
+        """
+        groups = []
+
+        x, y, region_width, region_height = IIIFService._region(width, height, region)
+        if (region_width, region_height) != (width, height):
+            groups.append(
+                f"i_c_x_{x + region_width // 2},i_c_y_{y + region_height // 2},"
+                f"i_h_{region_height},i_w_{region_width},i_o_crop"
+            )
+
+        size_width, size_height = IIIFService._size(region_width, region_height, size)
+        if (size_width, size_height) != (region_width, region_height):
+            groups.append(f"i_h_{size_height},i_w_{size_width},i_o_resize")
+
+        mirror = rotation.startswith("!")
+        degree = round(IIIFService._floats(rotation.lstrip("!"), 1, "rotation")[0])
+        degree %= 360
+        if mirror:
+            groups.append("i_o_flip_h")
+        if degree % 90:
+            # the canvas of arbitrary rotations holds the whole rotated image
+            groups.append(f"i_o_rotate_{360 - degree}_expand")
+        elif degree:
+            # IIIF rotations are clockwise, inteliver rotations counter-clockwise
+            groups.append(f"i_o_rotate_{360 - degree}")
+
+        if quality == "gray":
+            groups.append("i_o_gray")
+        elif quality not in ("default", "color"):
+            raise UnsupportedIIIFParameterException(
+                detail=f"Unsupported IIIF quality: {quality}"
+            )
+
+        if fmt not in IIIF_FORMATS:
+            raise UnsupportedIIIFParameterException(
+                detail=f"Unsupported IIIF format: {fmt}"
+            )
+        groups.append(f"i_o_format_{IIIF_FORMATS[fmt]}")
+
+        return "/".join(groups)
+
+    @staticmethod
+    def _region(width: int, height: int, region: str) -> tuple[int, int, int, int]:
+        if region == "full":
+            return 0, 0, width, height
+        if region == "square":
+            side = min(width, height)
+            return (width - side) // 2, (height - side) // 2, side, side
+
+        if region.startswith("pct:"):
+            values = IIIFService._floats(region[4:], 4, "region")
+            x, y, w, h = (
+                round(values[0] * width / 100),
+                round(values[1] * height / 100),
+                round(values[2] * width / 100),
+                round(values[3] * height / 100),
+            )
+        else:
+            parts = region.split(",")
+            if len(parts) != 4:
+                raise InvalidIIIFParameterException(
+                    detail=f"Invalid IIIF region: {region}"
+                )
+            x, y, w, h = (IIIFService._int(v, "region") for v in parts)
+
+        # regions extending beyond the image are cropped at the image edges
+        w = min(w, width - x)
+        h = min(h, height - y)
+        if x < 0 or y < 0 or w <= 0 or h <= 0:
+            raise InvalidIIIFParameterException(detail=f"Invalid IIIF region: {region}")
+        return x, y, w, h
+
+    @staticmethod
+    def _size(width: int, height: int, size: str) -> tuple[int, int]:
+        # upscaling ('^') is allowed, so the prefix is not needed
+        size = size.lstrip("^")
+        if size in ("max", "full"):
+            return width, height
+        if size.startswith("pct:"):
+            scale = IIIFService._floats(size[4:], 1, "size")[0] / 100
+            if scale <= 0:
+                raise InvalidIIIFParameterException(detail=f"Invalid IIIF size: {size}")
+            return max(round(width * scale), 1), max(round(height * scale), 1)
+
+        keep_ratio = size.startswith("!")
+        parts = size.lstrip("!").split(",")
+        if len(parts) != 2 or parts == ["", ""]:
+            raise InvalidIIIFParameterException(detail=f"Invalid IIIF size: {size}")
+        if parts[1] == "":
+            w = IIIFService._size_int(parts[0], size)
+            return w, max(round(height * w / width), 1)
+        if parts[0] == "":
+            h = IIIFService._size_int(parts[1], size)
+            return max(round(width * h / height), 1), h
+
+        w = IIIFService._size_int(parts[0], size)
+        h = IIIFService._size_int(parts[1], size)
+        if keep_ratio:
+            scale = min(w / width, h / height)
+            return max(round(width * scale), 1), max(round(height * scale), 1)
+        return w, h
+
+    @staticmethod
+    def _size_int(value: str, size: str) -> int:
+        # a size of zero or less pixels can not be rendered
+        pixels = IIIFService._int(value, "size")
+        if pixels <= 0:
+            raise InvalidIIIFParameterException(detail=f"Invalid IIIF size: {size}")
+        return pixels
+
+    @staticmethod
+    def _int(value: str, parameter: str) -> int:
+        try:
+            return int(value)
+        except (ValueError, TypeError):
+            raise InvalidIIIFParameterException(
+                detail=f"Invalid IIIF {parameter}: {value}"
+            )
+
+    @staticmethod
+    def _floats(value: str, count: int, parameter: str) -> list[float]:
+        try:
+            values = [float(v) for v in value.split(",")]
+        except (ValueError, TypeError):
+            values = []
+        if len(values) != count:
+            raise InvalidIIIFParameterException(
+                detail=f"Invalid IIIF {parameter}: {value}"
+            )
+        return values
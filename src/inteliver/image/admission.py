@@ -0,0 +1,206 @@
+"""
+Admission control
+
+Image requests are admitted to the worker pool by their estimated cost.
+    The pool keeps a bounded amount of queued work per worker, requests
+    over the bound are shed right away with a 503 and a Retry-After
+    estimate instead of queueing until the clients time out.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from io import BytesIO
+from typing import Any, Callable
+
+from PIL import Image
+
+from inteliver.config import settings
+from inteliver.image.exceptions import ServiceOverloadedException
+from inteliver.image.executor import ImageExecutor
+from inteliver.image.scheduler import JobSchedule
+from inteliver.metrics.collectors import IMAGE_ADMISSION_REJECTED, IMAGE_QUEUED_COST
+
+# relative cost per megapixel of the operators, decode and encode count as 1
+OPERATOR_COSTS = {
+    "blur": 2.0,
+    "sharpen": 2.0,
+    "pixelate": 1.0,
+    "rotate": 1.5,
+    "resize": 1.0,
+    "text": 0.5,
+    "detect": 20.0,
+}
+# relative cost per megapixel of the detector based selectors and masks
+SELECTOR_COSTS = {
+    "face": 10.0,
+    "object": 20.0,
+    "skin": 1.0,
+    "auto": 0.5,
+}
+DEFAULT_OPERATOR_COST = 0.5
+# compression ratio assumed for sources whose header can not be read
+FALLBACK_BYTES_PER_PIXEL = 0.3
+# initial estimate of the seconds a worker needs for one cost unit
+INITIAL_SECONDS_PER_COST = 0.01
+# weight of the last job in the seconds per cost estimate
+SECONDS_PER_COST_SMOOTHING = 0.1
+MAX_RETRY_AFTER_SECONDS = 30
+
+
+def estimate_cost(data: BytesIO, commands: str) -> float:
+    """
+    Estimate the cost of an image request from its commands and the source
+        dimensions.
+
+    The cost is the source megapixels times the summed relative cost of
+        decoding, encoding and every operator and detector of the commands.
+
+    Args:
+        data (BytesIO): The source image binary data.
+        commands (str): The commands to apply.
+
+    Returns:
+        float: The estimated cost.
+    """
+    try:
+        # only the header is read
+        with Image.open(BytesIO(data.getbuffer())) as image:
+            width, height = image.size
+        pixels = width * height
+    except Exception:
+        pixels = data.getbuffer().nbytes / FALLBACK_BYTES_PER_PIXEL
+
+    weight = 1.0
+    for command in commands.replace("/", ",").split(","):
+        name = command[4:].split("_")[0]
+        if command.startswith("i_o_"):
+            weight += OPERATOR_COSTS.get(name, DEFAULT_OPERATOR_COST)
+        elif command.startswith(("i_c_", "i_m_")):
+            weight += SELECTOR_COSTS.get(name, 0.0)
+    return max(pixels / 1e6, 0.01) * weight
+
+
+class AdmissionController:
+    """
+    AdmissionController class
+
+    Admits image jobs to the ImageExecutor pool while the cost of the
+        queued and running jobs stays under
+        image_admission_cost_per_worker times the pool size. A job is
+        always admitted to an idle pool, so a single large image is never
+        rejected.
+
+    The cost is released when the job is done or cancelled on the pool, not
+        when its caller gives up, so the bound tracks the actual cpu work.
+
+    Attributes:
+        _pending_cost (float): The cost of the admitted jobs.
+        _pending_jobs (int): The number of admitted jobs.
+        _seconds_per_cost (float): Running estimate of the worker seconds
+            per cost unit, used for the Retry-After estimate.
+    """
+
+    _lock = threading.Lock()
+    _pending_cost: float = 0.0
+    _pending_jobs: int = 0
+    _seconds_per_cost: float = INITIAL_SECONDS_PER_COST
+
+    @classmethod
+    def capacity(cls) -> float:
+        """
+        The maximum pending cost of the pool.
+        """
+        return settings.image_admission_cost_per_worker * ImageExecutor.pool_size()
+
+    @classmethod
+    def pending_cost(cls) -> float:
+        return cls._pending_cost
+
+    @classmethod
+    def retry_after(cls) -> int:
+        """
+        Estimate the seconds until the pending jobs are done.
+        """
+        seconds = cls._pending_cost * cls._seconds_per_cost / ImageExecutor.pool_size()
+        return min(max(math.ceil(seconds), 1), MAX_RETRY_AFTER_SECONDS)
+
+    @classmethod
+    def admit(cls, cost: float):
+        """
+        Admit a job or shed it.
+
+        Args:
+            cost (float): The estimated cost of the job.
+
+        Raises:
+            ServiceOverloadedException: If the pool is saturated.
+        """
+        with cls._lock:
+            if cls._pending_jobs and cls._pending_cost + cost > cls.capacity():
+                IMAGE_ADMISSION_REJECTED.inc()
+                raise ServiceOverloadedException(retry_after=cls.retry_after())
+            cls._pending_cost += cost
+            cls._pending_jobs += 1
+
+    @classmethod
+    def release(cls, cost: float):
+        with cls._lock:
+            cls._pending_cost = max(cls._pending_cost - cost, 0.0)
+            cls._pending_jobs -= 1
+
+    @classmethod
+    def observe(cls, cost: float, seconds: float):
+        """
+        Update the seconds per cost estimate with a finished job.
+        """
+        if cost <= 0:
+            return
+        with cls._lock:
+            cls._seconds_per_cost += SECONDS_PER_COST_SMOOTHING * (
+                seconds / cost - cls._seconds_per_cost
+            )
+
+    @classmethod
+    async def run(cls, schedule: JobSchedule, func: Callable[..., Any], *args) -> Any:
+        """
+        Admit a job and run it on the ImageExecutor pool.
+
+        Cancelling the caller cancels the job if it is still queued.
+
+        Args:
+            schedule (JobSchedule): The tenant, lane and estimated cost of
+                the job.
+            func (Callable): The blocking function to run.
+            *args: Positional arguments passed to the function.
+
+        Returns:
+            Any: The return value of the function.
+
+        Raises:
+            ServiceOverloadedException: If the pool is saturated.
+        """
+        if not settings.image_admission_enabled:
+            return await ImageExecutor.run(func, *args, schedule=schedule)
+
+        cost = schedule.cost
+        cls.admit(cost)
+
+        def job():
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                cls.observe(cost, time.perf_counter() - start)
+
+        try:
+            future = ImageExecutor.submit(job, schedule=schedule)
+        except Exception:
+            cls.release(cost)
+            raise
+        future.add_done_callback(lambda _: cls.release(cost))
+        return await asyncio.wrap_future(future)
+
+
+IMAGE_QUEUED_COST.set_function(AdmissionController.pending_cost)
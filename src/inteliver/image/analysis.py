@@ -0,0 +1,293 @@
+"""
+Image analysis
+
+Faces and objects of an image as JSON, for clients which only need the
+    boxes. The image is decoded at a reduced size close to the detection
+    input size and never encoded. The analysis of a stored asset is kept
+    next to it as '{object_key}_files/analysis/{signature}.json', where
+    the signature covers the detection settings, so later requests are
+    served from the storage.
+"""
+
+import hashlib
+import json
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from inteliver.config import settings
+from inteliver.config.schema import DetectorBackendEnum
+from inteliver.image.admission import AdmissionController, estimate_cost
+from inteliver.image.deadline import Deadline
+from inteliver.image.exceptions import (
+    ImageDecodeException,
+    UnsupportedAnalysisFeatureException,
+)
+from inteliver.image.executor import ImageExecutor
+from inteliver.image.model_registry import FACE_DETECTOR, OBJECT_DETECTOR, ModelRegistry
+from inteliver.image.orientation import apply_orientation, read_orientation
+from inteliver.image.scheduler import JobSchedule, Lane
+from inteliver.image.schemas import (
+    AnalysisBox,
+    AnalysisObject,
+    ImageAnalysisOut,
+    ImageSource,
+)
+from inteliver.image.service import ImageService
+from inteliver.metrics.collectors import (
+    CACHE_REQUESTS,
+    IMAGE_DECODED_PIXELS,
+    MODEL_INFERENCE_SECONDS,
+)
+from inteliver.storage.exceptions import S3ErrorObjectNotFoundException
+from inteliver.storage.service import StorageService
+
+ANALYSIS_MIME_TYPE = "application/json"
+# the analysis features and the command of the same cost
+ANALYSIS_FEATURES = {"faces": "i_c_face", "objects": "i_o_detect"}
+# decode reductions of opencv, jpeg images are decoded at the reduced size
+REDUCED_DECODE_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+# EXIF orientations which swap the width and the height
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+class AnalysisService:
+    @staticmethod
+    def parse_features(features: str) -> list[str]:
+        """
+        Parse a comma separated list of analysis features.
+
+        Raises:
+            UnsupportedAnalysisFeatureException: If a feature is unknown.
+        """
+        names = [name.strip() for name in features.split(",") if name.strip()]
+        unknown = [name for name in names if name not in ANALYSIS_FEATURES]
+        if unknown or not names:
+            raise UnsupportedAnalysisFeatureException(
+                detail=f"Unsupported analysis features {unknown}, "
+                f"supported features are {list(ANALYSIS_FEATURES)}"
+            )
+        return names
+
+    @staticmethod
+    def analysis_key(object_key: str) -> str:
+        """
+        The storage key of the analysis of an asset with the current
+            detection settings.
+        """
+        signature = json.dumps(
+            [
+                DetectorBackendEnum(settings.image_detector_backend).value,
+                settings.image_yolo_model_path,
+                settings.image_detector_model_path,
+                settings.image_detect_imgsz,
+                settings.image_detect_confidence,
+                settings.image_detect_iou,
+                sorted(settings.image_detect_classes),
+                settings.image_face_upsample,
+                settings.image_auto_orient,
+            ]
+        )
+        digest = hashlib.sha1(signature.encode()).hexdigest()[:16]
+        return f"{StorageService.derived_prefix(object_key)}analysis/{digest}.json"
+
+    @staticmethod
+    async def analyze_image(
+        db: AsyncSession,
+        cloudname: str,
+        uri: str,
+        image_source: ImageSource,
+        features: list[str],
+        lane: Lane = Lane.INTERACTIVE,
+        deadline: Deadline | None = None,
+    ) -> ImageAnalysisOut:
+        """
+        Analyze an image, reusing the stored analysis of an asset.
+
+        Args:
+            db (AsyncSession): The database session.
+            cloudname (str): The user's cloud name.
+            uri (str): The url or object key of the image.
+            image_source (ImageSource): Where the image is stored.
+            features (list[str]): The analysis features.
+            lane (Lane): The scheduling lane of the analysis.
+            deadline (Deadline): The request deadline.
+
+        Returns:
+            ImageAnalysisOut: The requested features of the image.
+        """
+        deadline = deadline or Deadline()
+        user = await ImageService.check_cloudname(db, cloudname)
+
+        # only stored assets have a stable key to keep the analysis at
+        cached = None
+        if image_source == ImageSource.S3:
+            cached = await AnalysisService._load(cloudname, uri)
+        missing = [
+            name for name in features if cached is None or getattr(cached, name) is None
+        ]
+        if image_source == ImageSource.S3:
+            CACHE_REQUESTS.inc(cache="analysis", result="miss" if missing else "hit")
+        if cached is not None and not missing:
+            return AnalysisService._select(cached, features)
+
+        data, _ = await ImageService.fetch_image(cloudname, uri, image_source)
+        deadline.check()
+        schedule = JobSchedule(
+            cloudname=cloudname,
+            lane=lane,
+            cost=estimate_cost(
+                data, ",".join(ANALYSIS_FEATURES[name] for name in missing)
+            ),
+            max_concurrency=user.image_max_concurrency,
+        )
+        if lane == Lane.INTERACTIVE:
+            analysis = await AdmissionController.run(
+                schedule, AnalysisService.analyze, data, missing, deadline
+            )
+        else:
+            analysis = await ImageExecutor.run(
+                AnalysisService.analyze, data, missing, deadline, schedule=schedule
+            )
+
+        if cached is not None:
+            for name in ANALYSIS_FEATURES:
+                if getattr(analysis, name) is None:
+                    setattr(analysis, name, getattr(cached, name))
+        if image_source == ImageSource.S3:
+            await StorageService.store_image_by_cloudname(
+                cloudname,
+                analysis.model_dump_json(exclude_none=True).encode(),
+                ANALYSIS_MIME_TYPE,
+                object_key=AnalysisService.analysis_key(uri),
+            )
+        return AnalysisService._select(analysis, features)
+
+    @staticmethod
+    def analyze(
+        data: BytesIO, features: list[str], deadline: Deadline | None = None
+    ) -> ImageAnalysisOut:
+        """
+        Decode an image at a reduced size and run the detectors of the
+            features. This is cpu bound and runs on the worker pool.
+
+        Args:
+            data (BytesIO): The image binary data.
+            features (list[str]): The analysis features.
+            deadline (Deadline): The request deadline, checked before each
+                detector.
+
+        Returns:
+            ImageAnalysisOut: The features, boxes in source image pixels.
+        """
+        deadline = deadline or Deadline()
+        deadline.check()
+        image, width, height = AnalysisService.decode(data)
+        scale = width / image.shape[1]
+
+        analysis = ImageAnalysisOut(width=width, height=height)
+        if "faces" in features:
+            deadline.check()
+            analysis.faces = AnalysisService.detect_faces(image, scale)
+        if "objects" in features:
+            deadline.check()
+            analysis.objects = AnalysisService.detect_objects(image, scale)
+        return analysis
+
+    @staticmethod
+    def decode(data: BytesIO) -> tuple[np.ndarray, int, int]:
+        """
+        Decode an image at the largest reduction which keeps its long side
+            at least the detection input size.
+
+        Returns:
+            tuple[np.ndarray, int, int]: The reduced BGR image and the
+                width and height of the full size image as displayed.
+        """
+        raw = data.getvalue()
+        try:
+            # only the header is read
+            with Image.open(BytesIO(raw)) as header:
+                width, height = header.size
+        except Exception:
+            width = height = 0
+
+        flags = cv2.IMREAD_COLOR
+        for factor, reduced in REDUCED_DECODE_FLAGS.items():
+            if max(width, height) // factor >= settings.image_detect_imgsz:
+                flags = reduced
+                break
+        image = cv2.imdecode(
+            np.frombuffer(raw, np.uint8), flags | cv2.IMREAD_IGNORE_ORIENTATION
+        )
+        if image is None:
+            raise ImageDecodeException
+        IMAGE_DECODED_PIXELS.inc(image.shape[0] * image.shape[1])
+
+        orientation = read_orientation(raw) if settings.image_auto_orient else 1
+        image = apply_orientation(image, orientation)
+        if not width:
+            return image, image.shape[1], image.shape[0]
+        if orientation in TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+        return image, width, height
+
+    @staticmethod
+    def detect_faces(image: np.ndarray, scale: float) -> list[AnalysisBox]:
+        detector = ModelRegistry.get(FACE_DETECTOR)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        with MODEL_INFERENCE_SECONDS.time(model=FACE_DETECTOR):
+            rectangles, scores, _ = detector.run(gray, settings.image_face_upsample)
+        return [
+            AnalysisBox(
+                x1=round(max(rectangle.left(), 0) * scale),
+                y1=round(max(rectangle.top(), 0) * scale),
+                x2=round(min(rectangle.right(), gray.shape[1]) * scale),
+                y2=round(min(rectangle.bottom(), gray.shape[0]) * scale),
+                confidence=round(score, 4),
+            )
+            for rectangle, score in zip(rectangles, scores)
+        ]
+
+    @staticmethod
+    def detect_objects(image: np.ndarray, scale: float) -> list[AnalysisObject]:
+        detector = ModelRegistry.get(OBJECT_DETECTOR)
+        with MODEL_INFERENCE_SECONDS.time(model=OBJECT_DETECTOR):
+            object_map = detector.detect_objects_map(image)
+        return [
+            AnalysisObject(
+                label=label,
+                x1=round(box["x1"] * scale),
+                y1=round(box["y1"] * scale),
+                x2=round(box["x2"] * scale),
+                y2=round(box["y2"] * scale),
+                confidence=round(box["confidence"], 4),
+            )
+            for label, boxes in object_map.items()
+            for box in boxes
+        ]
+
+    @staticmethod
+    async def _load(cloudname: str, object_key: str) -> ImageAnalysisOut | None:
+        try:
+            data, _ = await StorageService.retrieve_image_by_cloudname(
+                cloudname, AnalysisService.analysis_key(object_key)
+            )
+        except S3ErrorObjectNotFoundException:
+            return None
+        return ImageAnalysisOut.model_validate_json(data.read())
+
+    @staticmethod
+    def _select(analysis: ImageAnalysisOut, features: list[str]) -> ImageAnalysisOut:
+        return ImageAnalysisOut(
+            width=analysis.width,
+            height=analysis.height,
+            **{name: getattr(analysis, name) for name in features},
+        )
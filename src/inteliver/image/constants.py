@@ -0,0 +1,7 @@
+# encoder format of each tile file extension
+TILE_FORMATS = {
+    "jpg": "image/jpeg;q=0.9",
+    "jpeg": "image/jpeg;q=0.9",
+    "png": "image/png;q=0.3",
+    "webp": "image/webp;q=0.8",
+}
@@ -0,0 +1,150 @@
+"""
+Request deadlines
+
+A deadline is created per image request and carried from the router to
+    the worker thread doing the image work. The work checks it between
+    the stages (fetch, decode, each command and encode) and is abandoned
+    once the deadline passes or the client disconnects, so the workers
+    only spend cpu on requests which can still be served.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Any, Coroutine
+
+from fastapi import Request
+
+from inteliver.config import settings
+from inteliver.image.exceptions import (
+    ClientDisconnectedException,
+    DeadlineExceededException,
+)
+
+# request header with the seconds the client is willing to wait
+DEADLINE_HEADER = "x-request-timeout"
+
+
+class Deadline:
+    """
+    Deadline class
+
+    The point in time after which the result of a request is useless. A
+        deadline is shared between the event loop and a worker thread, it
+        can also be cancelled when the client goes away.
+
+    Attributes:
+        expires_at (float | None): The perf_counter time of the deadline,
+            None if the request has no deadline.
+    """
+
+    def __init__(self, seconds: float | None = None):
+        self.expires_at = None if seconds is None else time.perf_counter() + seconds
+        self._cancelled = threading.Event()
+
+    @staticmethod
+    def from_request(request: Request) -> "Deadline":
+        """
+        Create the deadline of a request, the shortest of the request
+            timeout header and the image_request_timeout_seconds setting.
+
+        Args:
+            request (Request): The request.
+
+        Returns:
+            Deadline: The deadline, without expiry if neither is set.
+        """
+        timeouts = []
+        if settings.image_request_timeout_seconds > 0:
+            timeouts.append(settings.image_request_timeout_seconds)
+        try:
+            header = float(request.headers.get(DEADLINE_HEADER, ""))
+            if header > 0:
+                timeouts.append(header)
+        except ValueError:
+            pass
+        return Deadline(min(timeouts) if timeouts else None)
+
+    def remaining(self) -> float | None:
+        """
+        Seconds left before the deadline, None if there is no deadline.
+        """
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.perf_counter(), 0.0)
+
+    def cancel(self):
+        """
+        Abandon the work of the request, e.g. when the client disconnected.
+        """
+        self._cancelled.set()
+
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.perf_counter() >= self.expires_at
+
+    def check(self):
+        """
+        Stop the request work if it is cancelled or past its deadline.
+
+        Raises:
+            ClientDisconnectedException: If the request was cancelled.
+            DeadlineExceededException: If the deadline passed.
+        """
+        if self._cancelled.is_set():
+            raise ClientDisconnectedException
+        if self.expired():
+            raise DeadlineExceededException
+
+
+async def run_until_deadline(
+    request: Request, coroutine: Coroutine, deadline: Deadline
+) -> Any:
+    """
+    Await a request handler coroutine, cancelling it if the client
+        disconnects or the deadline passes first.
+
+    The deadline is cancelled too, so the work already handed to a worker
+        thread stops at its next check.
+
+    Args:
+        request (Request): The request, its body must not be read later.
+        coroutine (Coroutine): The handler work.
+        deadline (Deadline): The request deadline.
+
+    Returns:
+        Any: The result of the coroutine.
+
+    Raises:
+        ClientDisconnectedException: If the client disconnected.
+        DeadlineExceededException: If the deadline passed.
+    """
+
+    async def wait_disconnect():
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+
+    work = asyncio.ensure_future(coroutine)
+    disconnect = asyncio.ensure_future(wait_disconnect())
+    done = set()
+    try:
+        done, _ = await asyncio.wait(
+            {work, disconnect},
+            timeout=deadline.remaining(),
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+    finally:
+        disconnect.cancel()
+        if work not in done:
+            deadline.cancel()
+            work.cancel()
+    if work in done:
+        return work.result()
+
+    # let the handler work unwind before answering
+    await asyncio.wait({work})
+    if disconnect in done:
+        raise ClientDisconnectedException
+    raise DeadlineExceededException
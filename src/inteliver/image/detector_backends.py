@@ -0,0 +1,370 @@
+"""
+Object detector backends
+
+The YOLO detector runs on one of these backends, selected with the
+    image_detector_backend setting:
+        ultralytics: the PyTorch model through ultralytics.
+        onnxruntime: an exported ONNX model on ONNX Runtime.
+        openvino: an exported OpenVINO model.
+
+The exported backends need neither torch nor ultralytics at runtime, the
+    models are exported with `inteliver models export`.
+"""
+
+import ast
+import math
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+from loguru import logger
+
+from inteliver.config import settings
+from inteliver.image.threads import ThreadBudget
+
+# (x1, y1, x2, y2, label, confidence) in the pixels of the source image
+Detection = tuple[float, float, float, float, str, float]
+
+# YOLO input sizes are multiples of the largest model stride
+MODEL_STRIDE = 32
+LETTERBOX_PAD = 114
+
+
+def allowed_class_ids(
+    names: dict[int, str], classes: set[str] | None
+) -> list[int] | None:
+    """
+    The class ids to detect, the image_detect_classes setting intersected
+        with the classes requested for an image.
+
+    Args:
+        names (dict[int, str]): The class names of the model by class id.
+        classes (set[str] | None): The requested classes, None for all.
+
+    Returns:
+        list[int] | None: The class ids, None for all the classes.
+    """
+    wanted = set(settings.image_detect_classes) or None
+    if classes is not None:
+        wanted = classes if wanted is None else wanted & classes
+    if wanted is None:
+        return None
+    return [class_id for class_id, name in names.items() if name in wanted]
+
+
+class DetectorBackend:
+    """
+    DetectorBackend class
+
+    Runs a batch of RGB images through an object detection model.
+
+    Attributes:
+        fixed_imgsz (int | None): The input size of a model exported with
+            a static input shape.
+        fixed_batch (int | None): The batch size of a model exported with
+            a static batch axis.
+    """
+
+    fixed_imgsz: int | None = None
+    fixed_batch: int | None = None
+
+    def __init__(self, model_path: str):
+        """
+        Load the model.
+
+        Args:
+            model_path (str): The file path to the model.
+        """
+        raise NotImplementedError
+
+    def input_size(self) -> int:
+        """
+        The model input size, the image_detect_imgsz setting unless the
+            model has a static input shape.
+        """
+        if self.fixed_imgsz:
+            return self.fixed_imgsz
+        return math.ceil(settings.image_detect_imgsz / MODEL_STRIDE) * MODEL_STRIDE
+
+    def predict(
+        self, images: list[np.ndarray], classes: list[set[str] | None]
+    ) -> list[list[Detection]]:
+        """
+        Detect the objects of a batch of images.
+
+        Args:
+            images (list[np.ndarray]): The RGB images.
+            classes (list[set[str] | None]): The classes to detect in each
+                image, None for all.
+
+        Returns:
+            list[list[Detection]]: The detections of each image.
+        """
+        raise NotImplementedError
+
+
+class UltralyticsBackend(DetectorBackend):
+    """
+    UltralyticsBackend class
+
+    The PyTorch model through ultralytics. The model letterboxes images of
+        different sizes to a common size and scales the boxes back to each
+        image.
+    """
+
+    def __init__(self, model_path: str):
+        # ultralytics (and torch) are only imported when the model is used
+        from ultralytics import YOLO
+
+        self.model = YOLO(model_path)
+
+    def predict(
+        self, images: list[np.ndarray], classes: list[set[str] | None]
+    ) -> list[list[Detection]]:
+        class_ids = [allowed_class_ids(self.model.names, wanted) for wanted in classes]
+        # one class filter for the whole batch, refined per image below
+        batch_ids = None
+        if all(ids is not None for ids in class_ids):
+            batch_ids = sorted({i for ids in class_ids if ids is not None for i in ids})
+            if not batch_ids:
+                return [[] for _ in images]
+
+        results = self.model(
+            images,
+            imgsz=self.input_size(),
+            conf=settings.image_detect_confidence,
+            iou=settings.image_detect_iou,
+            classes=batch_ids,
+            verbose=False,
+        )
+        detections = []
+        for result, ids in zip(results, class_ids):
+            boxes = result.boxes.xyxy.cpu().numpy()  # Bounding boxes
+            labels = result.boxes.cls.cpu().numpy().astype(int)  # Class labels
+            confidences = result.boxes.conf.cpu().numpy()  # Confidences
+            detections.append(
+                [
+                    (*box, result.names[label], confidence)
+                    for box, label, confidence in zip(boxes, labels, confidences)
+                    if ids is None or label in ids
+                ]
+            )
+        return detections
+
+
+class ExportedBackend(DetectorBackend):
+    """
+    ExportedBackend class
+
+    Base of the backends running an exported YOLOv8 graph. The images are
+        letterboxed to the model input size and stacked into one batch,
+        the raw (batch, 4 + classes, anchors) output is decoded with a
+        per class non maximum suppression and the boxes are scaled back
+        to each image. The classes which are not detected are dropped
+        from the scores before the suppression. A model with a static
+        batch axis runs the batch in chunks of its batch size.
+
+    Attributes:
+        names (dict[int, str]): The class names by class index.
+    """
+
+    names: dict[int, str]
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def predict(
+        self, images: list[np.ndarray], classes: list[set[str] | None]
+    ) -> list[list[Detection]]:
+        imgsz = self.input_size()
+        letterboxed, transforms = zip(
+            *(self._letterbox(image, imgsz) for image in images)
+        )
+        batch = np.stack(letterboxed).transpose(0, 3, 1, 2)
+        batch = np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+        output = self._run_batches(batch)
+        return [
+            self._decode(
+                prediction,
+                transform,
+                image.shape,
+                allowed_class_ids(self.names, wanted),
+            )
+            for prediction, transform, image, wanted in zip(
+                output, transforms, images, classes
+            )
+        ]
+
+    def _run_batches(self, batch: np.ndarray) -> np.ndarray:
+        size = self.fixed_batch
+        if not size or len(batch) == size:
+            return self._run(batch)
+        outputs = []
+        for start in range(0, len(batch), size):
+            chunk = batch[start : start + size]
+            count = len(chunk)
+            # the last chunk is padded with blank images up to the batch size
+            if count < size:
+                padding = np.zeros((size - count, *chunk.shape[1:]), chunk.dtype)
+                chunk = np.concatenate((chunk, padding))
+            outputs.append(self._run(chunk)[:count])
+        return np.concatenate(outputs)
+
+    @staticmethod
+    def _letterbox(
+        image: np.ndarray, imgsz: int
+    ) -> tuple[np.ndarray, tuple[float, int, int]]:
+        height, width = image.shape[:2]
+        scale = min(imgsz / height, imgsz / width)
+        resized_width, resized_height = round(width * scale), round(height * scale)
+        pad_x = (imgsz - resized_width) // 2
+        pad_y = (imgsz - resized_height) // 2
+        letterboxed = np.full((imgsz, imgsz, 3), LETTERBOX_PAD, dtype=np.uint8)
+        letterboxed[pad_y : pad_y + resized_height, pad_x : pad_x + resized_width] = (
+            cv2.resize(
+                image[:, :, :3],
+                (resized_width, resized_height),
+                interpolation=cv2.INTER_LINEAR,
+            )
+        )
+        return letterboxed, (scale, pad_x, pad_y)
+
+    def _decode(
+        self,
+        prediction: np.ndarray,
+        transform: tuple[float, int, int],
+        shape: tuple[int, ...],
+        allowed: list[int] | None,
+    ) -> list[Detection]:
+        prediction = prediction.T  # (anchors, 4 + classes)
+        scores = prediction[:, 4:]
+        if allowed is not None:
+            if not allowed:
+                return []
+            scores = scores[:, allowed]
+        best = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), best]
+        class_ids = best if allowed is None else np.asarray(allowed)[best]
+        keep = confidences > settings.image_detect_confidence
+        if not keep.any():
+            return []
+        centers, class_ids, confidences = (
+            prediction[keep, :4],
+            class_ids[keep],
+            confidences[keep],
+        )
+
+        # center x, center y, width, height to left, top, width, height
+        boxes = centers.copy()
+        boxes[:, :2] -= boxes[:, 2:] / 2
+        indices = cv2.dnn.NMSBoxesBatched(
+            boxes.tolist(),
+            confidences.tolist(),
+            class_ids.tolist(),
+            settings.image_detect_confidence,
+            settings.image_detect_iou,
+        )
+
+        scale, pad_x, pad_y = transform
+        height, width = shape[:2]
+        detections = []
+        for index in np.asarray(indices).reshape(-1):
+            left, top, box_width, box_height = boxes[index]
+            x1 = np.clip((left - pad_x) / scale, 0, width)
+            y1 = np.clip((top - pad_y) / scale, 0, height)
+            x2 = np.clip((left + box_width - pad_x) / scale, 0, width)
+            y2 = np.clip((top + box_height - pad_y) / scale, 0, height)
+            label = self.names.get(int(class_ids[index]), str(class_ids[index]))
+            detections.append((x1, y1, x2, y2, label, float(confidences[index])))
+        return detections
+
+
+class OnnxRuntimeBackend(ExportedBackend):
+    """
+    OnnxRuntimeBackend class
+
+    An exported ONNX model (optionally int8 quantized) on ONNX Runtime with
+        all the graph optimizations enabled.
+    """
+
+    def __init__(self, model_path: str):
+        import onnxruntime
+
+        if not Path(model_path).is_file():
+            raise FileNotFoundError(f"No exported ONNX model at {model_path}")
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        options.intra_op_num_threads = ThreadBudget.library_threads(
+            settings.image_torch_threads
+        )
+        options.inter_op_num_threads = settings.image_torch_interop_threads
+        self.session = onnxruntime.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # dynamic axes are named instead of sized
+        if isinstance(model_input.shape[-1], int):
+            self.fixed_imgsz = model_input.shape[-1]
+        if isinstance(model_input.shape[0], int):
+            self.fixed_batch = model_input.shape[0]
+        # the ultralytics export stores the class names
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"])
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OpenVINOBackend(ExportedBackend):
+    """
+    OpenVINOBackend class
+
+    An exported OpenVINO model directory, as written by the ultralytics
+        openvino export. A static batch axis is made dynamic before the
+        model is compiled, when the graph allows it.
+    """
+
+    def __init__(self, model_path: str):
+        import openvino
+
+        model_dir = Path(model_path)
+        if not (model_dir / "metadata.yaml").is_file():
+            raise FileNotFoundError(f"No exported OpenVINO model at {model_path}")
+        core = openvino.Core()
+        model = core.read_model(next(model_dir.glob("*.xml")))
+        shape = model.input(0).get_partial_shape()
+        if shape[0].is_static:
+            batch_size = shape[0].get_length()
+            shape[0] = openvino.Dimension()
+            try:
+                model.reshape(shape)
+            except RuntimeError as e:
+                logger.warning(f"Keeping the static batch of {model_path}: {e}")
+                self.fixed_batch = batch_size
+        self.compiled = core.compile_model(
+            model,
+            "CPU",
+            {
+                "INFERENCE_NUM_THREADS": ThreadBudget.library_threads(
+                    settings.image_torch_threads
+                )
+            },
+        )
+        metadata = yaml.safe_load((model_dir / "metadata.yaml").read_text())
+        self.names = {int(index): name for index, name in metadata["names"].items()}
+        if not metadata.get("dynamic"):
+            self.fixed_imgsz = int(metadata["imgsz"][0])
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        return self.compiled(batch)[0]
+
+
+BACKENDS: dict[str, type[DetectorBackend]] = {
+    "ultralytics": UltralyticsBackend,
+    "onnxruntime": OnnxRuntimeBackend,
+    "openvino": OpenVINOBackend,
+}
@@ -57,3 +57,70 @@ class FetchImageURLException(HTTPException):
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=detail,
         )
+
+
+class BatchSizeExceededException(HTTPException):
+    def __init__(self, detail: str = "Too many items in the batch request"):
+        super().__init__(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=detail,
+        )
+
+
+class TileNotFoundException(HTTPException):
+    def __init__(self, detail: str = "The requested tile does not exists"):
+        super().__init__(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=detail,
+        )
+
+
+class UnsupportedTileFormatException(HTTPException):
+    def __init__(self, detail: str = "Unsupported tile format"):
+        super().__init__(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=detail,
+        )
+
+
+class UnsupportedAnalysisFeatureException(HTTPException):
+    def __init__(self, detail: str = "Unsupported image analysis feature"):
+        super().__init__(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=detail,
+        )
+
+
+class ServiceOverloadedException(HTTPException):
+    def __init__(
+        self,
+        detail: str = "The service is overloaded, retry later",
+        retry_after: int = 1,
+    ):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class ClientDisconnectedException(HTTPException):
+    def __init__(self, detail: str = "The client closed the request"):
+        # non standard 'client closed request' status, it is only logged
+        super().__init__(status_code=499, detail=detail)
+
+
+class DeadlineExceededException(HTTPException):
+    def __init__(self, detail: str = "The request deadline passed"):
+        super().__init__(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=detail,
+        )
+
+
+class ModelUnavailableException(HTTPException):
+    def __init__(self, detail: str = "The requested model is not available"):
+        super().__init__(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail=detail,
+        )
@@ -0,0 +1,134 @@
+"""
+    ImageExecutor class
+
+    This module owns the worker pool that runs cpu bound image work
+        (decode, processing and encode) off the event loop, scheduled
+        fairly between the cloudnames and priority lanes.
+"""
+
+import asyncio
+from concurrent.futures import Future
+from functools import partial
+from typing import Any, Callable
+
+from inteliver.image.scheduler import FairScheduler, JobSchedule
+from inteliver.image.threads import ThreadBudget
+from inteliver.metrics.collectors import IMAGE_JOBS_IN_FLIGHT, IMAGE_POOL_QUEUE_DEPTH
+
+
+class ImageExecutor:
+    """
+    ImageExecutor class
+
+    A process wide thread pool for cpu bound image work. OpenCV, numpy
+        and dlib release the GIL in their heavy loops, so a thread pool
+        spreads the work over all cores without paying for pickling the
+        image data between processes.
+
+    Jobs are not served first in first out, the FairScheduler shares the
+        workers between the priority lanes and the cloudnames.
+
+    Attributes:
+        _pool (FairScheduler): The lazily created worker pool.
+    """
+
+    _pool: FairScheduler | None = None
+
+    @classmethod
+    def pool_size(cls) -> int:
+        """
+        Number of worker threads in the pool.
+
+        Returns:
+            int: The configured pool size, or the cpu count if not set.
+        """
+        return ThreadBudget.pool_size()
+
+    @classmethod
+    def get_pool(cls) -> FairScheduler:
+        """
+        Get the worker pool, creating it on first use.
+
+        Returns:
+            FairScheduler: The worker pool.
+        """
+        if cls._pool is None:
+            cls._pool = FairScheduler(
+                max_workers=cls.pool_size(),
+                thread_name_prefix="inteliver-image",
+            )
+        return cls._pool
+
+    @classmethod
+    async def run(
+        cls,
+        func: Callable[..., Any],
+        *args,
+        schedule: JobSchedule | None = None,
+        **kwargs,
+    ) -> Any:
+        """
+        Run a blocking function on the worker pool and await its result.
+
+        Args:
+            func (Callable): The blocking function to run.
+            *args: Positional arguments passed to the function.
+            schedule (JobSchedule): The tenant, lane and cost of the job,
+                an anonymous interactive job if not given.
+            **kwargs: Keyword arguments passed to the function.
+
+        Returns:
+            Any: The return value of the function.
+        """
+        future = cls.submit(func, *args, schedule=schedule, **kwargs)
+        return await asyncio.wrap_future(future)
+
+    @classmethod
+    def submit(
+        cls,
+        func: Callable[..., Any],
+        *args,
+        schedule: JobSchedule | None = None,
+        **kwargs,
+    ) -> Future:
+        """
+        Submit a blocking function to the worker pool.
+
+        Args:
+            func (Callable): The blocking function to run.
+            *args: Positional arguments passed to the function.
+            schedule (JobSchedule): The tenant, lane and cost of the job,
+                an anonymous interactive job if not given.
+            **kwargs: Keyword arguments passed to the function.
+
+        Returns:
+            Future: The job future, cancelling it drops the job if it is
+                still queued.
+        """
+        future = cls.get_pool().submit(
+            partial(func, *args, **kwargs), schedule or JobSchedule()
+        )
+        IMAGE_JOBS_IN_FLIGHT.inc()
+        future.add_done_callback(lambda _: IMAGE_JOBS_IN_FLIGHT.dec())
+        return future
+
+    @classmethod
+    def queue_depth(cls) -> int:
+        """
+        Number of jobs waiting for a free worker thread.
+        """
+        if cls._pool is None:
+            return 0
+        return cls._pool.queue_depth()
+
+    @classmethod
+    def shutdown(cls):
+        """
+        Shutdown the worker pool and wait for running jobs to finish.
+        """
+        if cls._pool is not None:
+            cls._pool.shutdown(wait=True)
+            cls._pool = None
+
+
+IMAGE_POOL_QUEUE_DEPTH.set_function(ImageExecutor.queue_depth)
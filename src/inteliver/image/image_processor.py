@@ -5,17 +5,133 @@
         machine learning and A.I. algorithms on images.
 """
 
+from functools import lru_cache
+
 import cv2
-import dlib
 import numpy as np
 
+from inteliver.config import settings
 from inteliver.image.exceptions import (
     InsufficientCommandArgumentsException,
     InvalidCommandOperationException,
     UnprocessableCommandArgumentsException,
 )
+from inteliver.image.model_registry import (
+    FACE_DETECTOR,
+    OBJECT_DETECTOR,
+    ModelRegistry,
+)
+from inteliver.image.roi import clamp_window, merge_windows
+from inteliver.image.saliency import SaliencyCrop
+from inteliver.image.tiling import process_in_bands, should_tile
+from inteliver.metrics.collectors import MODEL_INFERENCE_SECONDS
+
+# blur kernels from this size are applied on a block mean downscaled image
+LARGE_BLUR_KSIZE = 64
+# kernel size of the blur applied on the downscaled image
+LARGE_BLUR_STEP_KSIZE = 16
+# round crop masks up to this many pixels are cached, at most 64 of them
+ROUND_CROP_CACHE_PIXELS = 512 * 512
+
+
+def _block_means(image: np.ndarray, size: int) -> np.ndarray:
+    """
+    Mean of each size x size block of an image.
+
+    The blocks are anchored at the top left corner, blocks on the right and
+        bottom edges may be smaller. The means are computed with INTER_AREA
+        downsampling by integer factors, so they are exact block means.
+
+    Args:
+        image (np.ndarray): The input image.
+        size (int): The block size in pixels.
+
+    Returns:
+        np.ndarray: The block means with shape (ceil(height / size),
+            ceil(width / size), channels).
+    """
+    height, width = image.shape[:2]
+    full_rows, full_cols = height // size, width // size
+    means = np.empty(
+        (-(-height // size), -(-width // size), *image.shape[2:]), dtype=image.dtype
+    )
+    # full blocks, then the partial blocks of the bottom and right edges
+    row_parts = (
+        (0, full_rows * size, 0, full_rows),
+        (full_rows * size, height, full_rows, means.shape[0]),
+    )
+    col_parts = (
+        (0, full_cols * size, 0, full_cols),
+        (full_cols * size, width, full_cols, means.shape[1]),
+    )
+    for y1, y2, row1, row2 in row_parts:
+        for x1, x2, col1, col2 in col_parts:
+            if y1 == y2 or x1 == x2:
+                continue
+            block = cv2.resize(
+                image[y1:y2, x1:x2],
+                (col2 - col1, row2 - row1),
+                interpolation=cv2.INTER_AREA,
+            )
+            means[row1:row2, col1:col2] = block.reshape(
+                means[row1:row2, col1:col2].shape
+            )
+    return means
+
+
+def _round_crop_mask(
+    width: int, height: int, antialias: bool
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Build the elliptical alpha mask used by the round crop operator.
+
+    Masks up to ROUND_CROP_CACHE_PIXELS are cached per size, avatars are
+        usually requested in a handful of small fixed sizes. Larger masks
+        are built for each call, so the cache stays a few MB.
 
-#  from app.image.object_detection import ObjectDetection
+    Args:
+        width (int): The mask width.
+        height (int): The mask height.
+        antialias (bool): Whether to anti-alias the ellipse edge.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The uint8 alpha mask with shape
+            (height, width) and a boolean mask of the pixels inside the
+            ellipse with shape (height, width, 1).
+    """
+    if width * height <= ROUND_CROP_CACHE_PIXELS:
+        return _cached_round_crop_mask(width, height, antialias)
+    return _build_round_crop_mask(width, height, antialias)
+
+
+@lru_cache(maxsize=64)
+def _cached_round_crop_mask(
+    width: int, height: int, antialias: bool
+) -> tuple[np.ndarray, np.ndarray]:
+    mask, inside = _build_round_crop_mask(width, height, antialias)
+    # cached arrays are shared between requests
+    mask.setflags(write=False)
+    inside.setflags(write=False)
+    return mask, inside
+
+
+def _build_round_crop_mask(
+    width: int, height: int, antialias: bool
+) -> tuple[np.ndarray, np.ndarray]:
+    mask = np.zeros((height, width), dtype=np.uint8)
+    # axes (as well as center) has to be an integers tuple, not floats.
+    cv2.ellipse(
+        mask,
+        (width // 2, height // 2),
+        (width // 2, height // 2),
+        0,
+        0,
+        360,
+        (255,),
+        -1,
+        lineType=cv2.LINE_AA if antialias else cv2.LINE_8,
+    )
+    return mask, (mask > 0)[:, :, np.newaxis]
 
 
 class ImageProcessor:
@@ -23,10 +139,9 @@ class ImageProcessor:
     ImageProcessor class
 
     This class is responsible for processing an image and apply
-        machine learning and A.I. algorithms on images.
-
-    Attributes:
-        _face_detector (dlib.object): dlib default face detector.
+        machine learning and A.I. algorithms on images. The face and
+        object detection models are loaded from the ModelRegistry on
+        first use.
 
     Methods:
         get_commands(self): Loop over subcommands attribute and
@@ -34,11 +149,7 @@ class ImageProcessor:
 
     """
 
-    _face_detector = dlib.get_frontal_face_detector()
-    # _object_detector = ObjectDetection()
-    _object_detector = None
-
-    def __init__(self):
+    def __init__(self, timer=None, deadline=None):
         """
         ImageProcessor __init__ method
 
@@ -47,8 +158,11 @@ class ImageProcessor:
             and mask_processors dictionary. Each dictionary is consist of
             different commands and their corrosponding function.
 
-        Attributes:
-            _face_detector (dlib.object): dlib default face detector.
+        Args:
+            timer (StageTimer): Optional request timer, each operator is
+                recorded as a stage.
+            deadline (Deadline): Optional request deadline, checked before
+                each command.
 
         """
 
@@ -58,8 +172,16 @@ class ImageProcessor:
         self.select_windows = []
         # [x, y]
         self.gravity = {"x": None, "y": None}
+        # the gravity is set on the most salient window once its size is known
+        self.auto_gravity = False
+        # uint8 selection mask (0 or 255) set by mask selectors
+        self.mask = None
+        # HSV copy of the image, shared by the hue, sat and val masks
+        self._hsv = None
         self.image = None
         self.format = "image/jpeg;q=0.95"
+        self.timer = timer
+        self.deadline = deadline
         self.command_processors = {}
         self.operator_processors = {}
         self.mask_processors = {}
@@ -148,6 +270,8 @@ class ImageProcessor:
         for cmd in command:
             if cmd[:4] not in self.command_processors:
                 return "error/invalid_subcommand", None
+            if self.deadline is not None:
+                self.deadline.check()
             self.command_processors[cmd[:4]](cmd[4:])
 
         return self.format, self.image
@@ -226,7 +350,8 @@ class ImageProcessor:
 
         This method will set gravity of an image based on the center
             required by user command. User can center the operations
-            on face or a custom x and y.
+            on face, on an object, on the most salient part of the image
+            (auto) or a custom x and y.
 
         Args:
             center (str): Selector string for image center.
@@ -238,6 +363,7 @@ class ImageProcessor:
             "y": self.selector_center_y,
             "face": self.selector_center_face,
             "object": self.selector_center_object,
+            "auto": self.selector_center_auto,
         }
         center_segs = center.split("_")
         center = center_segs[0]
@@ -292,7 +418,7 @@ class ImageProcessor:
 
         """
 
-        faces = self._face_detector(self.image, 1)
+        faces = self._detect_faces()
         faces_len = len(faces)
         if faces_len == 0:
             return
@@ -330,7 +456,11 @@ class ImageProcessor:
         object_idx = 0
         if len(center_segs) > 3:
             object_idx = int(center_segs[2])
-        object_map = self._object_detector.detect_objects_map(self.image)
+        with MODEL_INFERENCE_SECONDS.time(model=OBJECT_DETECTOR):
+            # only the selected class is detected
+            object_map = ModelRegistry.get(OBJECT_DETECTOR).detect_objects_map(
+                self.image, {object_name}
+            )
         if object_name not in object_map:
             return
         detected_objects = object_map[object_name]
@@ -343,28 +473,168 @@ class ImageProcessor:
             self.select_window["width"] = selected_object["x2"] - selected_object["x1"]
             self.select_window["height"] = selected_object["y2"] - selected_object["y1"]
 
+    def selector_center_auto(self, center_segs):
+        """
+        ImageProcessor selector_center_auto method
+
+        This method will set gravity of an image on its most salient
+            window. The window size is only known when the operator runs
+            (e.g. the crop of a resize keep), so the gravity is set then.
+
+        Args:
+            center_segs (list): Selector string segments for image center.
+
+        """
+        self.auto_gravity = True
+
+    def _apply_auto_gravity(self, width, height):
+        """
+        Set the gravity on the most salient width x height window, if the
+            auto gravity is selected.
+        """
+        if not self.auto_gravity:
+            return
+        self.gravity["x"], self.gravity["y"] = SaliencyCrop.gravity(
+            self.image, width, height
+        )
+
     def selector_mask(self, mask):
+        """
+        ImageProcessor selector_mask method
+
+        This method will set the selection mask of the next operator. The
+            operator is only applied on the pixels under the mask. If
+            more than one mask selector is used, their intersection is
+            selected.
+
+        Args:
+            mask (str): Selector string for the mask, such as 'skin',
+                'face', 'hue_20_40', 'sat_50_255' or 'val_0_80'.
+
+        """
+
         mask_segs = mask.split("_")
         mask_type = mask_segs[0]
         if mask_type not in self.mask_processors:
             return
-        mask_args = "_".join(mask_segs[1:])
-        self.mask_processors[mask_type](mask_args)
+        mask_args = mask_segs[1:]
+        selected = self.mask_processors[mask_type](mask_args)
+        if self.mask is None:
+            self.mask = selected
+        else:
+            self.mask = cv2.bitwise_and(self.mask, selected)
 
     def mask_skin(self, args):
-        pass
+        """
+        ImageProcessor mask_skin method
+
+        Select skin colored pixels using a fixed YCrCb range.
+
+        Args:
+            args (list): Unused.
+
+        Returns:
+            np.ndarray: The uint8 mask of the skin pixels.
+        """
+
+        ycrcb = cv2.cvtColor(self._bgr_image(), cv2.COLOR_BGR2YCrCb)
+        return cv2.inRange(ycrcb, (0, 133, 77), (255, 173, 127))
 
     def mask_face(self, args):
-        pass
+        """
+        ImageProcessor mask_face method
 
-    def mask_sat(self, args):
-        pass
+        Select the elliptical area of each detected face.
+
+        Args:
+            args (list): Unused.
+
+        Returns:
+            np.ndarray: The uint8 mask of the face areas.
+        """
+
+        mask = np.zeros(self.image.shape[:2], dtype=np.uint8)
+        for face in self._detect_faces():
+            center = (
+                (face.left() + face.right()) // 2,
+                (face.top() + face.bottom()) // 2,
+            )
+            axes = (face.width() // 2, face.height() // 2)
+            cv2.ellipse(mask, center, axes, 0, 0, 360, 255, -1)
+        return mask
 
     def mask_hue(self, args):
-        pass
+        """
+        ImageProcessor mask_hue method
+
+        Select the pixels with a hue in a range. Hue values are in the
+            OpenCV range of 0 to 179, if the lower bound is greater than the
+            upper bound the range wraps around (e.g. 'hue_170_10' for red).
+
+        Args:
+            args (list): The lower and upper hue bounds.
+
+        Returns:
+            np.ndarray: The uint8 mask of the selected pixels.
+        """
+
+        lower, upper = self._mask_range(args)
+        hsv = self._hsv_image()
+        if lower <= upper:
+            return cv2.inRange(hsv, (lower, 0, 0), (upper, 255, 255))
+        return cv2.bitwise_or(
+            cv2.inRange(hsv, (lower, 0, 0), (179, 255, 255)),
+            cv2.inRange(hsv, (0, 0, 0), (upper, 255, 255)),
+        )
+
+    def mask_sat(self, args):
+        """
+        ImageProcessor mask_sat method
+
+        Select the pixels with a saturation (0 to 255) in a range.
+
+        Args:
+            args (list): The lower and upper saturation bounds.
+
+        Returns:
+            np.ndarray: The uint8 mask of the selected pixels.
+        """
+
+        lower, upper = self._mask_range(args)
+        return cv2.inRange(self._hsv_image(), (0, lower, 0), (179, upper, 255))
 
     def mask_val(self, args):
-        pass
+        """
+        ImageProcessor mask_val method
+
+        Select the pixels with a value (brightness, 0 to 255) in a range.
+
+        Args:
+            args (list): The lower and upper value bounds.
+
+        Returns:
+            np.ndarray: The uint8 mask of the selected pixels.
+        """
+
+        lower, upper = self._mask_range(args)
+        return cv2.inRange(self._hsv_image(), (0, 0, lower), (179, 255, upper))
+
+    def _mask_range(self, args):
+        if len(args) < 2:
+            raise InsufficientCommandArgumentsException
+        return self._safe_int(args[0]), self._safe_int(args[1])
+
+    def _bgr_image(self):
+        if self.image.ndim == 2:
+            return cv2.cvtColor(self.image, cv2.COLOR_GRAY2BGR)
+        if self.image.shape[2] == 4:
+            return cv2.cvtColor(self.image, cv2.COLOR_BGRA2BGR)
+        return self.image
+
+    def _hsv_image(self):
+        if self._hsv is None:
+            self._hsv = cv2.cvtColor(self._bgr_image(), cv2.COLOR_BGR2HSV)
+        return self._hsv
 
     def modifier_operator(self, operator):
         """
@@ -388,14 +658,22 @@ class ImageProcessor:
         if op_type not in self.operator_processors:
             raise InvalidCommandOperationException
 
-        self.operator_processors[op_type](op_segs[1:])
+        if self.timer is None:
+            self.operator_processors[op_type](op_segs[1:])
+        else:
+            with self.timer.stage("operator", op_type) as stage:
+                self.operator_processors[op_type](op_segs[1:])
+                stage["nbytes"] = self.image.nbytes
 
-        # Reset selection window and windows and gravity
+        # Reset selection window, windows, gravity and mask
         self.select_window = {"height": None, "width": None}
         self.select_windows = []
         self.gravity = {"x": None, "y": None}
+        self.auto_gravity = False
+        self.mask = None
+        self._hsv = None
 
-    def operator_on_selection(self, op):
+    def operator_on_selection(self, op, tile_halo=None, tile_align=1):
         """
         ImageProcessor operator_on_selection method
 
@@ -403,20 +681,41 @@ class ImageProcessor:
             an image. It will apply it to whole image if select_window or
             gravity contains None. To a selected window if select_window
             and gravity is set. And to multiple windows if select_windows
-            is set.
+            is set. If a mask is selected, only the pixels under the mask
+            are changed. Operators on windows only read and write the
+            window pixels, so their cost is proportional to the windows
+            area.
+
+        Tile-safe operators pass their kernel radius as tile_halo. Such an
+            operator on a whole image larger than the memory budget runs
+            over horizontal bands instead of the whole frame at once.
 
         Args:
             op (function): The operator function to be called on image.
+            tile_halo (int): The operator kernel radius in rows, None if
+                the operator is not tile-safe.
+            tile_align (int): The band alignment for block based operators.
 
         """
 
+        if None not in self.select_window.values():
+            self._apply_auto_gravity(
+                self.select_window["width"], self.select_window["height"]
+            )
         if None in (
             self.select_window["width"],
             self.select_window["height"],
             self.gravity["x"],
             self.gravity["y"],
         ):
-            self.image = op(self.image)
+            if self.mask is None:
+                if tile_halo is not None and should_tile(self.image):
+                    self.image = process_in_bands(self.image, op, tile_halo, tile_align)
+                else:
+                    self.image = op(self.image)
+            else:
+                height, width = self.image.shape[:2]
+                self._apply_on_window(op, 0, 0, width, height)
             return
 
         if len(self.select_windows) == 0:
@@ -424,12 +723,64 @@ class ImageProcessor:
             x2 = self.gravity["x"] + self.select_window["width"] // 2
             y1 = self.gravity["y"] - self.select_window["height"] // 2
             y2 = self.gravity["y"] + self.select_window["height"] // 2
-            self.image[y1:y2, x1:x2] = op(self.image[y1:y2, x1:x2])
+            windows = [(x1, y1, x2, y2)]
+        else:
+            windows = self.select_windows
 
-        for window in self.select_windows:
-            self.image[window[1] : window[3], window[0] : window[2]] = op(
-                self.image[window[1] : window[3], window[0] : window[2]]
-            )
+        # windows are clamped to the image, empty windows are skipped and
+        # overlapping windows are processed once on their bounding box
+        height, width = self.image.shape[:2]
+        windows = [clamp_window(tuple(window), width, height) for window in windows]
+        for box, members in merge_windows([w for w in windows if w is not None]):
+            self._apply_on_window(op, *box, members=members)
+
+    def _apply_on_window(self, op, x1, y1, x2, y2, members=None):
+        """
+        Apply an operator on a window of the image, in place.
+
+        If a mask is selected, the operator result is copied only under
+            the mask, so no per pixel python loop is involved. If the
+            window is the bounding box of several merged windows, the
+            result is copied only inside those windows.
+        """
+
+        roi = self.image[y1:y2, x1:x2]
+        result = self._match_channels(op(roi), roi)
+
+        where = None
+        if self.mask is not None:
+            where = self.mask[y1:y2, x1:x2] > 0
+        if members is not None and len(members) > 1:
+            inside = np.zeros(roi.shape[:2], dtype=bool)
+            for mx1, my1, mx2, my2 in members:
+                inside[my1 - y1 : my2 - y1, mx1 - x1 : mx2 - x1] = True
+            where = inside if where is None else where & inside
+
+        if where is None:
+            roi[...] = result
+            return
+        if roi.ndim == 3:
+            where = where[:, :, np.newaxis]
+        np.copyto(roi, result, where=where)
+
+    def _match_channels(self, image, like):
+        """
+        Convert an operator result to the number of channels of a target.
+        """
+
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        like_channels = 1 if like.ndim == 2 else like.shape[2]
+        if channels == like_channels:
+            return image
+        conversions = {
+            (1, 3): cv2.COLOR_GRAY2BGR,
+            (1, 4): cv2.COLOR_GRAY2BGRA,
+            (3, 1): cv2.COLOR_BGR2GRAY,
+            (3, 4): cv2.COLOR_BGR2BGRA,
+            (4, 1): cv2.COLOR_BGRA2GRAY,
+            (4, 3): cv2.COLOR_BGRA2BGR,
+        }
+        return cv2.cvtColor(image, conversions[(channels, like_channels)])
 
     def operator_crop(self, args):
         """
@@ -445,19 +796,22 @@ class ImageProcessor:
 
         """
 
-        patch_height = (
-            self.select_window["height"]
-            if self.select_window["height"]
-            else self.image_height
-        )
-        patch_width = (
-            self.select_window["width"]
-            if self.select_window["width"]
-            else self.image_width
-        )
-
-        center_x = self.gravity["x"] if self.gravity["x"] else self.image_width // 2
-        center_y = self.gravity["y"] if self.gravity["y"] else self.image_height // 2
+        center_x, center_y, patch_width, patch_height = self._crop_window()
+
+        # a window inside the image is a plain slice, copied so the full
+        # frame can be released
+        x1 = center_x - patch_width // 2
+        y1 = center_y - patch_height // 2
+        if (
+            x1 >= 0
+            and y1 >= 0
+            and x1 + patch_width <= self.image.shape[1]
+            and y1 + patch_height <= self.image.shape[0]
+        ):
+            self.image = self.image[
+                y1 : y1 + patch_height, x1 : x1 + patch_width
+            ].copy()
+            return
 
         # cv2.getRectSubPix only works for images with depth==1 or depth==3
         # here's a hack for images with different depth
@@ -476,6 +830,49 @@ class ImageProcessor:
                 self.image, (patch_width, patch_height), (center_x, center_y)
             )
 
+    def _detect_faces(self):
+        """
+        Detect the faces of the image with the dlib face detector.
+
+        Returns:
+            dlib.rectangles: The detected face rectangles.
+        """
+        detector = ModelRegistry.get(FACE_DETECTOR)
+        with MODEL_INFERENCE_SECONDS.time(model=FACE_DETECTOR):
+            return detector(self.image, settings.image_face_upsample)
+
+    def _crop_window(self):
+        """
+        The crop window center and size of the current selection.
+
+        Returns:
+            tuple: center x, center y, width and height of the window.
+        """
+
+        patch_height = (
+            self.select_window["height"]
+            if self.select_window["height"]
+            else self.image_height
+        )
+        patch_width = (
+            self.select_window["width"]
+            if self.select_window["width"]
+            else self.image_width
+        )
+        self._apply_auto_gravity(patch_width, patch_height)
+
+        center_x = (
+            self.gravity["x"]
+            if self.gravity["x"] is not None
+            else self.image_width // 2
+        )
+        center_y = (
+            self.gravity["y"]
+            if self.gravity["y"] is not None
+            else self.image_height // 2
+        )
+        return center_x, center_y, patch_width, patch_height
+
     def operator_resize(self, args):
         """
         ImageProcessor operator_resize method
@@ -577,7 +974,9 @@ class ImageProcessor:
         ImageProcessor operator_blur method
 
         This method is responsible for bluring operation. using
-            opencv blur function.
+            opencv blur function. Kernels from LARGE_BLUR_KSIZE are
+            approximated by blurring the block means of the image and
+            upscaling the result.
 
         Args:
             args (str): Extra arguments passed to blure operator. It is
@@ -592,25 +991,60 @@ class ImageProcessor:
             if ksize % 2 == 0:
                 ksize += 1
 
-        def do_blur(image):
-            return cv2.blur(image, (ksize, ksize))
+        if ksize < LARGE_BLUR_KSIZE:
 
-        self.operator_on_selection(do_blur)
+            def do_blur(image):
+                return cv2.blur(image, (ksize, ksize))
+
+            self.operator_on_selection(do_blur, tile_halo=ksize // 2)
+            return
+
+        # large kernels blur the block means and upscale them back, so the
+        # cost stays near constant with the kernel size
+        factor = ksize // LARGE_BLUR_STEP_KSIZE
+        small_ksize = (ksize // factor) | 1
+
+        def do_large_blur(image):
+            image_height, image_width = image.shape[:2]
+            # blocks larger than the image all give its mean color
+            size = min(factor, max(image_height, image_width))
+            small = cv2.blur(_block_means(image, size), (small_ksize, small_ksize))
+            # upscale one axis at a time, cropping each to the image, so the
+            # output never grows past the image for kernels larger than it
+            small = cv2.resize(
+                small, None, fx=size, fy=1, interpolation=cv2.INTER_LINEAR
+            )[:, :image_width]
+            image = cv2.resize(
+                small, None, fx=1, fy=size, interpolation=cv2.INTER_LINEAR
+            )
+            return image[:image_height]
+
+        self.operator_on_selection(
+            do_large_blur,
+            tile_halo=factor * (small_ksize // 2 + 2),
+            tile_align=factor,
+        )
 
     def operator_rotate(self, args):
         """
         ImageProcessor operator_rotate method
 
-        This method is responsible for rotating operation. using
-            opencv getRotationMatrix2D function.
+        This method is responsible for rotating operation. Rotations by
+            a multiple of 90 degrees around the image center are exact and
+            use opencv rotate function, the output width and height are
+            swapped for 90 and 270 degrees. Other rotations use opencv
+            getRotationMatrix2D and warpAffine functions.
 
         Args:
             args (str): Extra arguments passed to rotate operator. It is
                 currently the value of rotate degree (first arg) and
-                rotate scale (second arg).
+                rotate scale (second arg). If 'expand' is sent, the canvas
+                is enlarged to hold the whole rotated image.
 
         """
 
+        expand = "expand" in args
+        args = [arg for arg in args if arg != "expand"]
         if not len(args):
             raise InsufficientCommandArgumentsException
 
@@ -620,6 +1054,22 @@ class ImageProcessor:
         if len(args) > 1:
             rot_scale = self._safe_float(args[1])
 
+        custom_canvas = (
+            self.gravity["x"] is not None
+            or self.gravity["y"] is not None
+            or self.select_window["width"] is not None
+            or self.select_window["height"] is not None
+        )
+        if rot_degree % 90 == 0 and rot_scale == 1.0 and not custom_canvas:
+            rot_codes = {
+                90: cv2.ROTATE_90_COUNTERCLOCKWISE,
+                180: cv2.ROTATE_180,
+                270: cv2.ROTATE_90_CLOCKWISE,
+            }
+            if rot_degree % 360:
+                self.image = cv2.rotate(self.image, rot_codes[rot_degree % 360])
+            return
+
         center = [self.gravity["x"], self.gravity["y"]]
         if center[0] is None:
             center[0] = self.image_width // 2
@@ -634,7 +1084,20 @@ class ImageProcessor:
             dsize[1] = self.image_height
         dsize = tuple(dsize)
 
-        rot_mat = cv2.getRotationMatrix2D(center, rot_degree, rot_scale)
+        if expand:
+            # rotate around the image center into the bounding box of the
+            # rotated image
+            center = ((self.image_width - 1) / 2, (self.image_height - 1) / 2)
+            rot_mat = cv2.getRotationMatrix2D(center, rot_degree, rot_scale)
+            cos, sin = abs(rot_mat[0, 0]), abs(rot_mat[0, 1])
+            dsize = (
+                int(np.ceil(self.image_height * sin + self.image_width * cos)),
+                int(np.ceil(self.image_height * cos + self.image_width * sin)),
+            )
+            rot_mat[0, 2] += (dsize[0] - 1) / 2 - center[0]
+            rot_mat[1, 2] += (dsize[1] - 1) / 2 - center[1]
+        else:
+            rot_mat = cv2.getRotationMatrix2D(center, rot_degree, rot_scale)
         self.image = cv2.warpAffine(self.image, rot_mat, dsize)
 
     def operator_flip(self, args):
@@ -663,26 +1126,40 @@ class ImageProcessor:
         """
         ImageProcessor operator_round_crop method
 
-        This method is responsible for round croping operation. using
-            opencv ellipse function.
+        This method is responsible for round croping operation. The output
+            is a BGRA image whose alpha channel is an ellipse inscribed in
+            the image, pixels outside the ellipse are transparent black.
+
+        1, 3 and 4 channel images are supported, for 4 channel images the
+            existing alpha is kept inside the ellipse.
+
+        Args:
+            args (str): Extra arguments passed to round crop operator. If
+                'aa' is sent, the ellipse edge is anti-aliased.
 
         """
 
+        antialias = "aa" in args
+
         def do_round_crop(image):
-            image_height = image.shape[0]
-            image_width = image.shape[1]
-            b, g, r = cv2.split(image)
-            alpha = np.zeros(b.shape, dtype=b.dtype)
-            rows, cols = (image_height, image_width)
-            # axes (as well as center) has to be an integers tuple, not floats.
-            cv2.ellipse(
-                alpha, (cols // 2, rows // 2), (cols // 2, rows // 2), 0, 0, 360, 1, -1
-            )
-            b = b * alpha
-            g = g * alpha
-            r = r * alpha
-            image = cv2.merge((b, g, r, alpha * 255))
-            return image
+            image_height, image_width = image.shape[:2]
+            mask, inside = _round_crop_mask(image_width, image_height, antialias)
+            alpha = mask
+            alpha_max = np.iinfo(image.dtype).max
+            if alpha_max != 255:
+                alpha = mask.astype(image.dtype) * (alpha_max // 255)
+
+            # single output allocation, colors are copied only inside the
+            # ellipse and the alpha is written in place
+            output = np.zeros((image_height, image_width, 4), dtype=image.dtype)
+            if image.ndim == 2:
+                image = image[:, :, np.newaxis]
+            np.copyto(output[:, :, :3], image[:, :, :3], where=inside)
+            if image.shape[2] == 4:
+                np.minimum(image[:, :, 3], alpha, out=output[:, :, 3])
+            else:
+                output[:, :, 3] = alpha
+            return output
 
         self.operator_on_selection(do_round_crop)
 
@@ -700,14 +1177,14 @@ class ImageProcessor:
         def do_sharpen(image):
             return cv2.filter2D(image, -1, kernel)
 
-        self.operator_on_selection(do_sharpen)
+        self.operator_on_selection(do_sharpen, tile_halo=1)
 
     def operator_pixelate(self, args):
         """
         ImageProcessor operator_pixelate method
 
-        This method is responsible for pixelating operation. using
-            opencv filter2D function.
+        This method is responsible for pixelating operation. Each
+            pixel_size x pixel_size block is filled with its mean color.
 
         Args:
             args (str): Extra arguments passed to pixelate operator. It
@@ -722,16 +1199,24 @@ class ImageProcessor:
             return
 
         def do_pixelate(image):
-            orig_shape = image.shape
-            image_height = orig_shape[0]
-            image_width = orig_shape[1]
-            dsize = (image_width // pixel_size, image_height // pixel_size)
-            image = cv2.resize(image, dsize, interpolation=cv2.INTER_NEAREST)
-            dsize = (image_width, image_height)
-            image = cv2.resize(image, dsize, interpolation=cv2.INTER_NEAREST)
-            return image
+            image_height, image_width = image.shape[:2]
+            # blocks larger than the image all give its mean color
+            size = min(pixel_size, max(image_height, image_width))
+            means = _block_means(image, size)
+            # replicate each block mean into a preallocated output of the
+            # image size. The means are widened into one block row first,
+            # which is then copied to the rows of a block.
+            wide = np.repeat(means, size, axis=1)[:, :image_width]
+            output = np.empty(image.shape, dtype=image.dtype)
+            full_rows = image_height // size
+            block_rows = output[: full_rows * size].reshape(
+                full_rows, size, *output.shape[1:]
+            )
+            block_rows[:] = wide[:full_rows, np.newaxis]
+            output[full_rows * size :] = wide[full_rows:]
+            return output
 
-        self.operator_on_selection(do_pixelate)
+        self.operator_on_selection(do_pixelate, tile_halo=0, tile_align=pixel_size)
 
     def operator_gray(self, args):
         """
@@ -743,12 +1228,14 @@ class ImageProcessor:
         """
 
         def do_gray(image):
-            if image.shape == self.image.shape:
-                return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            return cv2.cvtColor(gray_image, cv2.COLOR_GRAY2BGR)
+            # windows are converted back to the image channels on assignment
+            if image.ndim == 2:
+                return image
+            if image.shape[2] == 4:
+                return cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+            return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
-        self.operator_on_selection(do_gray)
+        self.operator_on_selection(do_gray, tile_halo=0)
 
     def operator_text(self, args):
         """
@@ -800,7 +1287,10 @@ class ImageProcessor:
 
         """
 
+        detector = ModelRegistry.get(OBJECT_DETECTOR)
+
         def do_detect(image):
-            return self._object_detector.detect_objects(image)
+            with MODEL_INFERENCE_SECONDS.time(model=OBJECT_DETECTOR):
+                return detector.detect_objects(image)
 
         self.operator_on_selection(do_detect)
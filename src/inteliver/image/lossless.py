@@ -0,0 +1,339 @@
+"""
+Lossless JPEG transforms.
+
+Flips, right angle rotations and block aligned crops of a JPEG image can be
+    applied to the DCT coefficients directly with jpegtran, without decoding
+    the pixels and without the generation loss of a re-encode.
+
+A command string is planned against the JPEG header first. Only if every
+    operator of the command has an exact lossless equivalent the transform
+    is run, otherwise the regular pixel pipeline is used.
+"""
+
+import shutil
+import subprocess
+from functools import lru_cache
+from io import BytesIO
+
+from loguru import logger
+from PIL import Image, JpegImagePlugin
+
+from inteliver.config import settings
+from inteliver.image.image_processor import ImageProcessor
+from inteliver.image.orientation import EXIF_ORIENTATION_TAG
+
+IDENTITY = ((1, 0), (0, 1))
+
+# coordinate transforms of the jpegtran transform options, (x, y) are the
+# pixel coordinates with y pointing down
+D4_TRANSFORMS = {
+    IDENTITY: [],
+    ((-1, 0), (0, 1)): ["-flip", "horizontal"],
+    ((1, 0), (0, -1)): ["-flip", "vertical"],
+    ((-1, 0), (0, -1)): ["-rotate", "180"],
+    ((0, -1), (1, 0)): ["-rotate", "90"],
+    ((0, 1), (-1, 0)): ["-rotate", "270"],
+    ((0, 1), (1, 0)): ["-transpose"],
+    ((0, -1), (-1, 0)): ["-transverse"],
+}
+
+# coordinate transforms of the EXIF orientations
+ORIENTATIONS = {
+    1: IDENTITY,
+    2: ((-1, 0), (0, 1)),
+    3: ((-1, 0), (0, -1)),
+    4: ((1, 0), (0, -1)),
+    5: ((0, 1), (1, 0)),
+    6: ((0, -1), (1, 0)),
+    7: ((0, -1), (-1, 0)),
+    8: ((0, 1), (-1, 0)),
+}
+
+# inteliver flip operator arguments
+FLIPS = {
+    "h": ((-1, 0), (0, 1)),
+    "v": ((1, 0), (0, -1)),
+    "b": ((-1, 0), (0, -1)),
+}
+
+# inteliver (counter-clockwise) rotation degrees with an exact lossless
+# equivalent, 90 degrees counter-clockwise is jpegtran -rotate 270
+ROTATIONS = {
+    0: IDENTITY,
+    90: ((0, 1), (-1, 0)),
+    180: ((-1, 0), (0, -1)),
+    270: ((0, -1), (1, 0)),
+}
+
+# iMCU size of the PIL jpeg chroma sampling values (4:4:4, 4:2:2, 4:2:0)
+MCU_SIZES = {0: (8, 8), 1: (16, 8), 2: (16, 16)}
+
+JPEGTRAN_TIMEOUT_SECONDS = 30
+
+
+class NotLosslessException(Exception):
+    """The command has no exact lossless equivalent."""
+
+
+@lru_cache
+def jpegtran_path() -> str | None:
+    return shutil.which("jpegtran")
+
+
+def compose(first: tuple, second: tuple) -> tuple:
+    """
+    Compose two coordinate transforms, 'first' is applied first.
+    """
+    return tuple(
+        tuple(sum(second[i][k] * first[k][j] for k in range(2)) for j in range(2))
+        for i in range(2)
+    )
+
+
+class LosslessPlanner(ImageProcessor):
+    """
+    LosslessPlanner class
+
+    Replays a command string on the image geometry only, using the
+        ImageProcessor selectors so the crop windows are the exact same
+        windows the pixel pipeline would cut. Every operator is translated
+        into jpegtran arguments, consecutive flips and rotations are
+        composed into a single transform.
+
+    Attributes:
+        steps (list): jpegtran arguments of each lossless transform.
+        transform (tuple): The pending flip and rotation transform.
+        mcu (tuple): The iMCU width and height of the image.
+    """
+
+    def __init__(
+        self, width: int, height: int, mcu: tuple[int, int], orientation: int = 1
+    ):
+        super().__init__()
+        self.image_width = width
+        self.image_height = height
+        self.mcu = mcu
+        self.steps: list[list[str]] = []
+        self.transform = IDENTITY
+        # the orientation is the first transform, like on decode
+        self._apply_transform(ORIENTATIONS[orientation])
+
+        self.operator_processors = {
+            "crop": self.operator_crop,
+            "flip": self.operator_flip,
+            "rotate": self.operator_rotate,
+            "format": self.operator_format,
+        }
+
+    def process(self, command, rtype, data):
+        for cmd in command:
+            if cmd[:4] not in self.command_processors:
+                raise NotLosslessException
+            self.command_processors[cmd[:4]](cmd[4:])
+        return self.format, None
+
+    def modifier_operator(self, operator):
+        if operator.split("_")[0] not in self.operator_processors:
+            raise NotLosslessException
+        super().modifier_operator(operator)
+
+    def selector_center(self, center):
+        if center.split("_")[0] not in ("x", "y"):
+            raise NotLosslessException
+        super().selector_center(center)
+
+    def selector_mask(self, mask):
+        raise NotLosslessException
+
+    def operator_format(self, args):
+        # an explicit quality asks for a re-encode
+        if args[:1] not in (["jpg"], ["jpeg"]) or len(args) > 1:
+            raise NotLosslessException
+        super().operator_format(args)
+
+    def operator_flip(self, args):
+        if args[:1] == [] or args[0] not in FLIPS:
+            raise NotLosslessException
+        self._apply_transform(FLIPS[args[0]])
+
+    def operator_rotate(self, args):
+        # the same conditions as the exact cv2.rotate path
+        if (
+            len(args) != 1
+            or self.select_window != {"height": None, "width": None}
+            or self.gravity != {"x": None, "y": None}
+        ):
+            raise NotLosslessException
+        degree = self._safe_int(args[0]) % 360
+        if degree not in ROTATIONS:
+            raise NotLosslessException
+        self._apply_transform(ROTATIONS[degree])
+
+    def operator_crop(self, args):
+        center_x, center_y, width, height = self._crop_window()
+        x1 = center_x - width // 2
+        y1 = center_y - height // 2
+        # the window must lie inside the image and start on a block edge
+        if (
+            x1 < 0
+            or y1 < 0
+            or x1 + width > self.image_width
+            or y1 + height > self.image_height
+            or x1 % self.mcu[0]
+            or y1 % self.mcu[1]
+        ):
+            raise NotLosslessException
+
+        self._flush_transform()
+        self.steps.append(["-crop", f"{width}x{height}+{x1}+{y1}"])
+        self.image_width, self.image_height = width, height
+
+    def plan(self, commands: str) -> list[list[str]]:
+        """
+        Plan the jpegtran transforms of a command string.
+
+        Args:
+            commands (str): The commands to apply.
+
+        Returns:
+            list[list[str]]: The jpegtran arguments of each transform.
+
+        Raises:
+            NotLosslessException: If a command has no lossless equivalent.
+        """
+        for command_group in commands.split("/"):
+            self.process(command_group.split(","), self.format, None)
+        self._flush_transform()
+        return self.steps
+
+    def _apply_transform(self, transform: tuple):
+        self.transform = compose(self.transform, transform)
+        # transposing transforms swap the image and block dimensions
+        if transform[0][0] == 0:
+            self.image_width, self.image_height = self.image_height, self.image_width
+            self.mcu = self.mcu[::-1]
+
+    def _flush_transform(self):
+        args = D4_TRANSFORMS[self.transform]
+        if args:
+            # -perfect fails instead of trimming partial edge blocks
+            self.steps.append(["-perfect", *args])
+        self.transform = IDENTITY
+
+
+class LosslessJpeg:
+    """
+    LosslessJpeg class
+
+    Applies geometry only commands to JPEG images without re-encoding.
+    """
+
+    @staticmethod
+    def available() -> bool:
+        """
+        Check if jpegtran is installed.
+        """
+        return jpegtran_path() is not None
+
+    @staticmethod
+    def render(data: bytes, commands: str) -> tuple[bytes, str] | None:
+        """
+        Apply a command string to a JPEG image losslessly if possible.
+
+        Args:
+            data (bytes): The source image binary data.
+            commands (str): The commands to apply.
+
+        Returns:
+            tuple[bytes, str] | None: The transformed image and its format,
+                None if the commands need the pixel pipeline.
+        """
+        jpegtran = jpegtran_path()
+        if jpegtran is None or not data.startswith(b"\xff\xd8"):
+            return None
+
+        geometry = LosslessJpeg.probe(data)
+        if geometry is None:
+            return None
+
+        width, height, mcu, orientation = geometry
+        if not settings.image_auto_orient:
+            orientation = 1
+        planner = LosslessPlanner(width, height, mcu, orientation)
+        try:
+            steps = planner.plan(commands)
+        except Exception:
+            # invalid commands are reported by the pixel pipeline
+            return None
+        if not steps:
+            return None
+
+        copy = LosslessJpeg._copy_mode(orientation)
+        for args in steps:
+            output = LosslessJpeg._jpegtran(jpegtran, ["-copy", copy, *args], data)
+            if output is None:
+                return None
+            data = output
+
+        return data, planner.format
+
+    @staticmethod
+    def _copy_mode(orientation: int) -> str:
+        if settings.image_strip_metadata:
+            return "none"
+        if orientation != 1:
+            # the EXIF orientation tag would be applied twice by viewers
+            return "icc"
+        return "all"
+
+    @staticmethod
+    def _jpegtran(jpegtran: str, args: list[str], data: bytes) -> bytes | None:
+        try:
+            result = subprocess.run(
+                [jpegtran, *args],
+                input=data,
+                capture_output=True,
+                timeout=JPEGTRAN_TIMEOUT_SECONDS,
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logger.warning(f"jpegtran failed: {str(e)}")
+            return None
+        if result.returncode != 0:
+            logger.debug(f"jpegtran {args} is not lossless for this image")
+            return None
+        return result.stdout
+
+    @staticmethod
+    def probe(data: bytes) -> tuple[int, int, tuple[int, int], int] | None:
+        """
+        Read the size, the iMCU size and the EXIF orientation of a JPEG image
+            from its header.
+
+        Only grayscale and YCbCr images are supported, the pixel pipeline
+            converts other color spaces.
+
+        Args:
+            data (bytes): The image binary data.
+
+        Returns:
+            tuple | None: The image width, height, iMCU size and
+                orientation.
+        """
+        try:
+            with Image.open(BytesIO(data)) as image:
+                if image.format != "JPEG":
+                    return None
+                mcu: tuple[int, int] | None
+                if image.mode == "L":
+                    mcu = (8, 8)
+                elif image.mode == "RGB":
+                    mcu = MCU_SIZES.get(JpegImagePlugin.get_sampling(image))
+                else:
+                    mcu = None
+                width, height = image.size
+                orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+        except Exception:
+            return None
+        if mcu is None or orientation not in ORIENTATIONS:
+            return None
+        return width, height, mcu, orientation
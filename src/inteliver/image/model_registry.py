@@ -0,0 +1,120 @@
+"""
+Model registry
+
+The face and object detection models are loaded on first use instead of
+    at import time, so workers which only resize and convert images never
+    pay for loading them. Models can be preloaded at startup with the
+    image_model_warmup setting.
+"""
+
+import threading
+import time
+from typing import Any, Callable
+
+from loguru import logger
+
+from inteliver.config import settings
+from inteliver.config.schema import DetectorBackendEnum
+from inteliver.image.exceptions import ModelUnavailableException
+from inteliver.image.threads import ThreadBudget
+from inteliver.metrics.collectors import MODEL_LOAD_SECONDS
+
+FACE_DETECTOR = "dlib_face"
+OBJECT_DETECTOR = "yolo"
+
+
+def _load_face_detector():
+    import dlib
+
+    return dlib.get_frontal_face_detector()
+
+
+def _load_object_detector():
+    from inteliver.image.object_detection import ObjectDetection
+
+    backend = DetectorBackendEnum(settings.image_detector_backend)
+    if backend == DetectorBackendEnum.ULTRALYTICS:
+        detector = ObjectDetection(settings.image_yolo_model_path)
+        # torch is imported with the model, its thread pools are sized now
+        ThreadBudget.apply_torch()
+        return detector
+    return ObjectDetection(settings.image_detector_model_path, backend.value)
+
+
+class ModelRegistry:
+    """
+    ModelRegistry class
+
+    Keeps the loaders of the image models by name and the models loaded
+        so far. A model is loaded once per process, concurrent first uses
+        wait for the same load.
+
+    Attributes:
+        _loaders (dict): The model loaders by name.
+        _models (dict): The loaded models by name.
+    """
+
+    _loaders: dict[str, Callable[[], Any]] = {
+        FACE_DETECTOR: _load_face_detector,
+        OBJECT_DETECTOR: _load_object_detector,
+    }
+    _models: dict[str, Any] = {}
+    _locks: dict[str, threading.Lock] = {name: threading.Lock() for name in _loaders}
+
+    @classmethod
+    def get(cls, name: str) -> Any:
+        """
+        Get a model, loading it on first use.
+
+        Args:
+            name (str): The model name.
+
+        Returns:
+            Any: The model.
+
+        Raises:
+            ModelUnavailableException: If the model can not be loaded, e.g.
+                its optional dependency is not installed.
+        """
+        model = cls._models.get(name)
+        if model is not None:
+            return model
+        if name not in cls._loaders:
+            raise ModelUnavailableException(detail=f"Unknown model {name}")
+
+        with cls._locks[name]:
+            if name not in cls._models:
+                start = time.perf_counter()
+                try:
+                    cls._models[name] = cls._loaders[name]()
+                except (ImportError, OSError) as e:
+                    logger.error(f"Unable to load the {name} model: {str(e)}")
+                    raise ModelUnavailableException(
+                        detail=f"The {name} model is not available on this server"
+                    )
+                seconds = time.perf_counter() - start
+                MODEL_LOAD_SECONDS.observe(seconds, model=name)
+                logger.info(f"Loaded the {name} model in {seconds:.2f}s")
+        return cls._models[name]
+
+    @classmethod
+    def loaded(cls) -> list[str]:
+        """
+        The names of the loaded models.
+        """
+        return list(cls._models)
+
+    @classmethod
+    def warmup(cls, names: list[str]):
+        """
+        Load models ahead of their first use. Models which can not be
+            loaded are logged and skipped.
+
+        Args:
+            names (list[str]): The model names.
+        """
+        for name in names:
+            try:
+                cls.get(name)
+            except ModelUnavailableException as e:
+                logger.warning(f"Skipping the warmup of {name}: {e.detail}")
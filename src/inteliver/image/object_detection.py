@@ -2,35 +2,77 @@ from typing import Any
 
 import cv2
 import numpy as np
-from ultralytics import YOLO
+
+from inteliver.config import settings
+from inteliver.image.batching import InferenceBatcher
+from inteliver.image.detector_backends import BACKENDS, Detection, DetectorBackend
+from inteliver.image.threads import ThreadBudget
 
 
 class ObjectDetection:
-    _model = None  # Class variable to store the model
+    _model: DetectorBackend | None = None  # Class variable to store the model
+    _batcher: InferenceBatcher | None = None
     _colors = np.random.randint(0, 255, size=(100, 3))
 
-    def __init__(self, model_path: str = "src/inteliver/assets/models/yolo/yolov8n.pt"):
+    def __init__(
+        self,
+        model_path: str | None = None,
+        backend: str = "ultralytics",
+    ):
         """
         Initialize the ObjectDetection class with the YOLOv8 model.
         Load the model only once if not already loaded.
 
         Args:
-            model_path (str): The file path to the pre-trained YOLOv8 model.
+            model_path (str | None): The file path to the pre-trained YOLOv8
+                model, or to its export for the onnxruntime and openvino
+                backends. Defaults to the image_yolo_model_path setting.
+            backend (str): The detector backend running the model.
         """
+        if model_path is None:
+            model_path = settings.image_yolo_model_path
         if ObjectDetection._model is None:
-            ObjectDetection._model = self._load_model(model_path)
+            ObjectDetection._model = self._load_model(model_path, backend)
+            # at most one image per image worker thread can be waiting
+            ObjectDetection._batcher = InferenceBatcher(
+                "yolo",
+                self._predict,
+                min(settings.image_detect_batch_size, ThreadBudget.pool_size()),
+                settings.image_detect_batch_window_ms / 1000,
+            )
+
+    @staticmethod
+    def _predict(
+        inputs: list[tuple[np.ndarray, set[str] | None]]
+    ) -> list[list[Detection]]:
+        """
+        Run a batch of images through the model in one forward pass.
+
+        Args:
+            inputs (list[tuple[np.ndarray, set[str] | None]]): The
+                preprocessed images and the classes to detect in each.
+
+        Returns:
+            list[list[Detection]]: The detections of each image.
+        """
+        assert ObjectDetection._model is not None
+        images, classes = zip(*inputs)
+        return ObjectDetection._model.predict(list(images), list(classes))
 
-    def _load_model(self, model_path: str) -> YOLO:
+    def _load_model(self, model_path: str, backend: str) -> DetectorBackend:
         """
-        Load the YOLOv8 model from the given path.
+        Load the YOLOv8 model from the given path on a detector backend.
 
         Args:
-            model_path (str): The file path to the pre-trained YOLOv8 model.
+            model_path (str): The file path to the model.
+            backend (str): The detector backend name.
 
         Returns:
-            YOLO: The YOLOv8 model.
+            DetectorBackend: The loaded model.
         """
-        return YOLO(model_path)
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown detector backend {backend}")
+        return BACKENDS[backend](model_path)
 
     def _preprocess_image(self, image: np.ndarray) -> np.ndarray:
         """
@@ -43,47 +85,21 @@ class ObjectDetection:
             np.ndarray: The preprocessed image.
         """
         # Convert image to RGB
+        if image.ndim == 2:  # Handle grayscale images
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
         if image.shape[2] == 4:  # Handle transparency channel
             image = cv2.cvtColor(image, cv2.COLOR_BGRA2RGB)
         else:
             image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         return image
 
-    def _postprocess_detections(
-        self, results
-    ) -> list[tuple[int, int, int, int, str, float]]:
-        """
-        Post-process the detections to extract bounding boxes and labels.
-
-        Args:
-            results: The detections from the model.
-
-        Returns:
-            List[Tuple[int, int, int, int, str]]: List of detected objects as (x1, y1, x2, y2, label).
-        """
-        detections = []
-        for result in results:
-            boxes = result.boxes.xyxy.cpu().numpy()  # Bounding boxes
-            labels = result.boxes.cls.cpu().numpy().astype(int)  # Class labels
-            confidences = result.boxes.conf.cpu().numpy()  # Confidences
-
-            # Get class names from the COCO dataset
-            class_names = result.names
-
-            for box, label, confidence in zip(boxes, labels, confidences):
-                detections.append((*box, class_names[label], confidence))
-
-        return detections
-
-    def _draw_boxes(
-        self, image: np.ndarray, detections: list[tuple[int, int, int, int, str, float]]
-    ) -> np.ndarray:
+    def _draw_boxes(self, image: np.ndarray, detections: list[Detection]) -> np.ndarray:
         """
         Draw bounding boxes and labels on the image.
 
         Args:
             image (np.ndarray): The input image as a numpy array.
-            detections (List[Tuple[int, int, int, int, str]]): The detected objects.
+            detections (list[Detection]): The detected objects.
 
         Returns:
             np.ndarray: The image with bounding boxes and labels drawn.
@@ -110,36 +126,42 @@ class ObjectDetection:
 
         return image
 
-    def detect_objects(self, image: np.ndarray) -> np.ndarray:
+    def detect_objects(
+        self, image: np.ndarray, classes: set[str] | None = None
+    ) -> np.ndarray:
         """
         Detect objects in the image and draw bounding boxes with labels.
 
         Args:
             image (np.ndarray): The input image as a numpy array.
+            classes (set[str] | None): The classes to detect, None for all.
 
         Returns:
             np.ndarray: The image with detected objects drawn.
         """
         # Detect objects
-        detections = self._detect(image)
+        detections = self._detect(image, classes)
 
         # Draw bounding boxes
         image_with_boxes = self._draw_boxes(image, detections)
 
         return image_with_boxes
 
-    def detect_objects_map(self, image: np.ndarray) -> dict[str, list[dict[str, Any]]]:
+    def detect_objects_map(
+        self, image: np.ndarray, classes: set[str] | None = None
+    ) -> dict[str, list[dict[str, Any]]]:
         """
         Detect objects in the image and return an object map.
 
         Args:
             image (np.ndarray): The input image as a numpy array.
+            classes (set[str] | None): The classes to detect, None for all.
 
         Returns:
             Dict[str, List[Dict[str, Any]]]: The object map with detected objects' names, coordinates, and confidence.
         """
         # Detect objects
-        detections = self._detect(image)
+        detections = self._detect(image, classes)
 
         # Build object map
         object_map: dict = {}
@@ -158,23 +180,38 @@ class ObjectDetection:
 
         return object_map
 
-    def _detect(self, image: np.ndarray) -> list[tuple[int, int, int, int, str, float]]:
+    def _detect(
+        self, image: np.ndarray, classes: set[str] | None = None
+    ) -> list[Detection]:
         """
         Detect objects in the image.
 
+        The model only sees the image at its input size, so the detection
+            runs on a copy downscaled to it and the boxes are scaled back.
+
         Args:
             image (np.ndarray): The input image as a numpy array.
+            classes (set[str] | None): The classes to detect, None for all.
 
         Returns:
-            np.ndarray: The image with detected objects drawn.
+            list[Detection]: The detected objects in image pixels.
         """
+        assert self._model is not None and self._batcher is not None
+        height, width = image.shape[:2]
+        scale = min(self._model.input_size() / max(height, width), 1.0)
+        if scale < 1.0:
+            image = cv2.resize(
+                image,
+                (max(round(width * scale), 1), max(round(height * scale), 1)),
+                interpolation=cv2.INTER_AREA,
+            )
+
         # Preprocess the image
         preprocessed_image = self._preprocess_image(image)
 
-        # Perform detection
-        results = self._model(preprocessed_image)
-
-        # Post-process detections
-        detections = self._postprocess_detections(results)
-
-        return detections
+        # Perform detection, batched with the concurrent detections
+        detections = self._batcher.infer((preprocessed_image, classes))
+        return [
+            (x1 / scale, y1 / scale, x2 / scale, y2 / scale, label, confidence)
+            for x1, y1, x2, y2, label, confidence in detections
+        ]
@@ -0,0 +1,72 @@
+"""
+EXIF orientation normalization.
+
+cv2.imdecode with IMREAD_UNCHANGED ignores the EXIF orientation tag, so the
+    orientation is read from the image header and applied after decoding
+    with exact cv2 flips, rotations and transposes.
+"""
+
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+EXIF_ORIENTATION_TAG = 0x0112
+# orientations which swap the image width and height
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def read_orientation(data: bytes) -> int:
+    """
+    Read the EXIF orientation of an image from its header.
+
+    Args:
+        data (bytes): The image binary data.
+
+    Returns:
+        int: The EXIF orientation (1 to 8), 1 if the image has none.
+    """
+    try:
+        with Image.open(BytesIO(data)) as image:
+            orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+    except Exception:
+        return 1
+    return orientation if orientation in range(1, 9) else 1
+
+
+def oriented_size(width: int, height: int, orientation: int) -> tuple[int, int]:
+    """
+    The width and height of an image after applying its orientation.
+    """
+    if orientation in TRANSPOSED_ORIENTATIONS:
+        return height, width
+    return width, height
+
+
+def apply_orientation(image: np.ndarray, orientation: int) -> np.ndarray:
+    """
+    Apply an EXIF orientation to a decoded image.
+
+    Args:
+        image (np.ndarray): The decoded image, as stored.
+        orientation (int): The EXIF orientation.
+
+    Returns:
+        np.ndarray: The image as it should be displayed.
+    """
+    if orientation == 2:
+        return cv2.flip(image, 1)
+    if orientation == 3:
+        return cv2.rotate(image, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(image, 0)
+    if orientation == 5:
+        return cv2.transpose(image)
+    if orientation == 6:
+        return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.rotate(cv2.transpose(image), cv2.ROTATE_180)
+    if orientation == 8:
+        return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return image
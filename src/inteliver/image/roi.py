@@ -0,0 +1,70 @@
+"""
+    Region of interest windows
+
+    This module validates the selection windows operators run on, so
+        region operators only ever touch the pixels of their windows.
+"""
+
+Window = tuple[int, int, int, int]
+
+
+def clamp_window(window: Window, width: int, height: int) -> Window | None:
+    """
+    Clamp a (x1, y1, x2, y2) window to the image bounds.
+
+    Args:
+        window (Window): The window, it may extend beyond the image.
+        width (int): The image width.
+        height (int): The image height.
+
+    Returns:
+        Window | None: The clamped window, None if it is empty.
+    """
+    x1, y1, x2, y2 = window
+    x1, x2 = max(x1, 0), min(x2, width)
+    y1, y2 = max(y1, 0), min(y2, height)
+    if x1 >= x2 or y1 >= y2:
+        return None
+    return x1, y1, x2, y2
+
+
+def _overlap(a: Window, b: Window) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def merge_windows(windows: list[Window]) -> list[tuple[Window, list[Window]]]:
+    """
+    Group overlapping windows.
+
+    An operator runs once on the bounding box of each group, so the pixels
+        shared by overlapping windows (e.g. close faces) are processed only
+        once.
+
+    Args:
+        windows (list[Window]): The clamped windows.
+
+    Returns:
+        list[tuple[Window, list[Window]]]: The bounding box and the windows
+            of each group.
+    """
+    groups = [(window, [window]) for window in windows]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(groups)):
+            for j in range(i + 1, len(groups)):
+                if not _overlap(groups[i][0], groups[j][0]):
+                    continue
+                (a, a_windows), (b, b_windows) = groups[i], groups.pop(j)
+                box = (
+                    min(a[0], b[0]),
+                    min(a[1], b[1]),
+                    max(a[2], b[2]),
+                    max(a[3], b[3]),
+                )
+                groups[i] = (box, a_windows + b_windows)
+                merged = True
+                break
+            if merged:
+                break
+    return groups
@@ -1,14 +1,207 @@
-from fastapi import APIRouter, Depends
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from inteliver.auth.schemas import TokenData
+from inteliver.auth.service import AuthService
 from inteliver.database.dependencies import get_db
-from inteliver.image.schemas import ImageSource
+from inteliver.image.analysis import AnalysisService
+from inteliver.image.deadline import Deadline, run_until_deadline
+from inteliver.image.scheduler import Lane
+from inteliver.image.schemas import (
+    BatchRequest,
+    BatchResponse,
+    ImageAnalysisOut,
+    ImageSource,
+    TilePyramidOut,
+)
 from inteliver.image.service import ImageService
+from inteliver.image.tiles import DZI_MIME_TYPE, TileService
+from inteliver.metrics.timing import StageTimer, timed_streaming_response
+from inteliver.users.service import UserService
 
 router = APIRouter()
 
 
+@router.post("/batch", response_model=BatchResponse, tags=["Image Processor"])
+async def process_image_batch(
+    batch: BatchRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(AuthService.get_current_user),
+):
+    """
+    Process a batch of images with their specified commands.
+    the results are stored in the user storage.
+
+    Args:
+        batch (BatchRequest): The list of image sources and commands.
+        db (AsyncSession): The database session.
+        current_user (TokenData): The current authenticated user.
+
+    Returns:
+        BatchResponse: The stored object key or the error of each item.
+    """
+    return await ImageService.process_batch(db, current_user.sub, batch)
+
+
+@router.post(
+    "/tiles/{object_key}", response_model=TilePyramidOut, tags=["Image Tiles"]
+)
+async def generate_tiles(
+    object_key: str,
+    fmt: str = "jpeg",
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(AuthService.get_current_user),
+):
+    """
+    Eagerly generate the deep zoom tile pyramid of an image.
+
+    Args:
+        object_key (str): The key of the image.
+        fmt (str): The tile format (jpeg, jpg, png or webp).
+        db (AsyncSession): The database session.
+        current_user (TokenData): The current authenticated user.
+
+    Returns:
+        TilePyramidOut: The pyramid description.
+    """
+    cloudname = await UserService.get_cloudname(db, current_user.sub)
+    return await TileService.generate_pyramid_info(db, cloudname, object_key, fmt)
+
+
+@router.get("/{cloudname}/tiles/{object_key}.dzi", tags=["Image Tiles"])
+async def get_tiles_descriptor(
+    cloudname: str,
+    object_key: str,
+    fmt: str = "jpeg",
+    db: AsyncSession = Depends(get_db),
+) -> Response:
+    """
+    Get the deep zoom descriptor of an image tile pyramid.
+
+    Args:
+        cloudname (str): The user's cloud name.
+        object_key (str): The key of the image.
+        fmt (str): The tile format (jpeg, jpg, png or webp).
+
+    Returns:
+        Response: The DZI xml descriptor.
+    """
+    descriptor = await TileService.get_descriptor(db, cloudname, object_key, fmt)
+    return Response(content=descriptor, media_type=DZI_MIME_TYPE)
+
+
+@router.get(
+    "/{cloudname}/tiles/{object_key}/{level:int}/{x:int}_{y:int}.{fmt}",
+    tags=["Image Tiles"],
+)
+async def get_tile(
+    cloudname: str,
+    object_key: str,
+    level: int,
+    x: int,
+    y: int,
+    fmt: str,
+    db: AsyncSession = Depends(get_db),
+) -> StreamingResponse:
+    """
+    Get a deep zoom tile of an image.
+    the pyramid is generated on the first request.
+
+    Args:
+        cloudname (str): The user's cloud name.
+        object_key (str): The key of the image.
+        level (int): The deep zoom level.
+        x (int): The tile column.
+        y (int): The tile row.
+        fmt (str): The tile format (jpeg, jpg, png or webp).
+
+    Returns:
+        StreamingResponse: The tile image.
+    """
+    data, media_type = await TileService.get_tile(
+        db, cloudname, object_key, level, x, y, fmt
+    )
+    return StreamingResponse(data, media_type=media_type)
+
+
+@router.post(
+    "/analysis/{object_key}",
+    response_model=ImageAnalysisOut,
+    response_model_exclude_none=True,
+    tags=["Image Analysis"],
+)
+async def generate_analysis(
+    object_key: str,
+    features: str = "faces,objects",
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(AuthService.get_current_user),
+):
+    """
+    Eagerly analyze an image, the analysis is stored with the image.
+
+    Args:
+        object_key (str): The key of the image.
+        features (str): Comma separated analysis features (faces, objects).
+        db (AsyncSession): The database session.
+        current_user (TokenData): The current authenticated user.
+
+    Returns:
+        ImageAnalysisOut: The detected faces and objects.
+    """
+    cloudname = await UserService.get_cloudname(db, current_user.sub)
+    return await AnalysisService.analyze_image(
+        db,
+        cloudname,
+        object_key,
+        ImageSource.S3,
+        AnalysisService.parse_features(features),
+        lane=Lane.PRECOMPUTE,
+    )
+
+
+@router.get(
+    "/{cloudname}/analysis/{image_source}/{uri:path}",
+    response_model=ImageAnalysisOut,
+    response_model_exclude_none=True,
+    tags=["Image Analysis"],
+)
+async def analyze_image(
+    cloudname: str,
+    image_source: ImageSource,
+    uri: str,
+    request: Request,
+    features: str = "faces,objects",
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Detect the faces and objects of an image and return their boxes.
+    the analysis of s3 images is stored and reused.
+
+    Args:
+        cloudname (str): The user's cloud name.
+        image_source (ImageSource): Where the image is stored (s3 or http).
+        uri (str): The object key or the url of the image.
+        features (str): Comma separated analysis features (faces, objects).
+
+    Returns:
+        ImageAnalysisOut: The detected faces and objects.
+    """
+    deadline = Deadline.from_request(request)
+    return await run_until_deadline(
+        request,
+        AnalysisService.analyze_image(
+            db,
+            cloudname,
+            uri,
+            image_source,
+            AnalysisService.parse_features(features),
+            deadline=deadline,
+        ),
+        deadline,
+    )
+
+
 @router.get(
     "/{cloudname}/{commands:path}/s3/{object_key}",
     tags=["Image Processor"],
@@ -17,6 +210,7 @@ async def process_image_s3(
     cloudname: str,
     commands: str,
     object_key: str,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     # current_user: TokenData = Depends(AuthService.get_current_user),
 ) -> StreamingResponse:
@@ -32,14 +226,24 @@ async def process_image_s3(
     Returns:
         StreamingResponse: The modified image.
     """
-    data, media_type = await ImageService.process_image(
-        db=db,
-        cloudname=cloudname,
-        commands=commands,
-        uri=object_key,
-        image_source=ImageSource.S3,
+    timer = StageTimer()
+    deadline = Deadline.from_request(request)
+    data, media_type = await run_until_deadline(
+        request,
+        ImageService.process_image(
+            db=db,
+            cloudname=cloudname,
+            commands=commands,
+            uri=object_key,
+            image_source=ImageSource.S3,
+            timer=timer,
+            deadline=deadline,
+        ),
+        deadline,
+    )
+    return timed_streaming_response(
+        data, media_type, timer, cloudname=cloudname, commands=commands
     )
-    return StreamingResponse(data, media_type=media_type)
 
 
 @router.get(
@@ -50,6 +254,7 @@ async def process_image_http(
     cloudname: str,
     commands: str,
     url: str,
+    request: Request,
     db: AsyncSession = Depends(get_db),
 ) -> StreamingResponse:
     """
@@ -64,11 +269,21 @@ async def process_image_http(
     Returns:
         StreamingResponse: The modified image.
     """
-    data, media_type = await ImageService.process_image(
-        db=db,
-        cloudname=cloudname,
-        commands=commands,
-        uri=url,
-        image_source=ImageSource.HTTP,
+    timer = StageTimer()
+    deadline = Deadline.from_request(request)
+    data, media_type = await run_until_deadline(
+        request,
+        ImageService.process_image(
+            db=db,
+            cloudname=cloudname,
+            commands=commands,
+            uri=url,
+            image_source=ImageSource.HTTP,
+            timer=timer,
+            deadline=deadline,
+        ),
+        deadline,
+    )
+    return timed_streaming_response(
+        data, media_type, timer, cloudname=cloudname, commands=commands
     )
-    return StreamingResponse(data, media_type=media_type)
@@ -0,0 +1,175 @@
+"""
+    Saliency based crop gravity
+
+    The i_c_auto selector centers a crop on the most salient part of an
+        image without running a detection model. A spectral residual
+        saliency map is computed on a small thumbnail and the crop window
+        of the requested size which keeps the most saliency is found with
+        an integral image, a few milliseconds for any image size.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from inteliver.config import settings
+from inteliver.metrics.collectors import CACHE_REQUESTS
+
+# long side of the thumbnail the saliency is computed on
+SALIENCY_SIZE = 128
+# large images are subsampled to at most this many times the thumbnail
+# size before the area downscale, which is then cheap
+SALIENCY_PRESAMPLE = 4
+# windows keeping this close to the most saliency are equally good, the
+# one closest to the image center is picked
+SALIENCY_TOLERANCE = 0.01
+# pixels per side of the grid sampled to fingerprint an image
+FINGERPRINT_GRID = 64
+
+
+def saliency_map(thumbnail: np.ndarray) -> np.ndarray:
+    """
+    Spectral residual saliency of a grayscale thumbnail.
+
+    The log amplitude spectrum of natural images is smooth, what sticks
+        out of its local average (the spectral residual) corresponds to
+        the unexpected, salient parts of the image.
+
+    Args:
+        thumbnail (np.ndarray): The grayscale thumbnail.
+
+    Returns:
+        np.ndarray: The float32 saliency map with the thumbnail shape,
+            normalized to [0, 1].
+    """
+    # a flat image has no salient part, every window is as good
+    if np.ptp(thumbnail) == 0:
+        return np.zeros(thumbnail.shape, dtype=np.float32)
+    spectrum = np.fft.fft2(thumbnail.astype(np.float32))
+    log_amplitude = np.log(np.abs(spectrum) + 1e-8).astype(np.float32)
+    residual = log_amplitude - cv2.blur(log_amplitude, (3, 3))
+    energy = np.abs(np.fft.ifft2(np.exp(residual + 1j * np.angle(spectrum)))) ** 2
+    saliency = cv2.GaussianBlur(energy.astype(np.float32), (0, 0), 2.5)
+    return saliency / max(float(saliency.max()), 1e-12)
+
+
+def best_window(saliency: np.ndarray, width: int, height: int) -> tuple[int, int]:
+    """
+    The top left corner of the width x height window of a saliency map
+        which keeps the most saliency.
+
+    Args:
+        saliency (np.ndarray): The saliency map.
+        width (int): The window width, at most the map width.
+        height (int): The window height, at most the map height.
+
+    Returns:
+        tuple[int, int]: The x and y of the window corner.
+    """
+    integral = cv2.integral(saliency, sdepth=cv2.CV_64F)
+    # saliency of every window position at once
+    sums = (
+        integral[height:, width:]
+        - integral[:-height, width:]
+        - integral[height:, :-width]
+        + integral[:-height, :-width]
+    )
+    rows, cols = np.nonzero(sums >= sums.max() * (1 - SALIENCY_TOLERANCE))
+    center_y, center_x = (sums.shape[0] - 1) / 2, (sums.shape[1] - 1) / 2
+    nearest = np.argmin((rows - center_y) ** 2 + (cols - center_x) ** 2)
+    return int(cols[nearest]), int(rows[nearest])
+
+
+class SaliencyCrop:
+    """
+    SaliencyCrop class
+
+    Finds the crop gravity of the most salient window of an image. The
+        gravities are cached per image and window aspect ratio, the image
+        is identified by a fingerprint of a sparse grid of its pixels, so
+        repeated crops of an asset skip even the thumbnail.
+    """
+
+    _cache: OrderedDict[tuple, tuple[float, float]] = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(image: np.ndarray) -> str:
+        """
+        Identify an image by its shape and a sparse grid of its pixels.
+        """
+        height, width = image.shape[:2]
+        grid = image[
+            :: max(height // FINGERPRINT_GRID, 1), :: max(width // FINGERPRINT_GRID, 1)
+        ]
+        digest = hashlib.blake2b(np.ascontiguousarray(grid).data, digest_size=16)
+        digest.update(repr(image.shape).encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def gravity(image: np.ndarray, width: int, height: int) -> tuple[int, int]:
+        """
+        The center of the width x height crop window of an image which
+            keeps the most saliency, the window is kept inside the image.
+
+        Args:
+            image (np.ndarray): The image.
+            width (int): The crop window width.
+            height (int): The crop window height.
+
+        Returns:
+            tuple[int, int]: The x and y of the crop window center.
+        """
+        image_height, image_width = image.shape[:2]
+        scale = min(SALIENCY_SIZE / max(image_width, image_height), 1.0)
+        thumb_width = max(round(image_width * scale), 1)
+        thumb_height = max(round(image_height * scale), 1)
+        window_width = min(max(round(width * scale), 1), thumb_width)
+        window_height = min(max(round(height * scale), 1), thumb_height)
+
+        # windows of the same aspect ratio and size on the thumbnail share
+        # the gravity
+        key = (SaliencyCrop.fingerprint(image), window_width, window_height)
+        with SaliencyCrop._lock:
+            center = SaliencyCrop._cache.get(key)
+            if center is not None:
+                SaliencyCrop._cache.move_to_end(key)
+        CACHE_REQUESTS.inc(cache="saliency", result="miss" if center is None else "hit")
+
+        if center is None:
+            step = max(
+                max(image_width, image_height) // (SALIENCY_SIZE * SALIENCY_PRESAMPLE),
+                1,
+            )
+            thumbnail = cv2.resize(
+                image[::step, ::step],
+                (thumb_width, thumb_height),
+                interpolation=cv2.INTER_AREA,
+            )
+            if thumbnail.ndim == 3:
+                thumbnail = cv2.cvtColor(thumbnail[:, :, :3], cv2.COLOR_BGR2GRAY)
+            x, y = best_window(saliency_map(thumbnail), window_width, window_height)
+            # relative to the image, so the cached gravity scales back to it
+            center = (
+                (x + window_width / 2) / thumb_width,
+                (y + window_height / 2) / thumb_height,
+            )
+            with SaliencyCrop._lock:
+                SaliencyCrop._cache[key] = center
+                while len(SaliencyCrop._cache) > settings.image_saliency_cache_size:
+                    SaliencyCrop._cache.popitem(last=False)
+
+        return (
+            SaliencyCrop._inside(round(center[0] * image_width), width, image_width),
+            SaliencyCrop._inside(round(center[1] * image_height), height, image_height),
+        )
+
+    @staticmethod
+    def _inside(center: int, size: int, image_size: int) -> int:
+        # a window larger than the image is centered on it
+        if size >= image_size:
+            return image_size // 2
+        return min(max(center, size // 2), image_size - size + size // 2)
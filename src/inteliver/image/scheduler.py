@@ -0,0 +1,235 @@
+"""
+Fair scheduling of image work
+
+Image jobs are queued per priority lane and per cloudname, and the worker
+    threads always take the next job by weighted fair queuing: first
+    across the lanes, then across the cloudnames of the chosen lane. A
+    tenant running a bulk re-render only gets its share of the workers
+    and never starves the interactive traffic of the other tenants.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable
+
+from inteliver.config import settings
+from inteliver.metrics.collectors import IMAGE_QUEUE_WAIT_SECONDS
+
+
+class Lane(str, Enum):
+    INTERACTIVE = "interactive"
+    BATCH = "batch"
+    PRECOMPUTE = "precompute"
+
+
+@dataclass(frozen=True)
+class JobSchedule:
+    """
+    How an image job is scheduled.
+
+    Attributes:
+        cloudname (str): The tenant of the job.
+        lane (Lane): The priority lane of the job.
+        cost (float): The estimated cost of the job.
+        max_concurrency (int | None): The tenant concurrency cap (0 means
+            no cap), the image_tenant_max_concurrency settings apply if
+            not set.
+    """
+
+    cloudname: str = ""
+    lane: Lane = Lane.INTERACTIVE
+    cost: float = 1.0
+    max_concurrency: int | None = None
+
+
+@dataclass
+class Job:
+    func: Callable[[], Any]
+    future: Future
+    cloudname: str
+    lane: Lane
+    cost: float
+    max_concurrency: int
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+@dataclass
+class FairQueue:
+    """
+    A FIFO of jobs with its virtual time, the weighted amount of work it
+        has been served.
+    """
+
+    jobs: deque = field(default_factory=deque)
+    vtime: float = 0.0
+
+
+class FairScheduler:
+    """
+    FairScheduler class
+
+    A worker thread pool with weighted fair queuing (start-time fair
+        queuing) between priority lanes and between the cloudnames of a
+        lane. The lane and cloudname with the smallest virtual time is
+        served next. Serving a job advances both virtual times by the job
+        cost divided by their weight (image_lane_weights and
+        image_tenant_weights). A queue which becomes active starts at the
+        current virtual time, so idle tenants do not bank credit.
+
+    A cloudname never runs more jobs at once than its concurrency cap,
+        its queued jobs wait even if workers are idle.
+
+    Attributes:
+        max_workers (int): The number of worker threads.
+    """
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = ""):
+        self.max_workers = max_workers
+        self._cond = threading.Condition()
+        self._lanes: dict[Lane, dict[str, FairQueue]] = {lane: {} for lane in Lane}
+        self._lane_vtime = {lane: 0.0 for lane in Lane}
+        self._vclock = 0.0
+        self._lane_vclock = {lane: 0.0 for lane in Lane}
+        self._running: dict[str, int] = {}
+        self._queued = 0
+        self._shutdown = False
+        self._threads = [
+            threading.Thread(
+                target=self._worker, name=f"{thread_name_prefix}_{i}", daemon=True
+            )
+            for i in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, func: Callable[[], Any], schedule: JobSchedule) -> Future:
+        """
+        Queue a job.
+
+        Args:
+            func (Callable): The blocking function to run.
+            schedule (JobSchedule): How the job is scheduled.
+
+        Returns:
+            Future: The job future.
+        """
+        cloudname, lane = schedule.cloudname, schedule.lane
+        max_concurrency = schedule.max_concurrency
+        if max_concurrency is None:
+            max_concurrency = settings.image_tenant_max_concurrency.get(
+                cloudname, settings.image_default_tenant_max_concurrency
+            )
+        job = Job(
+            func, Future(), cloudname, lane, max(schedule.cost, 1e-6), max_concurrency
+        )
+
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new jobs after shutdown")
+            tenants = self._lanes[lane]
+            if not any(queue.jobs for queue in tenants.values()):
+                # the lane becomes active at the current virtual time
+                self._lane_vtime[lane] = max(self._lane_vtime[lane], self._vclock)
+            queue = tenants.get(cloudname)
+            if queue is None:
+                queue = tenants[cloudname] = FairQueue()
+            if not queue.jobs:
+                queue.vtime = max(queue.vtime, self._lane_vclock[lane])
+            queue.jobs.append(job)
+            self._queued += 1
+            self._cond.notify()
+        return job.future
+
+    def queue_depth(self) -> int:
+        """
+        Number of queued jobs.
+        """
+        return self._queued
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop the workers once the queued jobs are done.
+        """
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _runnable(self, queue: FairQueue) -> bool:
+        if not queue.jobs:
+            return False
+        job = queue.jobs[0]
+        cap = job.max_concurrency
+        return cap <= 0 or self._running.get(job.cloudname, 0) < cap
+
+    def _pop(self) -> Job | None:
+        best = None
+        for lane, tenants in self._lanes.items():
+            for cloudname, queue in tenants.items():
+                if not self._runnable(queue):
+                    continue
+                key = (self._lane_vtime[lane], queue.vtime)
+                if best is None or key < best[0]:
+                    best = (key, lane, cloudname, queue)
+        if best is None:
+            return None
+
+        _, lane, cloudname, queue = best
+        job = queue.jobs.popleft()
+        self._queued -= 1
+        self._vclock = self._lane_vtime[lane]
+        self._lane_vclock[lane] = queue.vtime
+        self._lane_vtime[lane] += job.cost / settings.image_lane_weights.get(
+            lane.value, 1.0
+        )
+        queue.vtime += job.cost / settings.image_tenant_weights.get(cloudname, 1.0)
+        # idle queues are dropped once the lane caught up with them, a
+        # tenant submitting again right away keeps its virtual time
+        for name in [
+            name
+            for name, idle in self._lanes[lane].items()
+            if not idle.jobs and idle.vtime <= self._lane_vclock[lane]
+        ]:
+            del self._lanes[lane][name]
+        self._running[cloudname] = self._running.get(cloudname, 0) + 1
+        return job
+
+    def _next_job(self) -> Job | None:
+        with self._cond:
+            while True:
+                job = self._pop()
+                if job is not None:
+                    return job
+                if self._shutdown and not self._queued:
+                    # the other waiting workers exit too
+                    self._cond.notify_all()
+                    return None
+                self._cond.wait()
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            IMAGE_QUEUE_WAIT_SECONDS.observe(
+                time.perf_counter() - job.enqueued_at, lane=job.lane.value
+            )
+            if job.future.set_running_or_notify_cancel():
+                try:
+                    result = job.func()
+                except BaseException as e:
+                    job.future.set_exception(e)
+                else:
+                    job.future.set_result(result)
+            with self._cond:
+                self._running[job.cloudname] -= 1
+                if not self._running[job.cloudname]:
+                    del self._running[job.cloudname]
+                # a capped job of this cloudname may be runnable now
+                self._cond.notify()
@@ -1,6 +1,60 @@
 from enum import Enum
 
+from pydantic import BaseModel, Field
+
 
 class ImageSource(str, Enum):
     S3 = "s3"
     HTTP = "http"
+
+
+class BatchItem(BaseModel):
+    source: ImageSource = ImageSource.S3
+    uri: str
+    commands: str
+
+
+class BatchRequest(BaseModel):
+    items: list[BatchItem] = Field(min_length=1)
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    uri: str
+    status_code: int
+    object_key: str | None = None
+    content_type: str | None = None
+    error: str | None = None
+
+
+class BatchResponse(BaseModel):
+    results: list[BatchItemResult]
+
+
+class TilePyramidOut(BaseModel):
+    object_key: str
+    width: int
+    height: int
+    levels: int
+    tile_size: int
+    overlap: int
+    format: str
+
+
+class AnalysisBox(BaseModel):
+    x1: int
+    y1: int
+    x2: int
+    y2: int
+    confidence: float
+
+
+class AnalysisObject(AnalysisBox):
+    label: str
+
+
+class ImageAnalysisOut(BaseModel):
+    width: int
+    height: int
+    faces: list[AnalysisBox] | None = None
+    objects: list[AnalysisObject] | None = None
@@ -1,20 +1,41 @@
+import asyncio
 from io import BytesIO
+from uuid import UUID
 
 import cv2
 import httpx
 import numpy as np
+from fastapi import HTTPException, status
+from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from inteliver.config import settings
+from inteliver.image.admission import AdmissionController, estimate_cost
+from inteliver.image.deadline import Deadline
 from inteliver.image.exceptions import (
+    BatchSizeExceededException,
     CloudnameNotExistsException,
     FetchImageURLException,
     ImageDecodeException,
     ImageProcessorException,
 )
+from inteliver.image.executor import ImageExecutor
 from inteliver.image.image_processor import ImageProcessor
-from inteliver.image.schemas import ImageSource
+from inteliver.image.lossless import LosslessJpeg
+from inteliver.image.orientation import apply_orientation, read_orientation
+from inteliver.image.scheduler import JobSchedule, Lane
+from inteliver.image.schemas import (
+    BatchItem,
+    BatchItemResult,
+    BatchRequest,
+    BatchResponse,
+    ImageSource,
+)
+from inteliver.metrics.collectors import IMAGE_DECODED_PIXELS
+from inteliver.metrics.timing import StageTimer
 from inteliver.storage.service import StorageService
 from inteliver.users.exceptions import UserNotFoundException
+from inteliver.users.schemas import UserOut
 from inteliver.users.service import UserService
 
 
@@ -26,6 +47,8 @@ class ImageService:
         commands: str,
         uri: str,
         image_source: ImageSource,
+        timer: StageTimer | None = None,
+        deadline: Deadline | None = None,
     ):
         """
         Process an image with specified commands.
@@ -35,9 +58,18 @@ class ImageService:
             commands (str): The commands to apply to the image.
             uri (str): The url or object key of the image.
             db (AsyncSession): The database session.
+            timer (StageTimer): The request timer, a new one is used if
+                not given.
+            deadline (Deadline): The request deadline, checked between
+                the stages.
 
         Returns:
             BytesIO: The modified image.
+
+        Raises:
+            ServiceOverloadedException: If the image worker pool is
+                saturated.
+            DeadlineExceededException: If the deadline passed.
         """
         # 1. check structure format of the url: (IT IS CHECKED BY THE FASTAPI PYDANTIC)
         # example: /{cloudname}/{commands}/{object_id}
@@ -55,44 +87,243 @@ class ImageService:
         # 9. set any custome response headers, like cache control
         # 10. return the the data using FastAPI StreamingReponse
 
+        timer = timer or StageTimer()
+        deadline = deadline or Deadline()
+
         # Check if the cloudname exists and get the user information
+        with timer.stage("cloudname"):
+            user = await ImageService.check_cloudname(db, cloudname)
+
+        # TODO check the commands validity
+
+        # Fetch the image from MinIO or the web
+        with timer.stage("fetch") as stage:
+            data, image_format = await ImageService.fetch_image(
+                cloudname, uri, image_source
+            )
+            stage["nbytes"] = data.getbuffer().nbytes
+        deadline.check()
+
+        # Decode, apply the commands and encode on the worker pool, unless
+        # the pool is saturated
+        schedule = JobSchedule(
+            cloudname=cloudname,
+            lane=Lane.INTERACTIVE,
+            cost=estimate_cost(data, commands),
+            max_concurrency=user.image_max_concurrency,
+        )
+        modified_image_encoded, image_format = await AdmissionController.run(
+            schedule,
+            ImageService.render_image,
+            data,
+            commands,
+            image_format,
+            timer,
+            deadline,
+        )
+
+        return BytesIO(modified_image_encoded), image_format
+
+    @staticmethod
+    async def check_cloudname(db: AsyncSession, cloudname: str) -> UserOut:
+        """
+        Check that a cloudname exists.
+
+        Args:
+            db (AsyncSession): The database session.
+            cloudname (str): The user's cloud name.
+
+        Returns:
+            UserOut: The user of the cloudname.
+
+        Raises:
+            CloudnameNotExistsException: If no user has this cloudname.
+        """
         try:
-            _user = await UserService.get_user_by_cloudname(db, cloudname)
+            return await UserService.get_user_by_cloudname(db, cloudname)
         except UserNotFoundException as e:
             raise CloudnameNotExistsException(
                 detail=f"The requested cloudname {cloudname} does not exists. detail: {str(e)}"
             )
 
-        # TODO check the commands validity
+    @staticmethod
+    async def process_batch(
+        db: AsyncSession,
+        uid: UUID,
+        batch: BatchRequest,
+    ) -> BatchResponse:
+        """
+        Process a batch of images and store the results in the user storage.
+
+        Sources are fetched concurrently (bounded by
+            image_batch_fetch_concurrency) and rendered on the worker pool
+            on the batch lane. At most one item per pool worker is rendered
+            at once, so a large batch never sheds its own items. Each item
+            is admitted like a single render, so an item is shed with a 503
+            result when the pool is saturated by other requests. The
+            results are stored like uploaded images. A failing item does
+            not fail the batch, its error is reported in the item result
+            instead.
+
+        Args:
+            db (AsyncSession): The database session.
+            uid (UUID): The current authenticated user id.
+            batch (BatchRequest): The batch items to process.
+
+        Returns:
+            BatchResponse: The per item results in the request order.
+        """
+        if len(batch.items) > settings.image_batch_max_items:
+            raise BatchSizeExceededException(
+                detail=f"Batch requests are limited to {settings.image_batch_max_items} items."
+            )
+
+        cloudname = await UserService.get_cloudname(db, uid)
+        user = await ImageService.check_cloudname(db, cloudname)
+        fetch_semaphore = asyncio.Semaphore(settings.image_batch_fetch_concurrency)
+        render_semaphore = asyncio.Semaphore(ImageExecutor.pool_size())
+
+        async def process_item(index: int, item: BatchItem) -> BatchItemResult:
+            try:
+                async with fetch_semaphore:
+                    data, image_format = await ImageService.fetch_image(
+                        cloudname, item.uri, item.source
+                    )
+                schedule = JobSchedule(
+                    cloudname=cloudname,
+                    lane=Lane.BATCH,
+                    cost=estimate_cost(data, item.commands),
+                    max_concurrency=user.image_max_concurrency,
+                )
+                async with render_semaphore:
+                    encoded, image_format = await AdmissionController.run(
+                        schedule,
+                        ImageService.render_image,
+                        data,
+                        item.commands,
+                        image_format,
+                    )
+                uploaded = await StorageService.upload_image_data(
+                    uid, cloudname, BytesIO(encoded), len(encoded)
+                )
+            except HTTPException as e:
+                return BatchItemResult(
+                    index=index,
+                    uri=item.uri,
+                    status_code=e.status_code,
+                    error=str(e.detail),
+                )
+            except Exception as e:
+                logger.error(f"Batch item {index} ({item.uri}) failed: {str(e)}")
+                return BatchItemResult(
+                    index=index,
+                    uri=item.uri,
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    error=str(e),
+                )
+
+            return BatchItemResult(
+                index=index,
+                uri=item.uri,
+                status_code=status.HTTP_200_OK,
+                object_key=uploaded.object_key,
+                content_type=image_format,
+            )
+
+        results = await asyncio.gather(
+            *(process_item(index, item) for index, item in enumerate(batch.items))
+        )
+        return BatchResponse(results=list(results))
+
+    @staticmethod
+    async def fetch_image(
+        cloudname: str,
+        uri: str,
+        image_source: ImageSource,
+    ) -> tuple[BytesIO, str]:
+        """
+        Fetch the source image data from its storage.
 
+        Args:
+            cloudname (str): The user's cloud name.
+            uri (str): The url or object key of the image.
+            image_source (ImageSource): Where the image is stored.
+
+        Returns:
+            tuple[BytesIO, str]: The image binary data and its content type.
+        """
         # TODO get user active storage endpoint
         # currently we only have one main s3 storage endpoint
         image_retreivers = {
             ImageSource.S3: StorageService.retrieve_image_by_cloudname,
             ImageSource.HTTP: ImageService.retrieve_image_by_url,
         }
-        # Fetch the image from MinIO
         data, headers = await image_retreivers[image_source](cloudname, uri)
-        image_format = str(headers.get("Content-Type"))
+        return data, str(headers.get("Content-Type"))
+
+    @staticmethod
+    def render_image(
+        data: BytesIO,
+        commands: str,
+        image_format: str,
+        timer: StageTimer | None = None,
+        deadline: Deadline | None = None,
+    ) -> tuple[bytes, str]:
+        """
+        Decode the image data, apply the commands and encode the result.
+
+        This is the cpu bound part of an image request and is meant to run
+            on the ImageExecutor worker pool.
+
+        Args:
+            data (BytesIO): The source image binary data.
+            commands (str): The commands to apply.
+            image_format (str): The source image format.
+            timer (StageTimer): Optional request timer.
+            deadline (Deadline): Optional request deadline, the work is
+                abandoned between two stages once it passed.
+
+        Returns:
+            tuple[bytes, str]: The encoded image and its format.
+        """
+        timer = timer or StageTimer()
+        deadline = deadline or Deadline()
+        # the job may have waited for a worker past the deadline
+        deadline.check()
+
+        # geometry only commands on jpeg images skip the pixel decode
+        if settings.image_lossless_jpeg and LosslessJpeg.available():
+            with timer.stage("lossless") as stage:
+                result = LosslessJpeg.render(data.getvalue(), commands)
+                if result is not None:
+                    stage["nbytes"] = len(result[0])
+            if result is not None:
+                return result
+
         # Convert image to numpy
-        image = ImageService._convert_bytes_to_numpy(data)
+        with timer.stage("decode") as stage:
+            image = ImageService._convert_bytes_to_numpy(data)
+            stage["nbytes"] = image.nbytes
 
         # Apply the commands to the image
-
         modified_image, image_format = ImageService.apply_commands(
-            image,
-            commands,
-            image_format,
+            image, commands, image_format, timer, deadline
         )
 
         # encode image data with the image format
-        modified_image_encoded = ImageService.imencode(modified_image, image_format)
-
-        return BytesIO(modified_image_encoded), image_format
+        deadline.check()
+        with timer.stage("encode") as stage:
+            encoded = ImageService.imencode(modified_image, image_format)
+            stage["nbytes"] = len(encoded)
+        return encoded, image_format
 
     @staticmethod
     def apply_commands(
-        image: np.ndarray, commands: str, image_format: str
+        image: np.ndarray,
+        commands: str,
+        image_format: str,
+        timer: StageTimer | None = None,
+        deadline: Deadline | None = None,
     ) -> tuple[np.ndarray, str]:
         """
         Apply the specified commands to the image.
@@ -101,11 +332,14 @@ class ImageService:
             image (np.ndarray): The image data to modify.
             commands (str): The commands to apply.
             image_format: The originam image format.
+            timer (StageTimer): Optional request timer.
+            deadline (Deadline): Optional request deadline, checked before
+                each command.
 
         Returns:
             Image.Image: The modified image.
         """
-        image_processor = ImageProcessor()
+        image_processor = ImageProcessor(timer, deadline)
         # Split the commands and apply each one
         command_list = commands.split("/")
         subcommands_list = [cmd.split(",") for cmd in command_list]
@@ -178,14 +412,20 @@ class ImageService:
     @staticmethod
     def _convert_bytes_to_numpy(data: BytesIO) -> np.ndarray:
         # Convert image to numpy
+        raw = data.read()
         try:
-            image_np_array = np.frombuffer(data.read(), np.uint8)
+            image_np_array = np.frombuffer(raw, np.uint8)
             image = cv2.imdecode(image_np_array, cv2.IMREAD_UNCHANGED)
 
         except Exception as e:
             raise ImageDecodeException(
                 detail=f"Can not decode image data (cv2): {str(e)}"
             )
+        if image is None:
+            raise ImageDecodeException
+        IMAGE_DECODED_PIXELS.inc(image.shape[0] * image.shape[1])
+        if settings.image_auto_orient:
+            image = apply_orientation(image, read_orientation(raw))
         return image
 
     @staticmethod
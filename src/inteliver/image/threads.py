@@ -0,0 +1,158 @@
+"""
+Thread budget
+
+OpenCV, the BLAS library of numpy and torch each start a thread pool with
+    one thread per core, and every image worker thread calls into them. On
+    a large node that multiplies into hundreds of runnable threads. The
+    thread budget gives every image worker thread its share of the cpus,
+    so the whole process runs about one busy thread per core.
+
+The BLAS thread counts are read from the environment when numpy is first
+    imported, configure_environment must run before that (the inteliver
+    run command does). Later they can only be changed with the optional
+    threadpoolctl package.
+"""
+
+import os
+import sys
+
+from loguru import logger
+
+from inteliver.config import settings
+from inteliver.metrics.collectors import THREAD_BUDGET
+
+# environment variables read by the BLAS and OpenMP runtimes on load
+BLAS_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+
+def available_cpus() -> int:
+    """
+    Number of cpus the process may run on.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+class ThreadBudget:
+    """
+    ThreadBudget class
+
+    Sizes the thread pools of the native libraries from the cpus of the
+        process and the image worker pool size. A library setting of 0
+        gives it cpus // pool size threads, at least one.
+
+    Attributes:
+        cpus (int | None): The cpus of the process, detected if None. A
+            pre-forked worker sets its share of the cpus.
+    """
+
+    cpus: int | None = None
+    _blas_env_configured: bool = False
+
+    @classmethod
+    def pool_size(cls) -> int:
+        """
+        Number of image worker threads.
+        """
+        return settings.image_worker_pool_size or cls.total_cpus()
+
+    @classmethod
+    def total_cpus(cls) -> int:
+        return cls.cpus or available_cpus()
+
+    @classmethod
+    def library_threads(cls, configured: int) -> int:
+        """
+        Threads of one library call, the configured value or the share of
+            one image worker thread.
+        """
+        if configured > 0:
+            return configured
+        return max(cls.total_cpus() // cls.pool_size(), 1)
+
+    @classmethod
+    def configure_environment(cls):
+        """
+        Set the BLAS thread counts for the libraries loaded from now on,
+            variables already set in the environment are kept.
+        """
+        if "numpy" not in sys.modules:
+            cls._blas_env_configured = True
+        threads = str(cls.library_threads(settings.image_blas_threads))
+        for name in BLAS_ENV_VARS:
+            os.environ.setdefault(name, threads)
+
+    @classmethod
+    def apply(cls) -> dict[str, int]:
+        """
+        Apply the thread budget to the loaded libraries, log the effective
+            thread counts and expose them as metrics.
+
+        Returns:
+            dict[str, int]: The effective thread counts by library.
+        """
+        cls.configure_environment()
+        import cv2
+
+        cv2.setNumThreads(cls.library_threads(settings.image_opencv_threads))
+        budget = {
+            "image_pool": cls.pool_size(),
+            "opencv": cv2.getNumThreads(),
+            "blas": cls._apply_blas(),
+        }
+        if "torch" in sys.modules:
+            budget.update(cls.apply_torch())
+
+        for library, threads in budget.items():
+            THREAD_BUDGET.set(threads, library=library)
+        logger.info(
+            f"Thread budget on {cls.total_cpus()} cpus: "
+            + ", ".join(f"{library}={threads}" for library, threads in budget.items())
+        )
+        return budget
+
+    @classmethod
+    def apply_torch(cls) -> dict[str, int]:
+        """
+        Apply the thread budget to torch, once it is imported.
+
+        Returns:
+            dict[str, int]: The effective torch thread counts.
+        """
+        import torch
+
+        torch.set_num_threads(cls.library_threads(settings.image_torch_threads))
+        try:
+            torch.set_num_interop_threads(settings.image_torch_interop_threads)
+        except RuntimeError:
+            # only possible before the first inter-op parallel work
+            pass
+        budget = {
+            "torch_intra_op": torch.get_num_threads(),
+            "torch_inter_op": torch.get_num_interop_threads(),
+        }
+        for library, threads in budget.items():
+            THREAD_BUDGET.set(threads, library=library)
+        return budget
+
+    @classmethod
+    def _apply_blas(cls) -> int:
+        threads = cls.library_threads(settings.image_blas_threads)
+        try:
+            from threadpoolctl import threadpool_limits
+        except ImportError:
+            if not cls._blas_env_configured:
+                logger.warning(
+                    "numpy was loaded before the thread budget, its BLAS "
+                    "threads follow the environment it was loaded with"
+                )
+            return int(os.environ.get("OPENBLAS_NUM_THREADS", threads))
+        threadpool_limits(limits=threads, user_api="blas")
+        return threads
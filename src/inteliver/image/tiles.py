@@ -0,0 +1,372 @@
+import asyncio
+import math
+from io import BytesIO
+from xml.etree import ElementTree
+
+import cv2
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from inteliver.config import settings
+from inteliver.image.admission import AdmissionController, estimate_cost
+from inteliver.image.constants import TILE_FORMATS
+from inteliver.image.exceptions import (
+    TileNotFoundException,
+    UnsupportedTileFormatException,
+)
+from inteliver.image.scheduler import JobSchedule, Lane
+from inteliver.image.schemas import ImageSource, TilePyramidOut
+from inteliver.image.service import ImageService
+from inteliver.metrics.collectors import CACHE_REQUESTS
+from inteliver.storage.exceptions import S3ErrorObjectNotFoundException
+from inteliver.storage.service import StorageService
+
+DZI_MIME_TYPE = "application/xml"
+DZI_NAMESPACE = "http://schemas.microsoft.com/deepzoom/2008"
+# maximum number of concurrent tile uploads of one pyramid
+TILE_UPLOAD_CONCURRENCY = 16
+
+
+class TileService:
+    """
+    TileService class
+
+    Deep zoom tile pyramids. The pyramid of an asset is rendered once,
+        either lazily on the first tile or descriptor request or eagerly,
+        and stored next to the asset as '{object_key}_files/{level}/{x}_{y}.{fmt}'.
+        Later requests are served as plain objects from the storage and
+        never decode the full image again.
+
+    Attributes:
+        _locks (dict): Generation locks per (cloudname, object_key, fmt),
+            so concurrent tile requests render a pyramid only once.
+    """
+
+    _locks: dict[tuple[str, str, str], asyncio.Lock] = {}
+
+    @staticmethod
+    def tile_key(object_key: str, level: int, x: int, y: int, fmt: str) -> str:
+        return f"{StorageService.derived_prefix(object_key)}{level}/{x}_{y}.{fmt}"
+
+    @staticmethod
+    def descriptor_key(object_key: str, fmt: str) -> str:
+        return f"{StorageService.derived_prefix(object_key)}{fmt}.dzi"
+
+    @staticmethod
+    def max_level(width: int, height: int) -> int:
+        """
+        The deep zoom level of the full resolution image.
+        """
+        return math.ceil(math.log2(max(width, height, 1)))
+
+    @staticmethod
+    async def get_tile(
+        db: AsyncSession,
+        cloudname: str,
+        object_key: str,
+        level: int,
+        x: int,
+        y: int,
+        fmt: str,
+    ) -> tuple[BytesIO, str]:
+        """
+        Get a tile of an asset, rendering the asset pyramid if needed.
+
+        Args:
+            db (AsyncSession): The database session.
+            cloudname (str): The user's cloud name.
+            object_key (str): The key of the source image.
+            level (int): The deep zoom level.
+            x (int): The tile column.
+            y (int): The tile row.
+            fmt (str): The tile format (jpeg, jpg, png or webp).
+
+        Returns:
+            tuple[BytesIO, str]: The tile binary data and its media type.
+        """
+        mime_type = TileService._mime_type(fmt)
+        user = await ImageService.check_cloudname(db, cloudname)
+
+        key = TileService.tile_key(object_key, level, x, y, fmt)
+        try:
+            data, _ = await StorageService.retrieve_image_by_cloudname(cloudname, key)
+            CACHE_REQUESTS.inc(cache="tile_pyramid", result="hit")
+            return data, mime_type
+        except S3ErrorObjectNotFoundException:
+            CACHE_REQUESTS.inc(cache="tile_pyramid", result="miss")
+
+        objects = await TileService.generate_pyramid(
+            cloudname,
+            object_key,
+            fmt,
+            Lane.INTERACTIVE,
+            user.image_max_concurrency,
+            keep={key},
+        )
+        if key in objects:
+            return BytesIO(objects[key]), mime_type
+        if objects:
+            raise TileNotFoundException
+        # the pyramid was rendered by a concurrent request
+        try:
+            data, _ = await StorageService.retrieve_image_by_cloudname(cloudname, key)
+        except S3ErrorObjectNotFoundException:
+            raise TileNotFoundException
+        return data, mime_type
+
+    @staticmethod
+    async def get_descriptor(
+        db: AsyncSession,
+        cloudname: str,
+        object_key: str,
+        fmt: str,
+    ) -> str:
+        """
+        Get the deep zoom (.dzi) descriptor of an asset pyramid.
+
+        Args:
+            db (AsyncSession): The database session.
+            cloudname (str): The user's cloud name.
+            object_key (str): The key of the source image.
+            fmt (str): The tile format.
+
+        Returns:
+            str: The DZI xml descriptor.
+        """
+        TileService._mime_type(fmt)
+        user = await ImageService.check_cloudname(db, cloudname)
+
+        key = TileService.descriptor_key(object_key, fmt)
+        objects = await TileService.generate_pyramid(
+            cloudname, object_key, fmt, Lane.INTERACTIVE, user.image_max_concurrency
+        )
+        if key in objects:
+            return objects[key].decode()
+        data, _ = await StorageService.retrieve_image_by_cloudname(cloudname, key)
+        return data.read().decode()
+
+    @staticmethod
+    async def generate_pyramid(
+        cloudname: str,
+        object_key: str,
+        fmt: str,
+        lane: Lane = Lane.PRECOMPUTE,
+        max_concurrency: int | None = None,
+        keep: set[str] | None = None,
+    ) -> dict[str, bytes]:
+        """
+        Render and store the tile pyramid of an asset if it does not exist.
+
+        The pyramid is rendered and uploaded level by level, from the full
+            resolution down, so only the tiles of one level are held in
+            memory. Every rendering job goes through admission control.
+            The descriptor is stored last and marks a complete pyramid.
+
+        Args:
+            cloudname (str): The user's cloud name.
+            object_key (str): The key of the source image.
+            fmt (str): The tile format.
+            lane (Lane): The scheduling lane of the rendering, interactive
+                if a viewer waits for a tile.
+            max_concurrency (int | None): The concurrency cap of the user.
+            keep (set[str] | None): Keys of the tiles to return, e.g. the
+                tile a viewer waits for.
+
+        Returns:
+            dict[str, bytes]: The kept tiles and the descriptor by key,
+                empty if the pyramid already existed.
+        """
+        lock_key = (cloudname, object_key, fmt)
+        lock = TileService._locks.setdefault(lock_key, asyncio.Lock())
+        async with lock:
+            try:
+                if await TileService._pyramid_exists(cloudname, object_key, fmt):
+                    return {}
+
+                data, _ = await ImageService.fetch_image(
+                    cloudname, object_key, ImageSource.S3
+                )
+                cost = estimate_cost(data, "")
+
+                def schedule(level_cost: float) -> JobSchedule:
+                    return JobSchedule(
+                        cloudname=cloudname,
+                        lane=lane,
+                        cost=level_cost,
+                        max_concurrency=max_concurrency,
+                    )
+
+                level_image = await AdmissionController.run(
+                    schedule(cost), ImageService._convert_bytes_to_numpy, data
+                )
+                del data
+                height, width = level_image.shape[:2]
+
+                # the bucket is checked once, not for every tile
+                await StorageService.ensure_bucket(cloudname)
+                mime_type = TileService._mime_type(fmt)
+                upload_semaphore = asyncio.Semaphore(TILE_UPLOAD_CONCURRENCY)
+
+                async def upload(key: str, tile: bytes):
+                    async with upload_semaphore:
+                        await StorageService.store_image_by_cloudname(
+                            cloudname,
+                            tile,
+                            mime_type,
+                            object_key=key,
+                            check_bucket=False,
+                        )
+
+                objects: dict[str, bytes] = {}
+                for level in range(TileService.max_level(width, height), -1, -1):
+                    # a level costs its share of the full resolution pixels
+                    level_height, level_width = level_image.shape[:2]
+                    level_cost = cost * level_width * level_height / (width * height)
+                    tiles, level_image = await AdmissionController.run(
+                        schedule(level_cost),
+                        TileService.build_level,
+                        level_image,
+                        object_key,
+                        fmt,
+                        level,
+                        settings.image_tile_size,
+                        settings.image_tile_overlap,
+                    )
+                    await asyncio.gather(
+                        *(upload(key, tile) for key, tile in tiles.items())
+                    )
+                    objects.update(
+                        (key, tiles[key]) for key in (keep or ()) if key in tiles
+                    )
+
+                descriptor_key = TileService.descriptor_key(object_key, fmt)
+                descriptor = TileService.build_descriptor(width, height, fmt).encode()
+                await StorageService.store_image_by_cloudname(
+                    cloudname,
+                    descriptor,
+                    DZI_MIME_TYPE,
+                    object_key=descriptor_key,
+                    check_bucket=False,
+                )
+                objects[descriptor_key] = descriptor
+                return objects
+            finally:
+                TileService._locks.pop(lock_key, None)
+
+    @staticmethod
+    async def generate_pyramid_info(
+        db: AsyncSession,
+        cloudname: str,
+        object_key: str,
+        fmt: str,
+    ) -> TilePyramidOut:
+        """
+        Eagerly generate the pyramid of an asset and describe it.
+        """
+        TileService._mime_type(fmt)
+        user = await ImageService.check_cloudname(db, cloudname)
+        await TileService.generate_pyramid(
+            cloudname, object_key, fmt, Lane.PRECOMPUTE, user.image_max_concurrency
+        )
+        data, _ = await StorageService.retrieve_image_by_cloudname(
+            cloudname, TileService.descriptor_key(object_key, fmt)
+        )
+        descriptor = ElementTree.fromstring(data.read())
+        size = descriptor.find(f"{{{DZI_NAMESPACE}}}Size")
+        attributes = (
+            size is not None and size.get("Width"),
+            size is not None and size.get("Height"),
+            descriptor.get("TileSize"),
+            descriptor.get("Overlap"),
+        )
+        if not all(attributes):
+            raise TileNotFoundException(detail="Invalid tile pyramid descriptor")
+        width, height, tile_size, overlap = (int(str(value)) for value in attributes)
+        return TilePyramidOut(
+            object_key=object_key,
+            width=width,
+            height=height,
+            levels=TileService.max_level(width, height) + 1,
+            tile_size=tile_size,
+            overlap=overlap,
+            format=fmt,
+        )
+
+    @staticmethod
+    def build_level(
+        level_image: np.ndarray,
+        object_key: str,
+        fmt: str,
+        level: int,
+        tile_size: int,
+        overlap: int,
+    ) -> tuple[dict[str, bytes], np.ndarray]:
+        """
+        Render the tiles of one level of an image pyramid.
+
+        The level is cut into tiles by slicing and downscaled with area
+            interpolation into the next level, so the full image is
+            decoded only once for the whole pyramid.
+
+        Args:
+            level_image (np.ndarray): The image of the level.
+            object_key (str): The key of the source image.
+            fmt (str): The tile format.
+            level (int): The deep zoom level.
+            tile_size (int): The tile size in pixels, without overlap.
+            overlap (int): The number of overlapping pixels on each side.
+
+        Returns:
+            tuple[dict[str, bytes], np.ndarray]: The encoded tiles by key
+                and the image of the next level, the same image for the
+                last level.
+        """
+        image_format = TILE_FORMATS[fmt]
+        level_height, level_width = level_image.shape[:2]
+        tiles = {}
+        for y in range(math.ceil(level_height / tile_size)):
+            y1 = max(y * tile_size - overlap, 0)
+            y2 = min((y + 1) * tile_size + overlap, level_height)
+            for x in range(math.ceil(level_width / tile_size)):
+                x1 = max(x * tile_size - overlap, 0)
+                x2 = min((x + 1) * tile_size + overlap, level_width)
+                key = TileService.tile_key(object_key, level, x, y, fmt)
+                tiles[key] = ImageService.imencode(
+                    level_image[y1:y2, x1:x2], image_format
+                )
+        if level > 0:
+            level_image = cv2.resize(
+                level_image,
+                (math.ceil(level_width / 2), math.ceil(level_height / 2)),
+                interpolation=cv2.INTER_AREA,
+            )
+        return tiles, level_image
+
+    @staticmethod
+    def build_descriptor(width: int, height: int, fmt: str) -> str:
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<Image xmlns="{DZI_NAMESPACE}" '
+            f'TileSize="{settings.image_tile_size}" '
+            f'Overlap="{settings.image_tile_overlap}" Format="{fmt}">'
+            f'<Size Width="{width}" Height="{height}"/>'
+            "</Image>"
+        )
+
+    @staticmethod
+    async def _pyramid_exists(cloudname: str, object_key: str, fmt: str) -> bool:
+        try:
+            await StorageService.retrieve_image_by_cloudname(
+                cloudname, TileService.descriptor_key(object_key, fmt)
+            )
+        except S3ErrorObjectNotFoundException:
+            return False
+        return True
+
+    @staticmethod
+    def _mime_type(fmt: str) -> str:
+        if fmt not in TILE_FORMATS:
+            raise UnsupportedTileFormatException(
+                detail=f"Unsupported tile format {fmt}, use one of {list(TILE_FORMATS)}"
+            )
+        return TILE_FORMATS[fmt].split(";")[0]
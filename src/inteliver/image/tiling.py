@@ -0,0 +1,115 @@
+"""
+    Band-wise image processing
+
+    This module runs tile-safe operators over horizontal bands of an image
+        so very large images never need a full-size intermediate per
+        operator.
+"""
+
+from typing import Callable
+
+import numpy as np
+
+from inteliver.config import settings
+
+# minimum number of rows of a band, excluding the halo rows
+MIN_BAND_HEIGHT = 16
+
+
+def memory_budget() -> int:
+    """
+    The per request memory budget for operator intermediates in bytes.
+    """
+    return settings.image_memory_budget_mb * 1024 * 1024
+
+
+def should_tile(image: np.ndarray) -> bool:
+    """
+    Check if an operator on the whole image should run band-wise.
+
+    An operator needs the input plus at least one full-size output, the
+        image is tiled if that does not fit in the memory budget. Tiled,
+        the operator output is written back into the image, so only the
+        bands and their temporaries come on top of it.
+
+    Args:
+        image (np.ndarray): The image the operator is applied on.
+
+    Returns:
+        bool: True if the operator should run band-wise.
+    """
+    return 2 * image.nbytes > memory_budget()
+
+
+def band_height(image: np.ndarray, halo: int, align: int = 1) -> int:
+    """
+    Number of rows of each band, so a band and its temporaries fit in a
+        fraction of the memory budget. A band is at least as high as the
+        halo, so a band only reads the rows of its neighbour bands.
+
+    Args:
+        image (np.ndarray): The image to split into bands.
+        halo (int): Number of extra rows read above and below each band.
+        align (int): The band height is a multiple of it.
+
+    Returns:
+        int: The band height in rows.
+    """
+    row_bytes = image.nbytes // image.shape[0]
+    rows = memory_budget() // (4 * row_bytes) - 2 * halo
+    rows = max(rows, MIN_BAND_HEIGHT, halo)
+    # rounded up to the alignment, rounding down could go under the halo
+    return -(-rows // align) * align
+
+
+def process_in_bands(
+    image: np.ndarray,
+    op: Callable[[np.ndarray], np.ndarray],
+    halo: int = 0,
+    align: int = 1,
+) -> np.ndarray:
+    """
+    Apply an operator on horizontal bands of an image.
+
+    Each band is extended by halo rows of real neighbours, so an operator
+        with a kernel radius up to the halo gives the same result as on
+        the whole image. The output rows of a band are written back into
+        the image once the next band has read its halo rows, so the image
+        is modified in place and no full-size output is allocated. Only an
+        operator changing the number of channels or the dtype, or a read
+        only image, needs a new output image.
+
+    Args:
+        image (np.ndarray): The input image.
+        op (Callable): The operator, it must keep the band width and height
+            but may change the number of channels.
+        halo (int): Number of extra rows passed above and below each band.
+        align (int): Bands start at multiples of this value, for operators
+            working on a fixed block grid.
+
+    Returns:
+        np.ndarray: The output image, the input image itself if it was
+            modified in place.
+    """
+    height = image.shape[0]
+    rows = band_height(image, halo, align)
+    output = image
+    # the output rows of the previous band, not written back yet
+    pending: tuple[int, int, np.ndarray] | None = None
+    for y1 in range(0, height, rows):
+        y2 = min(y1 + rows, height)
+        top = max(y1 - halo, 0)
+        bottom = min(y2 + halo, height)
+        band = op(image[top:bottom])
+        if output is image and (
+            band.shape[1:] != image.shape[1:]
+            or band.dtype != image.dtype
+            or not image.flags.writeable
+        ):
+            output = np.empty((height, *band.shape[1:]), dtype=band.dtype)
+        if pending is not None:
+            output[pending[0] : pending[1]] = pending[2]
+        pending = (y1, y2, band[y1 - top : y2 - top])
+    if pending is not None:
+        output[pending[0] : pending[1]] = pending[2]
+    return output
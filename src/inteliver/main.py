@@ -10,6 +10,7 @@ from fastapi import FastAPI
 
 from inteliver.config import settings
 from inteliver.constants import SERVICE_DESCRIPTION, SERVICE_SUMMARY, SERVICE_TITLE
+from inteliver.metrics.middleware import MetricsMiddleware
 from inteliver.routers import register_routers
 from inteliver.utils.lifespan import lifespan
 from inteliver.utils.middleware import LanguageMiddleware
@@ -28,6 +29,8 @@ app = FastAPI(
 
 register_routers(app)
 app.add_middleware(LanguageMiddleware)
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
 
 
 def run_service(host: str = settings.app_api_host, port: int = settings.app_api_port):
@@ -0,0 +1,103 @@
+"""
+    Service metrics
+
+    The metrics of the service, updated where the measured work happens.
+"""
+
+from inteliver.metrics.registry import registry
+
+# byte size buckets, from 1KB to 1GB
+BYTES_BUCKETS = tuple(float(1024 * 4**i) for i in range(11))
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "inteliver_http_request_duration_seconds",
+    "Latency of the HTTP requests per route.",
+    ("method", "route", "status"),
+)
+HTTP_REQUEST_BYTES = registry.counter(
+    "inteliver_http_request_bytes_total",
+    "Bytes received in HTTP request bodies per route.",
+    ("route",),
+)
+HTTP_RESPONSE_BYTES = registry.counter(
+    "inteliver_http_response_bytes_total",
+    "Bytes sent in HTTP response bodies per route.",
+    ("route",),
+)
+
+IMAGE_STAGE_SECONDS = registry.histogram(
+    "inteliver_image_stage_seconds",
+    "Wall time of the image request stages.",
+    ("stage", "operator"),
+)
+IMAGE_STAGE_BYTES = registry.histogram(
+    "inteliver_image_stage_bytes",
+    "Size of the data produced by the image request stages.",
+    ("stage", "operator"),
+    BYTES_BUCKETS,
+)
+IMAGE_JOBS_IN_FLIGHT = registry.gauge(
+    "inteliver_image_jobs_in_flight",
+    "Image jobs submitted to the image worker pool and not finished yet.",
+)
+IMAGE_POOL_QUEUE_DEPTH = registry.gauge(
+    "inteliver_image_pool_queue_depth",
+    "Image jobs waiting for a free worker of the image worker pool.",
+)
+IMAGE_QUEUE_WAIT_SECONDS = registry.histogram(
+    "inteliver_image_queue_wait_seconds",
+    "Time image jobs wait for a worker of the image worker pool per lane.",
+    ("lane",),
+)
+IMAGE_QUEUED_COST = registry.gauge(
+    "inteliver_image_queued_cost",
+    "Estimated cost of the admitted image jobs not finished yet.",
+)
+IMAGE_ADMISSION_REJECTED = registry.counter(
+    "inteliver_image_admission_rejected_total",
+    "Image requests shed because the image worker pool is saturated.",
+)
+IMAGE_DECODED_PIXELS = registry.counter(
+    "inteliver_image_decoded_pixels_total",
+    "Pixels decoded from source images.",
+)
+
+CACHE_REQUESTS = registry.counter(
+    "inteliver_cache_requests_total",
+    "Cache lookups per cache and result (hit or miss).",
+    ("cache", "result"),
+)
+
+MINIO_CALL_SECONDS = registry.histogram(
+    "inteliver_minio_call_duration_seconds",
+    "Latency of the MinIO calls per operation.",
+    ("operation",),
+)
+POSTGRES_QUERY_SECONDS = registry.histogram(
+    "inteliver_postgres_query_duration_seconds",
+    "Latency of the Postgres queries.",
+)
+
+MODEL_INFERENCE_SECONDS = registry.histogram(
+    "inteliver_model_inference_seconds",
+    "Inference time of the image models per model.",
+    ("model",),
+)
+THREAD_BUDGET = registry.gauge(
+    "inteliver_thread_budget",
+    "Effective thread counts of the image pool and the native libraries.",
+    ("library",),
+    # every worker process has its own thread pools of the same size
+    multiprocess_mode="max",
+)
+MODEL_BATCH_SIZE = registry.histogram(
+    "inteliver_model_batch_size",
+    "Inputs per batched forward pass of the image models per model.",
+    ("model",),
+    (1, 2, 4, 8, 16, 32),
+)
+MODEL_LOAD_SECONDS = registry.histogram(
+    "inteliver_model_load_seconds",
+    "Load time of the image models per model.",
+    ("model",),
+)
@@ -0,0 +1,62 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from inteliver.metrics.collectors import (
+    HTTP_REQUEST_BYTES,
+    HTTP_REQUEST_SECONDS,
+    HTTP_RESPONSE_BYTES,
+)
+
+
+class MetricsMiddleware:
+    """
+    Middleware for recording the latency and the body sizes of the HTTP
+        requests per route.
+
+    It is a plain ASGI middleware, so streaming responses are not buffered
+        and the latency includes sending the whole body. The route is the
+        path template of the matched route, so path parameters do not
+        create new label values.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        request_bytes = 0
+        response_bytes = 0
+
+        async def receive_wrapper() -> Message:
+            nonlocal request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                request_bytes += len(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, response_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            route: str = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=route,
+                status=str(status_code),
+            )
+            HTTP_REQUEST_BYTES.inc(request_bytes, route=route)
+            HTTP_RESPONSE_BYTES.inc(response_bytes, route=route)
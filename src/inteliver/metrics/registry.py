@@ -0,0 +1,426 @@
+"""
+    Metrics registry
+
+    This module holds the in-process metrics of the service. Metrics are
+        created once at import time with the registry helpers and updated
+        from request handlers and worker threads.
+
+    Updates never take a lock: every thread writes to its own shard of a
+        metric and the shards are only summed when the metrics are
+        collected. With several worker processes, each process dumps its
+        samples into the multiprocess directory and the collecting process
+        merges them.
+"""
+
+import bisect
+import json
+import operator
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, TypeVar
+
+# default histogram buckets in seconds
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+MetricT = TypeVar("MetricT", bound="Metric")
+
+
+class Metric:
+    """
+    Metric class
+
+    Base class of the metric types, it keeps one shard of samples per
+        thread.
+
+    Attributes:
+        name (str): The metric name.
+        documentation (str): The metric help text.
+        labelnames (tuple[str, ...]): The label names of the metric.
+    """
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._local = threading.local()
+        self._shards: list[dict] = []
+        self._shards_lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            # the lock is only taken once per thread
+            shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def samples(self) -> dict:
+        """
+        Sum the shards of all threads.
+
+        Returns:
+            dict: The value of each label values tuple.
+        """
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    Counter class
+
+    A monotonically increasing labeled counter.
+    """
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: str):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def samples(self) -> dict[tuple[str, ...], float]:
+        result: dict[tuple[str, ...], float] = {}
+        for shard in list(self._shards):
+            for key, value in list(shard.items()):
+                result[key] = result.get(key, 0) + value
+        return result
+
+
+class Gauge(Counter):
+    """
+    Gauge class
+
+    A labeled value which can go up and down. Gauges are either updated
+        with inc and dec, or read from a function when they are collected.
+
+    Attributes:
+        multiprocess_mode (str): How the values of the processes are
+            merged, "sum" for values counting something in each process,
+            "max" for values every process has its own copy of.
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        multiprocess_mode: str = "sum",
+    ):
+        super().__init__(name, documentation, labelnames)
+        if multiprocess_mode not in ("sum", "max"):
+            raise ValueError(f"Unknown multiprocess mode {multiprocess_mode}")
+        self.multiprocess_mode = multiprocess_mode
+        self._function: Callable[[], float] | None = None
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str):
+        """
+        Set the gauge, meant for values which rarely change.
+        """
+        key = self._key(labels)
+        with self._shards_lock:
+            for shard in self._shards:
+                shard.pop(key, None)
+        self._shard()[key] = value
+
+    @contextmanager
+    def track_inprogress(self, **labels: str):
+        """
+        Increment the gauge for the duration of a block.
+        """
+        self.inc(1, **labels)
+        try:
+            yield
+        finally:
+            self.dec(1, **labels)
+
+    def set_function(self, function: Callable[[], float]):
+        """
+        Read the (unlabeled) gauge value from a function on collection.
+        """
+        self._function = function
+
+    def samples(self) -> dict[tuple[str, ...], float]:
+        if self._function is not None:
+            return {(): float(self._function())}
+        return super().samples()
+
+
+class Histogram(Metric):
+    """
+    Histogram class
+
+    A labeled histogram with fixed cumulative buckets.
+
+    Attributes:
+        buckets (tuple[float, ...]): The bucket upper bounds.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: str):
+        """
+        Observe a value.
+
+        Args:
+            value (float): The observed value.
+            **labels (str): The label values, by label name.
+        """
+        shard = self._shard()
+        key = self._key(labels)
+        series = shard.get(key)
+        if series is None:
+            # bucket counts (+Inf last), sum and count
+            series = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            shard[key] = series
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str):
+        """
+        Observe the duration of a block in seconds. It can also be used as
+            a function decorator.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> dict[tuple[str, ...], list]:
+        result: dict[tuple[str, ...], list] = {}
+        for shard in list(self._shards):
+            for key, series in list(shard.items()):
+                merged = result.setdefault(key, [0] * len(series))
+                for i, value in enumerate(list(series)):
+                    merged[i] += value
+        return result
+
+
+class MetricsRegistry:
+    """
+    MetricsRegistry class
+
+    Keeps the metrics of the process by name, so each metric is created
+        only once, and renders them in the Prometheus text format.
+
+    Attributes:
+        multiprocess_dir (str | None): Directory where the processes of a
+            multi worker server share their samples.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        self._lock = threading.Lock()
+        self.multiprocess_dir: str | None = None
+
+    def _get_or_create(self, cls: type[MetricT], name: str, *args) -> MetricT:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args)
+            metric = self._metrics[name]
+            if not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already a {metric.type}")
+            return metric
+
+    def counter(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        multiprocess_mode: str = "sum",
+    ) -> Gauge:
+        return self._get_or_create(
+            Gauge, name, documentation, labelnames, multiprocess_mode
+        )
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def metrics(self) -> list[Metric]:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def snapshot(self) -> dict:
+        """
+        The samples of all metrics of this process.
+
+        Returns:
+            dict: The samples of each metric by name.
+        """
+        return {
+            metric.name: [[list(key), value] for key, value in metric.samples().items()]
+            for metric in self.metrics()
+        }
+
+    def dump(self):
+        """
+        Write the samples of this process into the multiprocess directory.
+        """
+        if not self.multiprocess_dir:
+            return
+        path = Path(self.multiprocess_dir) / f"metrics_{os.getpid()}.json"
+        temp_path = path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(self.snapshot()))
+        # readers never see a partially written file
+        temp_path.replace(path)
+
+    def collect(self) -> dict[str, dict]:
+        """
+        Collect the samples of this process, merged with the samples of the
+            other processes if a multiprocess directory is set.
+
+        Counters and histograms of exited processes are kept, gauges are
+            only merged over the live processes, summed or by their maximum
+            depending on their multiprocess mode.
+
+        Returns:
+            dict: The samples of each metric by name.
+        """
+        snapshots = {os.getpid(): self.snapshot()}
+        if self.multiprocess_dir:
+            for path in Path(self.multiprocess_dir).glob("metrics_*.json"):
+                pid = int(path.stem.split("_")[1])
+                if pid == os.getpid():
+                    continue
+                try:
+                    snapshots[pid] = json.loads(path.read_text())
+                except (OSError, ValueError):
+                    continue
+
+        result: dict[str, dict] = {metric.name: {} for metric in self.metrics()}
+        for pid, snapshot in snapshots.items():
+            for metric in self.metrics():
+                combine = operator.add
+                if metric.type == "gauge":
+                    if not _pid_alive(pid):
+                        continue
+                    if isinstance(metric, Gauge) and metric.multiprocess_mode == "max":
+                        combine = max
+                _merge(result[metric.name], snapshot.get(metric.name, []), combine)
+        return result
+
+    def generate_latest(self) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics text.
+        """
+        samples = self.collect()
+        lines = []
+        for metric in self.metrics():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for key, value in sorted(samples[metric.name].items()):
+                labels = list(zip(metric.labelnames, key))
+                if not isinstance(metric, Histogram):
+                    lines.append(f"{metric.name}{_labels(labels)} {_number(value)}")
+                    continue
+                cumulative = 0
+                bounds = [*metric.buckets, float("inf")]
+                for bound, count in zip(bounds, value[:-2]):
+                    cumulative += count
+                    le = [*labels, ("le", _number(bound))]
+                    lines.append(f"{metric.name}_bucket{_labels(le)} {cumulative}")
+                lines.append(f"{metric.name}_sum{_labels(labels)} {value[-2]}")
+                lines.append(f"{metric.name}_count{_labels(labels)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _merge(merged: dict, samples: list, combine: Callable[[float, float], float]):
+    for key, value in samples:
+        key = tuple(key)
+        if isinstance(value, list):
+            current = merged.setdefault(key, [0] * len(value))
+            for i, v in enumerate(value):
+                current[i] += v
+        elif key in merged:
+            merged[key] = combine(merged[key], value)
+        else:
+            merged[key] = value
+
+
+def _labels(labels: list[tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    values = ",".join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return "{" + values + "}"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+registry = MetricsRegistry()
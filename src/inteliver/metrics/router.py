@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from inteliver.metrics.service import MetricsService
+
+router = APIRouter()
+
+# content type of the Prometheus text exposition format
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("", tags=["Metrics"], include_in_schema=False)
+async def get_metrics() -> PlainTextResponse:
+    """
+    Get the service metrics in the Prometheus text format.
+
+    Returns:
+        PlainTextResponse: The metrics text.
+    """
+    return PlainTextResponse(
+        MetricsService.generate_latest(), media_type=METRICS_CONTENT_TYPE
+    )
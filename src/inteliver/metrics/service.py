@@ -0,0 +1,72 @@
+import threading
+from pathlib import Path
+
+from loguru import logger
+
+from inteliver.config import settings
+from inteliver.metrics.registry import registry
+
+
+class MetricsService:
+    """
+    MetricsService class
+
+    Sets up the metrics registry of the process. With a multiprocess
+        directory, a daemon thread dumps the samples of the process
+        periodically, so the worker answering a scrape reports the samples
+        of all the workers.
+
+    Attributes:
+        _stop (threading.Event): Stops the dump thread.
+    """
+
+    _stop: threading.Event | None = None
+
+    @staticmethod
+    def setup():
+        """
+        Configure the multiprocess directory and start the dump thread.
+        """
+        if not settings.metrics_multiprocess_dir:
+            return
+        Path(settings.metrics_multiprocess_dir).mkdir(parents=True, exist_ok=True)
+        registry.multiprocess_dir = settings.metrics_multiprocess_dir
+
+        MetricsService._stop = threading.Event()
+        thread = threading.Thread(
+            target=MetricsService._dump_loop,
+            args=(MetricsService._stop,),
+            name="inteliver-metrics",
+            daemon=True,
+        )
+        thread.start()
+
+    @staticmethod
+    def shutdown():
+        """
+        Stop the dump thread and dump the final samples of the process.
+        """
+        if MetricsService._stop is None:
+            return
+        MetricsService._stop.set()
+        MetricsService._stop = None
+        MetricsService._dump()
+
+    @staticmethod
+    def generate_latest() -> str:
+        """
+        Render the metrics of the service in the Prometheus text format.
+        """
+        return registry.generate_latest()
+
+    @staticmethod
+    def _dump_loop(stop: threading.Event):
+        while not stop.wait(settings.metrics_dump_interval_seconds):
+            MetricsService._dump()
+
+    @staticmethod
+    def _dump():
+        try:
+            registry.dump()
+        except OSError as e:
+            logger.warning(f"Unable to dump the metrics: {str(e)}")
@@ -0,0 +1,159 @@
+"""
+    Stage timing
+
+    This module times the stages of an image request (fetch, decode, each
+        operator, encode and respond) and reports them as a Server-Timing
+        header, as structured log fields and as histogram metrics.
+"""
+
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from io import BytesIO
+
+from fastapi.responses import StreamingResponse
+from loguru import logger
+from starlette.background import BackgroundTask
+
+from inteliver.config import settings
+from inteliver.metrics.collectors import IMAGE_STAGE_BYTES, IMAGE_STAGE_SECONDS
+
+
+@dataclass
+class Stage:
+    name: str
+    operator: str
+    seconds: float
+    nbytes: int
+
+
+class StageTimer:
+    """
+    StageTimer class
+
+    Collects the stages of one image request. A timer is created per
+        request and passed down to the worker thread doing the image work,
+        stages are appended in order and never shared between requests.
+
+    Stage sizes are the size of the data a stage produces (the fetched or
+        encoded bytes, the decoded or modified image), which is the memory
+        the stage allocates for its result.
+
+    Attributes:
+        stages (list[Stage]): The recorded stages in order.
+    """
+
+    def __init__(self):
+        self.stages: list[Stage] = []
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str, operator: str = ""):
+        """
+        Time a stage. The yielded dict accepts the stage size as 'nbytes'.
+
+        Args:
+            name (str): The stage name.
+            operator (str): The operator name of operator stages.
+        """
+        result = {"nbytes": 0}
+        start = time.perf_counter()
+        try:
+            yield result
+        finally:
+            self.record(name, time.perf_counter() - start, result["nbytes"], operator)
+
+    def record(self, name: str, seconds: float, nbytes: int = 0, operator: str = ""):
+        """
+        Record a stage and observe its metrics.
+        """
+        self.stages.append(Stage(name, operator, seconds, nbytes))
+        IMAGE_STAGE_SECONDS.observe(seconds, stage=name, operator=operator)
+        if nbytes:
+            IMAGE_STAGE_BYTES.observe(nbytes, stage=name, operator=operator)
+
+    def elapsed(self) -> float:
+        """
+        Seconds since the timer was created.
+        """
+        return time.perf_counter() - self._start
+
+    def server_timing(self) -> str:
+        """
+        Format the stages as a Server-Timing header value.
+
+        Returns:
+            str: e.g. 'fetch;dur=12.1, op-blur;desc="blur";dur=3.4'.
+        """
+        entries = []
+        for stage in self.stages:
+            if stage.operator:
+                entries.append(
+                    f'op-{stage.operator};desc="{stage.operator}";'
+                    f"dur={stage.seconds * 1000:.1f}"
+                )
+            else:
+                entries.append(f"{stage.name};dur={stage.seconds * 1000:.1f}")
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def log_fields(self) -> dict:
+        """
+        The stages as structured log fields.
+
+        Returns:
+            dict: The stage list and the total time in milliseconds.
+        """
+        return {
+            "stages": [
+                {
+                    "stage": stage.name,
+                    "operator": stage.operator,
+                    "ms": round(stage.seconds * 1000, 3),
+                    "bytes": stage.nbytes,
+                }
+                for stage in self.stages
+            ],
+            "total_ms": round(self.elapsed() * 1000, 3),
+        }
+
+
+def timed_streaming_response(
+    data: BytesIO, media_type: str, timer: StageTimer, **log_fields
+) -> StreamingResponse:
+    """
+    Build the streaming response of an image request.
+
+    The Server-Timing header is added if image_server_timing is set. The
+        respond stage ends when the body is sent, it is recorded and the
+        request stages are logged after the response.
+
+    Args:
+        data (BytesIO): The response body.
+        media_type (str): The response media type.
+        timer (StageTimer): The request timer.
+        **log_fields: Extra structured log fields, e.g. the cloudname.
+
+    Returns:
+        StreamingResponse: The response.
+    """
+    headers = {}
+    if settings.image_server_timing:
+        headers["Server-Timing"] = timer.server_timing()
+    respond_start = time.perf_counter()
+
+    def log_stages():
+        timer.record(
+            "respond", time.perf_counter() - respond_start, data.getbuffer().nbytes
+        )
+        fields = timer.log_fields()
+        logger.bind(**log_fields, **fields).debug(
+            f"Image request processed in {fields['total_ms']:.1f} ms"
+        )
+
+    return StreamingResponse(
+        data,
+        media_type=media_type,
+        headers=headers,
+        background=BackgroundTask(log_stages),
+    )
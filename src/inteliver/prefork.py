@@ -0,0 +1,342 @@
+"""
+    Pre-fork server
+
+    Runs the API in several worker processes sharing one listening socket.
+        The master process preloads the settings, the application and the
+        image models once, then forks the workers, so the model weights and
+        the imported code are shared copy-on-write between the workers.
+
+    Signals of the master:
+        SIGTERM, SIGINT: graceful shutdown of the workers.
+        SIGHUP: graceful reload, the settings are read again and a new set
+            of workers replaces the old one.
+"""
+
+import gc
+import os
+import signal
+import socket
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import uvicorn
+from loguru import logger
+
+from inteliver.config import InteliverSettings, settings
+from inteliver.image.threads import ThreadBudget
+
+# seconds between two checks of the master loop and the worker rss
+MASTER_POLL_SECONDS = 0.5
+RSS_POLL_SECONDS = 5.0
+# a worker failing sooner than this after its spawn crashed, its slot is
+# respawned with an exponential backoff up to the maximum delay
+WORKER_MIN_UPTIME_SECONDS = 10.0
+MAX_RESPAWN_DELAY_SECONDS = 30.0
+
+
+def _cpus() -> list[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _rss_mb() -> float:
+    """
+    The current resident set size of the process in MB.
+    """
+    try:
+        pages = int(Path("/proc/self/statm").read_text().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        # peak rss in KB on linux, the best estimate without procfs
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class PreforkServer:
+    """
+    PreforkServer class
+
+    The master process of the pre-fork mode. It owns the listening socket,
+        forks one worker per slot and replaces the workers which exit, e.g.
+        after server_max_requests requests or when their memory grows over
+        server_max_rss_mb.
+
+    A worker failing (a non zero exit status or a signal) right after its
+        spawn crashed, e.g. on a broken setting, its slot is respawned
+        after a growing delay. Clean exits, e.g. a recycled worker, are
+        respawned at once whatever the uptime. After
+        server_worker_crash_limit crashes in a row the master stops
+        instead of respawning the workers forever.
+
+    Attributes:
+        host (str): The bind host.
+        port (int): The bind port.
+        workers (int): The number of worker processes.
+        _slots (dict[int, int]): The worker slot of each worker pid.
+        _spawned_at (dict[int, float]): The spawn time of each slot.
+        _crashes (dict[int, int]): The crashes in a row of each slot.
+        _respawn_at (dict[int, float]): The respawn time of the slots
+            waiting for their backoff.
+        _retiring (set[int]): The pids of the workers being stopped.
+    """
+
+    def __init__(self, host: str, port: int, workers: int):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self._slots: dict[int, int] = {}
+        self._spawned_at: dict[int, float] = {}
+        self._crashes: dict[int, int] = {}
+        self._respawn_at: dict[int, float] = {}
+        self._retiring: set[int] = set()
+        self._socket: socket.socket | None = None
+        self._stopping = False
+        self._reload = False
+        self._failed = False
+
+    def run(self):
+        """
+        Preload, fork the workers and supervise them until shutdown.
+        """
+        self._socket = self._bind()
+        self._preload()
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+
+        logger.info(
+            f"Starting {self.workers} workers on http://{self.host}:{self.port}"
+        )
+        for slot in range(self.workers):
+            self._spawn(slot)
+
+        while not self._stopping:
+            if self._reload:
+                self._reload = False
+                self._reload_workers()
+            self._reap()
+            self._respawn()
+            time.sleep(MASTER_POLL_SECONDS)
+
+        self._stop_workers(list(self._slots))
+        self._socket.close()
+        logger.info("All workers stopped")
+        if self._failed:
+            raise SystemExit(1)
+
+    def _bind(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+
+    def _preload(self):
+        """
+        Import the application and load the image models before forking.
+
+        No thread may be started here, a forked child only gets the thread
+            which called fork.
+        """
+        if not settings.metrics_multiprocess_dir:
+            settings.metrics_multiprocess_dir = tempfile.mkdtemp(
+                prefix="inteliver-metrics-"
+            )
+        # samples of a previous run would be merged into this one
+        for path in Path(settings.metrics_multiprocess_dir).glob("metrics_*.json"):
+            path.unlink(missing_ok=True)
+
+        # numpy is loaded here, with the thread budget of one worker
+        ThreadBudget.cpus = max(len(_cpus()) // self.workers, 1)
+        ThreadBudget.configure_environment()
+
+        from inteliver.image.model_registry import ModelRegistry
+        from inteliver.main import app  # noqa: F401
+
+        ModelRegistry.warmup(settings.image_model_warmup)
+        # keep the preloaded objects out of the garbage collector, its
+        # scans would write to (and copy) the shared pages in every worker
+        gc.collect()
+        gc.freeze()
+
+    def _spawn(self, slot: int):
+        self._respawn_at.pop(slot, None)
+        pid = os.fork()
+        if pid:
+            self._slots[pid] = slot
+            self._spawned_at[slot] = time.monotonic()
+            return
+        # worker process
+        assert self._socket is not None
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGHUP, signal.SIG_DFL)
+            PreforkWorker(slot, self.workers, self._socket).run()
+        except BaseException as e:
+            logger.exception(f"Worker {os.getpid()} crashed: {str(e)}")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def _reap(self):
+        while self._slots:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            slot = self._slots.pop(pid, None)
+            if slot is None:
+                continue
+            if os.WIFSIGNALED(status):
+                logger.info(f"Worker {pid} killed by signal {os.WTERMSIG(status)}")
+                failed = True
+            else:
+                exit_code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else 0
+                logger.info(f"Worker {pid} exited with status {exit_code}")
+                failed = exit_code != 0
+            if pid in self._retiring:
+                self._retiring.discard(pid)
+            elif not self._stopping:
+                self._schedule_respawn(slot, failed)
+
+    def _schedule_respawn(self, slot: int, failed: bool):
+        now = time.monotonic()
+        uptime = now - self._spawned_at.get(slot, now)
+        if not failed or uptime >= WORKER_MIN_UPTIME_SECONDS:
+            self._crashes[slot] = 0
+            self._spawn(slot)
+            return
+
+        crashes = self._crashes.get(slot, 0) + 1
+        self._crashes[slot] = crashes
+        limit = settings.server_worker_crash_limit
+        if limit > 0 and crashes >= limit:
+            logger.error(
+                f"Worker slot {slot} crashed {crashes} times in a row, stopping"
+            )
+            self._failed = True
+            self._stopping = True
+            return
+        delay = min(MASTER_POLL_SECONDS * 2 ** (crashes - 1), MAX_RESPAWN_DELAY_SECONDS)
+        logger.warning(f"Worker slot {slot} crashed, respawning in {delay:.1f}s")
+        self._respawn_at[slot] = now + delay
+
+    def _respawn(self):
+        now = time.monotonic()
+        for slot, respawn_at in list(self._respawn_at.items()):
+            if respawn_at <= now and not self._stopping:
+                self._spawn(slot)
+
+    def _reload_workers(self):
+        logger.info("Reloading the settings and the workers")
+        fresh = InteliverSettings()
+        for name in InteliverSettings.model_fields:
+            if name != "metrics_multiprocess_dir":
+                setattr(settings, name, getattr(fresh, name))
+
+        old_workers = list(self._slots)
+        # the new settings may fix a crashing worker
+        self._crashes.clear()
+        for slot in range(self.workers):
+            self._spawn(slot)
+        self._stop_workers(old_workers)
+
+    def _stop_workers(self, pids: list[int]):
+        self._retiring.update(pids)
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + settings.server_graceful_timeout_seconds
+        while any(pid in self._slots for pid in pids):
+            if time.monotonic() > deadline:
+                for pid in pids:
+                    if pid in self._slots:
+                        logger.warning(f"Killing worker {pid}")
+                        os.kill(pid, signal.SIGKILL)
+                deadline = float("inf")
+            self._reap()
+            time.sleep(MASTER_POLL_SECONDS / 5)
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _handle_reload(self, signum, frame):
+        self._reload = True
+
+
+class PreforkWorker:
+    """
+    PreforkWorker class
+
+    One worker process of the pre-fork mode: a uvicorn server on the
+        inherited socket, pinned to its share of the cpus.
+
+    Attributes:
+        slot (int): The worker slot, its index among the workers.
+        cpus (list[int]): The cpus the worker runs on.
+    """
+
+    def __init__(self, slot: int, workers: int, sock: socket.socket):
+        self.slot = slot
+        self.socket = sock
+        cpus = _cpus()
+        share = max(len(cpus) // workers, 1)
+        start = (slot * share) % len(cpus)
+        self.cpus = cpus[start : start + share]
+
+    def run(self):
+        self._configure()
+
+        from inteliver.main import app
+
+        config = uvicorn.Config(
+            app,
+            lifespan="on",
+            limit_max_requests=settings.server_max_requests or None,
+            timeout_graceful_shutdown=settings.server_graceful_timeout_seconds,
+        )
+        server = uvicorn.Server(config)
+        if settings.server_max_rss_mb > 0:
+            threading.Thread(
+                target=self._watch_rss, args=(server,), daemon=True
+            ).start()
+        server.run(sockets=[self.socket])
+        # uvicorn returns without an error when the lifespan startup fails
+        if not server.started:
+            raise RuntimeError("The worker server failed to start")
+
+    def _configure(self):
+        if settings.server_cpu_affinity and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, self.cpus)
+        # the workers share the cores, the thread budget is applied to the
+        # share of this worker on startup
+        ThreadBudget.cpus = len(self.cpus)
+        logger.info(f"Worker {os.getpid()} (slot {self.slot}) on cpus {self.cpus}")
+
+    @staticmethod
+    def _watch_rss(server: uvicorn.Server):
+        while not server.should_exit:
+            time.sleep(RSS_POLL_SECONDS)
+            rss = _rss_mb()
+            if rss > settings.server_max_rss_mb:
+                logger.info(
+                    f"Worker {os.getpid()} uses {rss:.0f}MB, over "
+                    f"server_max_rss_mb, recycling"
+                )
+                server.should_exit = True
+
+
+def run_prefork_service(host: str, port: int, workers: int):
+    PreforkServer(host, port, workers).run()
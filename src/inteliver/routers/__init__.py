@@ -8,7 +8,9 @@ from fastapi import FastAPI
 
 from inteliver.auth.router import router as auth_router
 from inteliver.config import settings
+from inteliver.iiif.router import router as iiif_router
 from inteliver.image.router import router as image_router
+from inteliver.metrics.router import router as metrics_router
 from inteliver.storage.router import router as storage_router
 from inteliver.users.router import router as users_router
 from inteliver.utils.i18n import _
@@ -18,6 +20,8 @@ from inteliver.versioning.router import router as version_router
 def register_routers(app: FastAPI):
     app.include_router(image_router, prefix=f"{settings.api_prefix}/image")
 
+    app.include_router(iiif_router, prefix=f"{settings.api_prefix}/iiif")
+
     app.include_router(storage_router, prefix=f"{settings.api_prefix}/storage")
 
     app.include_router(auth_router, prefix=f"{settings.api_prefix}/auth")
@@ -28,6 +32,9 @@ def register_routers(app: FastAPI):
         version_router, prefix=f"{settings.api_prefix}/inteliver-api", tags=["version"]
     )
 
+    if settings.metrics_enabled:
+        app.include_router(metrics_router, prefix="/metrics")
+
     # Root endpoint
     @app.get("/")
     async def root():
@@ -1 +1,4 @@
 SUPPORTED_IMAGE_FORMATS = ["JPEG", "WEBP", "PNG"]
+# the objects derived from an image (tiles, analysis) are stored under
+# '{object_key}_files/' and deleted with it
+DERIVED_OBJECTS_SUFFIX = "_files/"
@@ -1,18 +1,23 @@
+import asyncio
 import itertools
+import os
 import uuid
 from datetime import datetime, timezone
 from io import BytesIO
+from typing import BinaryIO
 from uuid import UUID
 
 from fastapi import UploadFile
 from loguru import logger
 from minio import Minio, S3Error
+from minio.deleteobjects import DeleteObject
 from minio.datatypes import Object as MinioObject
 from PIL import Image
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from inteliver.config import settings
-from inteliver.storage.constants import SUPPORTED_IMAGE_FORMATS
+from inteliver.metrics.collectors import MINIO_CALL_SECONDS
+from inteliver.storage.constants import DERIVED_OBJECTS_SUFFIX, SUPPORTED_IMAGE_FORMATS
 from inteliver.storage.exceptions import (
     InvalidImageFileException,
     S3ErrorException,
@@ -32,14 +37,17 @@ class MinIOService:
     )
 
     @classmethod
+    @MINIO_CALL_SECONDS.time(operation="bucket_exists")
     def bucket_exists(cls, bucket_name: str) -> bool:
         return cls.client.bucket_exists(bucket_name)
 
     @classmethod
+    @MINIO_CALL_SECONDS.time(operation="make_bucket")
     def make_bucket(cls, bucket_name: str):
         cls.client.make_bucket(bucket_name)
 
     @classmethod
+    @MINIO_CALL_SECONDS.time(operation="put_object")
     def put_object(
         cls, bucket_name: str, object_name: str, data, length: int, content_type: str
     ):
@@ -48,6 +56,7 @@ class MinIOService:
         )
 
     @classmethod
+    @MINIO_CALL_SECONDS.time(operation="get_object")
     def get_object(cls, bucket_name: str, object_name: str) -> tuple[BytesIO, dict]:
         """
         Retrieve an object from MinIO storage.
@@ -73,6 +82,7 @@ class MinIOService:
             raise
 
     @classmethod
+    @MINIO_CALL_SECONDS.time(operation="delete_object")
     def delete_object(cls, bucket_name: str, object_name: str):
         """
         Delete an object from MinIO storage.
@@ -97,10 +107,36 @@ class MinIOService:
         cls.client.remove_object(bucket_name, object_name)
 
     @classmethod
+    @MINIO_CALL_SECONDS.time(operation="delete_prefix")
+    def delete_prefix(cls, bucket_name: str, prefix: str):
+        """
+        Delete all the objects under a prefix.
+
+        Args:
+            bucket_name (str): The name of the bucket.
+            prefix (str): The key prefix of the objects to delete.
+
+        Raises:
+            S3Error: If an error occurs during deletion.
+        """
+        objects = cls.client.list_objects(bucket_name, prefix=prefix, recursive=True)
+        errors = cls.client.remove_objects(
+            bucket_name, (DeleteObject(obj.object_name) for obj in objects)
+        )
+        # the deletion is lazy, it runs while the errors are iterated
+        for error in errors:
+            logger.error(f"MinIO delete error: {error}")
+
+    @classmethod
+    @MINIO_CALL_SECONDS.time(operation="list_objects")
     def list_objects(cls, bucket_name: str, skip: int, limit: int) -> list[MinioObject]:
         """
         List objects in a bucket.
 
+        The listing is not recursive, the derived objects of an image
+            (e.g. its tile pyramid under '{object_key}_files/') are listed
+            as a prefix, which is skipped.
+
         Args:
             bucket_name (str): The name of the bucket.
             skip (int): The number of objects to skip.
@@ -111,10 +147,13 @@ class MinIOService:
         """
 
         # List objects in the bucket
-        objects_iter = cls.client.list_objects(bucket_name)
+        objects_iter = (
+            obj for obj in cls.client.list_objects(bucket_name) if not obj.is_dir
+        )
         return list(itertools.islice(objects_iter, skip, skip + limit))
 
     @classmethod
+    @MINIO_CALL_SECONDS.time(operation="get_object_stats")
     def get_object_stats(cls, bucket_name: str, object_name: str):
         """
         Get the stats of an object from MinIO.
@@ -155,23 +194,51 @@ class StorageService:
         # Step 1: Get user's cloudname
         cloudname = await UserService.get_cloudname(db, uid)
 
-        # Step 2: Validate image format
-        mime_type = StorageService._validate_image_format(file)
+        # Step 2: Validate the image and upload it
+        length = file.size
+        if length is None:
+            length = file.file.seek(0, os.SEEK_END)
+            file.file.seek(0)
+        return await StorageService.upload_image_data(uid, cloudname, file.file, length)
 
-        # Step 3: Check if bucket exists, if not create it
-        if not MinIOService.bucket_exists(cloudname):
-            MinIOService.make_bucket(cloudname)
+    @staticmethod
+    async def upload_image_data(
+        uid: UUID,
+        cloudname: str,
+        data: BinaryIO,
+        length: int,
+    ) -> ObjectUploaded:
+        """
+        Upload image data to the storage of a cloudname, the same way as an
+            uploaded file.
+
+        Args:
+            uid (UUID): The id of the user owning the cloudname.
+            cloudname (str): The cloudname of the user.
+            data (BinaryIO): The image data.
+            length (int): The size of the image data in bytes.
+
+        Returns:
+            ObjectUploaded: The uploaded image.
+        """
 
-        # Step 4: Create a unique object name
+        # Step 1: Validate image format
+        mime_type = StorageService._validate_image_format(data)
+
+        # Step 2: Check if bucket exists, if not create it
+        await StorageService.ensure_bucket(cloudname)
+
+        # Step 3: Create a unique object name
         object_key = StorageService._generate_unique_key(mime_type)
 
-        # Step 5: Upload the file to MinIO
+        # Step 4: Upload the data to MinIO
         try:
-            MinIOService.put_object(
+            await asyncio.to_thread(
+                MinIOService.put_object,
                 bucket_name=cloudname,
                 object_name=object_key,
-                data=file.file,
-                length=file.size,
+                data=data,
+                length=length,
                 content_type=mime_type,
             )
         except S3Error as e:
@@ -224,7 +291,10 @@ class StorageService:
             Tuple[BytesIO, Dict[str, str]]: The retrieved object data and its headers.
         """
         try:
-            data, headers = MinIOService.get_object(
+            # run the blocking minio call in a thread so concurrent
+            # retrievals do not serialize on the event loop
+            data, headers = await asyncio.to_thread(
+                MinIOService.get_object,
                 bucket_name=cloudname,
                 object_name=object_key,
             )
@@ -234,6 +304,67 @@ class StorageService:
             logger.debug(f"MinIO S3Error: {str(e)}")
             raise S3ErrorObjectNotFoundException(detail=f"MinIO S3Error: {str(e)}")
 
+    @staticmethod
+    async def ensure_bucket(cloudname: str):
+        """
+        Create the bucket of a cloudname if it does not exist yet.
+
+        Args:
+            cloudname (str): The cloudname of the user.
+        """
+
+        def ensure():
+            if not MinIOService.bucket_exists(cloudname):
+                MinIOService.make_bucket(cloudname)
+
+        try:
+            await asyncio.to_thread(ensure)
+        except S3Error as e:
+            logger.error(f"MinIO S3Error: {str(e)}")
+            raise S3ErrorException(detail=f"MinIO S3Error (make_bucket): {str(e)}")
+
+    @staticmethod
+    async def store_image_by_cloudname(
+        cloudname: str,
+        data: bytes,
+        mime_type: str,
+        object_key: str | None = None,
+        check_bucket: bool = True,
+    ) -> str:
+        """
+        Store an encoded image in the storage by cloudname.
+
+        Args:
+            cloudname (str): The cloudname of the user.
+            data (bytes): The encoded image data.
+            mime_type (str): The MIME type of the image (e.g., 'image/jpeg').
+            object_key (str, optional): The object key, a unique key is
+                generated if not set.
+            check_bucket (bool): Create the bucket if it does not exist,
+                callers storing many objects check it once beforehand.
+
+        Returns:
+            str: The object key of the stored image.
+        """
+        if object_key is None:
+            object_key = StorageService._generate_unique_key(mime_type)
+        if check_bucket:
+            await StorageService.ensure_bucket(cloudname)
+        try:
+            await asyncio.to_thread(
+                MinIOService.put_object,
+                bucket_name=cloudname,
+                object_name=object_key,
+                data=BytesIO(data),
+                length=len(data),
+                content_type=mime_type,
+            )
+        except S3Error as e:
+            logger.error(f"MinIO S3Error: {str(e)}")
+            raise S3ErrorException(detail=f"MinIO S3Error (put_object): {str(e)}")
+
+        return object_key
+
     @staticmethod
     async def delete_image(
         db: AsyncSession,
@@ -254,9 +385,12 @@ class StorageService:
         # Step 1: Get user's cloudname
         cloudname = await UserService.get_cloudname(db, uid)
 
-        # Step 2: Delete the object from MinIO
+        # Step 2: Delete the object and its derived objects from MinIO
         try:
             MinIOService.delete_object(bucket_name=cloudname, object_name=object_key)
+            MinIOService.delete_prefix(
+                cloudname, StorageService.derived_prefix(object_key)
+            )
 
         except S3Error as e:
             logger.debug(f"MinIO S3Error: {str(e)}")
@@ -287,8 +421,8 @@ class StorageService:
         cloudname = await UserService.get_cloudname(db, uid)
 
         # Step 2: Check if bucket exists, if not create it
-        if not MinIOService.bucket_exists(cloudname):
-            MinIOService.make_bucket(cloudname)
+        if not await asyncio.to_thread(MinIOService.bucket_exists, cloudname):
+            await StorageService.ensure_bucket(cloudname)
             return []
         # Step 3: List objects from MinIO
         try:
@@ -343,24 +477,31 @@ class StorageService:
             raise S3ErrorObjectNotFoundException
 
     @staticmethod
-    def _validate_image_format(file: UploadFile) -> str | None:
+    def derived_prefix(object_key: str) -> str:
+        """
+        The key prefix of the objects derived from an image.
+        """
+        return f"{object_key}{DERIVED_OBJECTS_SUFFIX}"
+
+    @staticmethod
+    def _validate_image_format(data: BinaryIO) -> str | None:
         """
         Validate that the uploaded image is in supported image formats.
 
         Args:
-            file (UploadFile): The uploaded file.
+            data (BinaryIO): The uploaded image data.
 
         Returns:
             str: The mime type of the image.
         """
         try:
-            image = Image.open(file.file)
+            image = Image.open(data)
             if image.format not in SUPPORTED_IMAGE_FORMATS:
                 raise UnsupportedImageFormatException
         except Exception as e:
             raise InvalidImageFileException(detail=str(e))
         # Ensure the file pointer is at the beginning
-        file.file.seek(0)
+        data.seek(0)
         return image.get_format_mimetype()
 
     @staticmethod
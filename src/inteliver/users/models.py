@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Boolean, Column, DateTime, String
+from sqlalchemy import Boolean, Column, DateTime, Integer, String
 from sqlalchemy.dialects.postgresql import UUID
 
 from inteliver.database.postgres import Base
@@ -24,6 +24,8 @@ class User(Base):
     password = Column(String, nullable=False)
     role = Column(String, nullable=False, default=str(UserRole.USER.value))
     email_activated = Column(Boolean, nullable=False, default=False)
+    # concurrent image jobs cap, the image processing settings apply if null
+    image_max_concurrency = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=lambda: datetime.now().replace(tzinfo=None))
     updated_at = Column(
         DateTime,
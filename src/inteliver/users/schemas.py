@@ -32,6 +32,7 @@ class UserOut(BaseModel):
     cloudname: str
     role: UserRole
     email_activated: bool
+    image_max_concurrency: int | None = None
     created_at: datetime | None
     updated_at: datetime | None
 
@@ -3,6 +3,12 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from loguru import logger
 
+from inteliver.config import settings
+from inteliver.image.executor import ImageExecutor
+from inteliver.image.model_registry import ModelRegistry
+from inteliver.image.threads import ThreadBudget
+from inteliver.metrics.service import MetricsService
+
 # from inteliver.database.postgres import init_db
 
 
@@ -21,6 +27,11 @@ async def on_startup(app: FastAPI):
         app (FastAPI): The FastAPI application instance.
     """
     logger.info("Starting up the app...")
+    MetricsService.setup()
+    ThreadBudget.apply()
+    if settings.image_model_warmup:
+        # load the models on the worker pool, the event loop stays free
+        await ImageExecutor.run(ModelRegistry.warmup, settings.image_model_warmup)
     # Register to services that needs to be created on startup
     # try:
     #     await init_db()
@@ -38,3 +49,5 @@ async def on_shutdown(app: FastAPI) -> None:
     """
     logger.info("Shutting down gracefully...")
     # Unregister any service that needs to be gracefully shut down
+    ImageExecutor.shutdown()
+    MetricsService.shutdown()
@@ -171,6 +171,19 @@ async def uploaded_image_face(
     yield uploaded
 
 
+@pytest_asyncio.fixture
+async def uploaded_image_oriented(
+    db_session: AsyncSession,
+    pre_existing_user: User,
+    cleanup_minio,
+):
+    # a 120x80 image with EXIF orientation 6 (rotate 90 degrees clockwise)
+    filepath = "tests/assets/images/jpg_test_image_orientation.jpeg"
+
+    uploaded = await upload_image_util(db_session, pre_existing_user, filepath)
+    yield uploaded
+
+
 async def upload_image_util(
     db_session: AsyncSession,
     pre_existing_user: User,
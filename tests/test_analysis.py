@@ -0,0 +1,22 @@
+import pytest
+
+from inteliver.config import settings
+from inteliver.image.analysis import AnalysisService
+
+
+@pytest.mark.parametrize(
+    "name, value",
+    [
+        ("image_face_upsample", 2),
+        ("image_auto_orient", False),
+        ("image_detect_confidence", 0.5),
+    ],
+)
+def test_analysis_key_settings(monkeypatch: pytest.MonkeyPatch, name: str, value):
+    key = AnalysisService.analysis_key("photo.jpg")
+    assert key.startswith("photo.jpg_files/analysis/")
+    assert AnalysisService.analysis_key("photo.jpg") == key
+
+    # an analysis made with other detection settings is not reused
+    monkeypatch.setattr(settings, name, value)
+    assert AnalysisService.analysis_key("photo.jpg") != key
@@ -0,0 +1,80 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from inteliver.image.batching import InferenceBatcher
+
+TIMEOUT = 5
+
+
+class FakeModel:
+    # multiplies its inputs by ten, failing on negative ones
+    def __init__(self):
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def predict(self, inputs: list) -> list:
+        with self.lock:
+            self.batches.append(list(inputs))
+        if any(input < 0 for input in inputs):
+            raise ValueError("negative input")
+        return [input * 10 for input in inputs]
+
+
+def infer_all(batcher: InferenceBatcher, inputs: list) -> list:
+    with ThreadPoolExecutor(len(inputs)) as executor:
+        futures = [executor.submit(batcher.infer, input) for input in inputs]
+        return [future.exception(TIMEOUT) or future.result() for future in futures]
+
+
+def test_window_flush():
+    model = FakeModel()
+    batcher = InferenceBatcher("test", model.predict, 8, window_seconds=0.05)
+    started = time.perf_counter()
+    # a lone input waits for the window then runs on its own
+    assert batcher.infer(1) == 10
+    assert time.perf_counter() - started >= 0.05
+    assert model.batches == [[1]]
+
+
+def test_max_batch_size():
+    model = FakeModel()
+    batcher = InferenceBatcher("test", model.predict, 3, window_seconds=TIMEOUT)
+    started = time.perf_counter()
+    # a full batch does not wait for the window
+    assert infer_all(batcher, [1, 2, 3]) == [10, 20, 30]
+    assert time.perf_counter() - started < TIMEOUT
+    assert len(model.batches) == 1
+    assert sorted(model.batches[0]) == [1, 2, 3]
+
+
+def test_results_demux():
+    model = FakeModel()
+    batcher = InferenceBatcher("test", model.predict, 4, window_seconds=0.05)
+    inputs = list(range(1, 11))
+    # every caller gets the output of its own input
+    assert infer_all(batcher, inputs) == [input * 10 for input in inputs]
+    assert all(len(batch) <= 4 for batch in model.batches)
+    assert sorted(sum(model.batches, [])) == inputs
+
+
+def test_exception_fan_out():
+    model = FakeModel()
+    batcher = InferenceBatcher("test", model.predict, 3, window_seconds=TIMEOUT)
+    results = infer_all(batcher, [1, -1, 2])
+    # the whole batch fails with the model error
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len({id(result) for result in results}) == 1
+    # and the batcher keeps serving
+    assert infer_all(batcher, [1, 2, 3]) == [10, 20, 30]
+
+
+def test_unbatched():
+    model = FakeModel()
+    batcher = InferenceBatcher("test", model.predict, 1, window_seconds=TIMEOUT)
+    with pytest.raises(ValueError):
+        batcher.infer(-1)
+    assert batcher.infer(2) == 20
+    assert model.batches == [[-1], [2]]
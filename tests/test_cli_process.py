@@ -0,0 +1,50 @@
+import shutil
+from pathlib import Path
+
+import cv2
+
+from inteliver.cli.process import iter_image_keys, output_key, run_process
+
+TEST_IMAGE = "tests/assets/images/jpg_test_image.jpeg"
+
+
+def make_source(root: Path) -> Path:
+    source = root / "source"
+    (source / "nested").mkdir(parents=True)
+    shutil.copy(TEST_IMAGE, source / "a.jpg")
+    shutil.copy(TEST_IMAGE, source / "nested" / "b.jpeg")
+    cv2.imwrite(str(source / "a.png"), cv2.imread(TEST_IMAGE))
+    (source / "notes.txt").write_text("not an image")
+    return source
+
+
+def test_output_key():
+    assert output_key("a.jpg", "image/jpeg") == "a.jpg"
+    assert output_key("a.jpeg", "image/jpeg") == "a.jpeg"
+    assert output_key("a.png", "image/jpeg") == "a.png.jpg"
+    assert output_key("a.jpg", "image/webp") == "a.jpg.webp"
+
+
+def test_process_local_round_trip(tmp_path: Path):
+    source = make_source(tmp_path)
+    destination = tmp_path / "destination"
+    checkpoint = tmp_path / "process.checkpoint"
+
+    assert list(iter_image_keys(str(source))) == ["a.jpg", "a.png", "nested/b.jpeg"]
+
+    commands = "i_h_50,i_w_50,i_o_resize"
+    result = run_process(str(source), str(destination), commands, 1, checkpoint)
+    assert result == (3, 0, 0)
+    # the jpeg and png sources with the same stem do not collide
+    for key in ("a.jpg", "a.png.jpg", "nested/b.jpeg"):
+        assert cv2.imread(str(destination / key)).shape[:2] == (50, 50)
+
+    # a rerun resumes from the checkpoint
+    result = run_process(str(source), str(destination), commands, 1, checkpoint)
+    assert result == (0, 3, 0)
+
+    # other commands process the images again
+    commands = "i_h_20,i_w_20,i_o_resize"
+    result = run_process(str(source), str(destination), commands, 1, checkpoint)
+    assert result == (3, 0, 0)
+    assert cv2.imread(str(destination / "a.jpg")).shape[:2] == (20, 20)
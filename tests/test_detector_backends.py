@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from inteliver.config import settings
+from inteliver.image.detector_backends import ExportedBackend, allowed_class_ids
+
+IMGSZ = 64
+
+
+# an exported model with a static batch of two, boxing each image at an x
+# given by its pixel value
+class FakeBackend(ExportedBackend):
+    fixed_imgsz = IMGSZ
+    fixed_batch = 2
+    names = {0: "thing"}
+
+    def __init__(self):
+        self.chunks = []
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        assert len(batch) == self.fixed_batch
+        self.chunks.append(batch)
+        output = np.zeros((len(batch), 5, 1), dtype=np.float32)
+        output[:, 0, 0] = batch[:, 0, 0, 0] * 255  # center x
+        output[:, 1, 0] = IMGSZ / 2  # center y
+        output[:, 2:4, 0] = 8  # width, height
+        output[:, 4, 0] = 0.9  # score
+        return output
+
+
+def test_static_batch_runs_in_chunks():
+    backend = FakeBackend()
+    images = [np.full((IMGSZ, IMGSZ, 3), value, np.uint8) for value in (10, 20, 30)]
+    detections = backend.predict(images, [None] * len(images))
+
+    # the three images run as two full batches, the last one padded
+    assert len(backend.chunks) == 2
+    assert not backend.chunks[1][1].any()
+    assert [len(found) for found in detections] == [1, 1, 1]
+    for found, value in zip(detections, (10, 20, 30)):
+        x1, _, x2, _, label, _ = found[0]
+        assert label == "thing"
+        assert (x1 + x2) / 2 == value
+
+
+def test_allowed_class_ids(monkeypatch: pytest.MonkeyPatch):
+    names = {0: "person", 1: "car", 2: "dog"}
+    assert allowed_class_ids(names, None) is None
+    assert allowed_class_ids(names, {"dog", "car"}) == [1, 2]
+    assert allowed_class_ids(names, {"cat"}) == []
+
+    # the image_detect_classes setting limits the requested classes
+    monkeypatch.setattr(settings, "image_detect_classes", ["person", "dog"])
+    assert allowed_class_ids(names, None) == [0, 2]
+    assert allowed_class_ids(names, {"dog", "car"}) == [2]
+    assert allowed_class_ids(names, {"car"}) == []
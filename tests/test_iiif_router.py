@@ -0,0 +1,102 @@
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+
+from inteliver.config import settings
+from inteliver.storage.schemas import ObjectUploaded
+from inteliver.users.models import User
+
+test_cases = [
+    ("full/max/0/default.jpg", "image/jpeg"),
+    ("square/200,/90/gray.png", "image/png"),
+    ("10,20,100,50/!50,50/!0/color.webp", "image/webp"),
+    ("pct:10,10,50,50/pct:50/180/default.jpg", "image/jpeg"),
+    ("full/max/22.5/default.png", "image/png"),
+]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("parameters, content_type", test_cases)
+async def test_iiif_image(
+    test_client: AsyncClient,
+    uploaded_image: ObjectUploaded,
+    pre_existing_user: User,
+    parameters: str,
+    content_type: str,
+):
+    """Test IIIF image requests."""
+    url = (
+        f"{settings.api_prefix}/iiif/{pre_existing_user.cloudname}"
+        f"/{uploaded_image.object_key}/{parameters}"
+    )
+    response = await test_client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == content_type
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "parameters, status_code",
+    [
+        ("full/max/0/bitonal.jpg", status.HTTP_501_NOT_IMPLEMENTED),
+        ("full/max/0/default.tif", status.HTTP_501_NOT_IMPLEMENTED),
+        ("full/abc/0/default.jpg", status.HTTP_400_BAD_REQUEST),
+        ("99999,0,10,10/max/0/default.jpg", status.HTTP_400_BAD_REQUEST),
+        ("1,2,3/max/0/default.jpg", status.HTTP_400_BAD_REQUEST),
+        ("1,2,3,4,5/max/0/default.jpg", status.HTTP_400_BAD_REQUEST),
+        ("full/0,0/0/default.jpg", status.HTTP_400_BAD_REQUEST),
+        ("full/-5,10/0/default.jpg", status.HTTP_400_BAD_REQUEST),
+        ("full/0,/0/default.jpg", status.HTTP_400_BAD_REQUEST),
+        ("full/!10,0/0/default.jpg", status.HTTP_400_BAD_REQUEST),
+        ("full/pct:0/0/default.jpg", status.HTTP_400_BAD_REQUEST),
+    ],
+)
+async def test_iiif_image_invalid_parameters(
+    test_client: AsyncClient,
+    uploaded_image: ObjectUploaded,
+    pre_existing_user: User,
+    parameters: str,
+    status_code: int,
+):
+    """Test IIIF image requests with invalid or unsupported parameters."""
+    url = (
+        f"{settings.api_prefix}/iiif/{pre_existing_user.cloudname}"
+        f"/{uploaded_image.object_key}/{parameters}"
+    )
+    response = await test_client.get(url)
+    assert response.status_code == status_code
+
+
+@pytest.mark.asyncio
+async def test_iiif_info(
+    test_client: AsyncClient,
+    uploaded_image: ObjectUploaded,
+    pre_existing_user: User,
+):
+    """Test the IIIF image information document."""
+    url = (
+        f"{settings.api_prefix}/iiif/{pre_existing_user.cloudname}"
+        f"/{uploaded_image.object_key}/info.json"
+    )
+    response = await test_client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    info = response.json()
+    assert info["@context"] == "http://iiif.io/api/image/3/context.json"
+    assert info["id"].endswith(uploaded_image.object_key)
+    assert info["width"] > 0 and info["height"] > 0
+
+
+@pytest.mark.asyncio
+async def test_iiif_info_exif_orientation(
+    test_client: AsyncClient,
+    uploaded_image_oriented: ObjectUploaded,
+    pre_existing_user: User,
+):
+    """Test that info.json reports the oriented image size."""
+    url = (
+        f"{settings.api_prefix}/iiif/{pre_existing_user.cloudname}"
+        f"/{uploaded_image_oriented.object_key}/info.json"
+    )
+    response = await test_client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert (response.json()["width"], response.json()["height"]) == (80, 120)
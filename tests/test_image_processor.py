@@ -0,0 +1,40 @@
+import cv2
+import numpy as np
+
+from inteliver.image.image_processor import ImageProcessor, _round_crop_mask
+
+TEST_IMAGE = "tests/assets/images/jpg_test_image.jpeg"
+
+
+def process(commands: str, image: np.ndarray) -> np.ndarray:
+    _, result = ImageProcessor().process(commands.split(","), "image/jpeg", image)
+    return result
+
+
+def test_crop_at_zero_gravity():
+    image = cv2.imread(TEST_IMAGE)
+    result = process("i_c_x_0,i_c_y_0,i_w_1,i_h_1,i_o_crop", image)
+    assert result.shape[:2] == (1, 1)
+    assert (result[0, 0] == image[0, 0]).all()
+
+
+def test_operators_larger_than_image():
+    image = cv2.imread(TEST_IMAGE)
+    mean = cv2.resize(image, (1, 1), interpolation=cv2.INTER_AREA)[0, 0]
+    # blocks and kernels larger than the image give its mean color, in an
+    # output of the image size
+    for commands in ("i_o_pixelate_20000", "i_o_blur_320001"):
+        result = process(commands, image)
+        assert result.shape == image.shape
+        assert np.abs(result.astype(int) - mean).max() <= 1
+
+
+def test_round_crop_mask_cache():
+    small = _round_crop_mask(64, 48, True)
+    assert _round_crop_mask(64, 48, True)[0] is small[0]
+    assert not small[0].flags.writeable
+    # large masks are built for each call instead of cached
+    large = _round_crop_mask(2000, 1500, False)
+    assert _round_crop_mask(2000, 1500, False)[0] is not large[0]
+    assert large[0].shape == (1500, 2000)
+    assert large[1][750, 1000, 0] and not large[1][0, 0, 0]
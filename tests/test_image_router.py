@@ -1,8 +1,13 @@
+import cv2
+import numpy as np
 import pytest
 from fastapi import status
 from httpx import AsyncClient
+from minio import Minio
 
+from inteliver.auth.schemas import Token
 from inteliver.config import settings
+from inteliver.image.admission import AdmissionController
 from inteliver.storage.schemas import ObjectUploaded
 from inteliver.users.models import User
 
@@ -16,6 +21,8 @@ test_cases = [
     ("i_h_200,i_w_ih,i_o_resize", {"content-type": "image/jpeg;q=0.95"}),
     ("i_h_200,i_w_200,i_o_resize_keep", {"content-type": "image/jpeg;q=0.95"}),
     ("i_c_face,i_h_200,i_w_200,i_o_resize_keep", {"content-type": "image/jpeg;q=0.95"}),
+    ("i_c_auto,i_h_200,i_w_200,i_o_resize_keep", {"content-type": "image/jpeg;q=0.95"}),
+    ("i_h_150,i_w_300,i_c_auto,i_o_crop", {"content-type": "image/jpeg;q=0.95"}),
     (
         "i_c_face,i_h_200,i_w_200,i_o_resize_keep,i_o_rcrop,i_o_format_png",
         {"content-type": "image/png;q=0.3"},
@@ -34,18 +41,35 @@ test_cases = [
         {"content-type": "image/png;q=0.3"},
     ),
     ("i_c_face,i_h_200,i_w_200,i_o_crop", {"content-type": "image/jpeg;q=0.95"}),
+    # round crop
+    ("i_o_rcrop_aa,i_o_format_png", {"content-type": "image/png;q=0.3"}),
+    ("i_o_gray,i_o_rcrop,i_o_format_png", {"content-type": "image/png;q=0.3"}),
+    (
+        "i_o_rcrop,i_o_rcrop_aa,i_o_format_webp",
+        {"content-type": "image/webp;q=0.8"},
+    ),
     # rotate
     ("i_o_rotate_90", {"content-type": "image/jpeg;q=0.95"}),
     ("i_o_rotate_180", {"content-type": "image/jpeg;q=0.95"}),
     ("i_o_rotate_60_1.8", {"content-type": "image/jpeg;q=0.95"}),
     ("i_c_x_250,i_c_y_250,i_o_rotate_60_2", {"content-type": "image/jpeg;q=0.95"}),
+    ("i_o_rotate_-90", {"content-type": "image/jpeg;q=0.95"}),
+    ("i_o_rotate_45_expand", {"content-type": "image/jpeg;q=0.95"}),
+    ("i_o_rotate_30_1.5_expand", {"content-type": "image/jpeg;q=0.95"}),
     # flip
     ("i_o_flip_v", {"content-type": "image/jpeg;q=0.95"}),
     ("i_o_flip_h", {"content-type": "image/jpeg;q=0.95"}),
     ("i_o_flip_b", {"content-type": "image/jpeg;q=0.95"}),
+    # lossless jpeg
+    (
+        "i_c_x_64,i_c_y_96,i_h_64,i_w_64,i_o_crop/i_o_flip_v",
+        {"content-type": "image/jpeg;q=0.95"},
+    ),
+    ("i_o_flip_h/i_o_rotate_180,i_o_format_jpg", {"content-type": "image/jpeg;q=0.95"}),
     # blur
     ("i_o_blur_10", {"content-type": "image/jpeg;q=0.95"}),
     ("i_o_blur_40", {"content-type": "image/jpeg;q=0.95"}),
+    ("i_o_blur_101", {"content-type": "image/jpeg;q=0.95"}),
     (
         "i_c_x_275,i_c_y_275,i_h_75,i_w_75,i_o_blur_25",
         {"content-type": "image/jpeg;q=0.95"},
@@ -55,9 +79,19 @@ test_cases = [
         {"content-type": "image/jpeg;q=0.95"},
     ),
     ("i_c_face,i_o_blur_20", {"content-type": "image/jpeg;q=0.95"}),
+    # windows partially or fully outside the image
+    (
+        "i_c_x_10,i_c_y_10,i_h_100,i_w_100,i_o_blur_9",
+        {"content-type": "image/jpeg;q=0.95"},
+    ),
+    (
+        "i_c_x_5000,i_c_y_10,i_h_100,i_w_100,i_o_blur_9",
+        {"content-type": "image/jpeg;q=0.95"},
+    ),
     # pixelate
     ("i_o_pixelate_5", {"content-type": "image/jpeg;q=0.95"}),
     ("i_o_pixelate_20", {"content-type": "image/jpeg;q=0.95"}),
+    ("i_o_pixelate_7", {"content-type": "image/jpeg;q=0.95"}),
     (
         "i_c_x_150,i_c_y_100,i_h_200,i_w_200,i_o_pixelate_10",
         {"content-type": "image/jpeg;q=0.95"},
@@ -76,6 +110,17 @@ test_cases = [
         "i_c_x_100,i_c_y_300,i_h_200,i_w_200,i_o_gray",
         {"content-type": "image/jpeg;q=0.95"},
     ),
+    # mask selection
+    ("i_m_skin,i_o_blur_15", {"content-type": "image/jpeg;q=0.95"}),
+    ("i_m_hue_170_10,i_o_gray", {"content-type": "image/jpeg;q=0.95"}),
+    (
+        "i_m_sat_50_255,i_m_val_0_200,i_o_pixelate_8",
+        {"content-type": "image/jpeg;q=0.95"},
+    ),
+    (
+        "i_c_x_150,i_c_y_100,i_h_200,i_w_200,i_m_val_100_255,i_o_sharpen",
+        {"content-type": "image/jpeg;q=0.95"},
+    ),
     # compression
     ("i_o_format_jpg", {"content-type": "image/jpeg;q=0.95"}),
     ("i_o_format_jpg_80", {"content-type": "image/jpeg;q=0.8"}),
@@ -116,6 +161,43 @@ async def test_image_processing_success(
     # TODO: check the response binary data against the expected image data
 
 
+# (height, width) of the output, the test image is 335x502
+output_size_cases = [
+    # right angle rotations swap the width and height
+    ("i_o_rotate_90", (335, 502)),
+    ("i_o_rotate_-90", (335, 502)),
+    ("i_o_rotate_180", (502, 335)),
+    # expanded canvases hold the whole rotated (and scaled) image
+    ("i_o_rotate_45_expand", (592, 592)),
+    ("i_o_rotate_30_1.5_expand", (904, 812)),
+    # block mean pixelate and large blurs keep the image size, also when
+    # the blocks or the selection do not divide the image
+    ("i_o_pixelate_20", (502, 335)),
+    ("i_o_pixelate_20000", (502, 335)),
+    ("i_o_blur_101", (502, 335)),
+    ("i_c_x_150,i_c_y_100,i_h_200,i_w_200,i_o_pixelate_10", (502, 335)),
+    ("i_c_x_300,i_c_y_480,i_h_150,i_w_150,i_o_blur_101", (502, 335)),
+]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("command, expected_size", output_size_cases)
+async def test_image_processing_output_size(
+    test_client: AsyncClient,
+    uploaded_image: ObjectUploaded,
+    pre_existing_user: User,
+    command: str,
+    expected_size: tuple[int, int],
+):
+    """Test the output dimensions of the geometry operators."""
+    response = await test_client.get(
+        f"{settings.api_prefix}/image/{pre_existing_user.cloudname}/{command}/s3/{uploaded_image.object_key}"
+    )
+    assert response.status_code == status.HTTP_200_OK
+    image = cv2.imdecode(np.frombuffer(response.content, np.uint8), cv2.IMREAD_COLOR)
+    assert image.shape[:2] == expected_size
+
+
 @pytest.mark.asyncio
 async def test_test_image_processing_invalid_command(
     test_client: AsyncClient,
@@ -216,6 +298,8 @@ test_cases_face = [
     ("i_c_face,i_o_pixelate_10", {"content-type": "image/jpeg;q=0.95"}),
     # sharpen face
     ("i_c_face,i_o_sharpen", {"content-type": "image/jpeg;q=0.95"}),
+    # blur skin of the faces
+    ("i_m_face,i_m_skin,i_o_blur_9", {"content-type": "image/jpeg;q=0.95"}),
 ]
 
 
@@ -238,6 +322,72 @@ async def test_image_processing_face_success(
     # TODO: check the response binary data against the expected image data
 
 
+@pytest.mark.asyncio
+async def test_image_processing_exif_orientation(
+    test_client: AsyncClient,
+    uploaded_image_oriented: ObjectUploaded,
+    pre_existing_user: User,
+):
+    """Test that the EXIF orientation is applied on decode."""
+    response = await test_client.get(
+        f"{settings.api_prefix}/image/{pre_existing_user.cloudname}/i_o_format_png/s3/{uploaded_image_oriented.object_key}"
+    )
+    assert response.status_code == status.HTTP_200_OK
+    image = cv2.imdecode(np.frombuffer(response.content, np.uint8), cv2.IMREAD_COLOR)
+    assert image.shape[:2] == (120, 80)
+
+
+@pytest.mark.asyncio
+async def test_image_processing_server_timing(
+    test_client: AsyncClient,
+    uploaded_image: ObjectUploaded,
+    pre_existing_user: User,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """Test the opt-in Server-Timing header of the image stages."""
+    url = f"{settings.api_prefix}/image/{pre_existing_user.cloudname}/i_o_blur_5/s3/{uploaded_image.object_key}"
+    response = await test_client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert "server-timing" not in response.headers
+
+    monkeypatch.setattr(settings, "image_server_timing", True)
+    response = await test_client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    server_timing = response.headers["server-timing"]
+    for stage in ("fetch", "decode", "op-blur", "encode", "total"):
+        assert stage in server_timing
+
+
+@pytest.mark.asyncio
+async def test_image_processing_overloaded(
+    test_client: AsyncClient,
+    uploaded_image: ObjectUploaded,
+    pre_existing_user: User,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """Test that image requests are shed when the worker pool is saturated."""
+    url = f"{settings.api_prefix}/image/{pre_existing_user.cloudname}/i_o_blur_5/s3/{uploaded_image.object_key}"
+    monkeypatch.setattr(AdmissionController, "_pending_jobs", 1)
+    monkeypatch.setattr(
+        AdmissionController, "_pending_cost", AdmissionController.capacity()
+    )
+    response = await test_client.get(url)
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert int(response.headers["retry-after"]) >= 1
+
+
+@pytest.mark.asyncio
+async def test_image_processing_deadline(
+    test_client: AsyncClient,
+    uploaded_image: ObjectUploaded,
+    pre_existing_user: User,
+):
+    """Test that image requests are abandoned past their deadline."""
+    url = f"{settings.api_prefix}/image/{pre_existing_user.cloudname}/i_o_blur_5/s3/{uploaded_image.object_key}"
+    response = await test_client.get(url, headers={"X-Request-Timeout": "0.000001"})
+    assert response.status_code == status.HTTP_504_GATEWAY_TIMEOUT
+
+
 test_cases_insufficient_command_arg = [
     # arg center
     ("i_c_x,i_c_y_275,i_h_75,i_w_75,i_o_blur_25", {}),
@@ -253,6 +403,8 @@ test_cases_insufficient_command_arg = [
     ("i_o_flip_invalid", {}),
     # arg pixelate
     ("i_o_pixelate", {}),
+    # arg mask
+    ("i_m_hue_20,i_o_blur_5", {}),
     # arg text-overly
     ("i_c_y_-100,i_c_x_-180,i_o_text_Your-Brand", {}),
 ]
@@ -274,3 +426,124 @@ async def test_test_image_processing_insufficient_command_arg(
         f"{settings.api_prefix}/image/{pre_existing_user.cloudname}/{command}/s3/{uploaded_image.object_key}"
     )
     assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_image_processing_batch(
+    test_client: AsyncClient,
+    uploaded_image: ObjectUploaded,
+    auth_token: Token,
+    pre_existing_user: User,
+    minio_client: Minio,
+):
+    """Test the batch endpoint with a valid and an invalid item."""
+    response = await test_client.post(
+        f"{settings.api_prefix}/image/batch",
+        json={
+            "items": [
+                {
+                    "uri": uploaded_image.object_key,
+                    "commands": "i_h_200,i_w_200,i_o_resize,i_o_format_webp",
+                },
+                {"uri": "not-existing-object.jpg", "commands": "i_o_gray"},
+            ]
+        },
+        headers={"Authorization": f"Bearer {auth_token.access_token}"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()["results"]
+    assert results[0]["status_code"] == status.HTTP_200_OK
+    assert results[0]["content_type"] == "image/webp;q=0.8"
+    assert results[0]["object_key"].endswith(".webp")
+    # stored like an uploaded image
+    stats = minio_client.stat_object(
+        pre_existing_user.cloudname, results[0]["object_key"]
+    )
+    assert stats.content_type == "image/webp"
+    assert results[1]["status_code"] == status.HTTP_404_NOT_FOUND
+    assert results[1]["error"] is not None
+
+
+@pytest.mark.asyncio
+async def test_image_processing_batch_overloaded(
+    test_client: AsyncClient,
+    uploaded_image: ObjectUploaded,
+    auth_token: Token,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """Test that batch items are shed like single renders."""
+    monkeypatch.setattr(AdmissionController, "_pending_jobs", 1)
+    monkeypatch.setattr(
+        AdmissionController, "_pending_cost", AdmissionController.capacity()
+    )
+    response = await test_client.post(
+        f"{settings.api_prefix}/image/batch",
+        json={"items": [{"uri": uploaded_image.object_key, "commands": "i_o_gray"}]},
+        headers={"Authorization": f"Bearer {auth_token.access_token}"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()["results"]
+    assert results[0]["status_code"] == status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+@pytest.mark.asyncio
+async def test_image_processing_batch_unauthorized(
+    test_client: AsyncClient,
+):
+    """Test the batch endpoint without a token."""
+    response = await test_client.post(
+        f"{settings.api_prefix}/image/batch",
+        json={"items": [{"uri": "image.jpg", "commands": "i_o_gray"}]},
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.asyncio
+async def test_image_tiles(
+    test_client: AsyncClient,
+    uploaded_image: ObjectUploaded,
+    pre_existing_user: User,
+):
+    """Test the deep zoom descriptor and tile endpoints."""
+    base_url = f"{settings.api_prefix}/image/{pre_existing_user.cloudname}/tiles"
+    response = await test_client.get(f"{base_url}/{uploaded_image.object_key}.dzi")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("application/xml")
+    assert 'TileSize="254"' in response.text
+
+    response = await test_client.get(
+        f"{base_url}/{uploaded_image.object_key}/0/0_0.jpeg"
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "image/jpeg"
+
+    response = await test_client.get(
+        f"{base_url}/{uploaded_image.object_key}/0/5_5.jpeg"
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_image_analysis(
+    test_client: AsyncClient,
+    uploaded_image_face: ObjectUploaded,
+    pre_existing_user: User,
+):
+    """Test the image analysis endpoint."""
+    url = (
+        f"{settings.api_prefix}/image/{pre_existing_user.cloudname}"
+        f"/analysis/s3/{uploaded_image_face.object_key}"
+    )
+    response = await test_client.get(url, params={"features": "faces"})
+    assert response.status_code == status.HTTP_200_OK
+    analysis = response.json()
+    assert analysis["width"] > 0 and analysis["height"] > 0
+    assert len(analysis["faces"]) > 0
+    assert "objects" not in analysis
+
+    # served from the stored analysis
+    response = await test_client.get(url, params={"features": "faces"})
+    assert response.json() == analysis
+
+    response = await test_client.get(url, params={"features": "faces,cats"})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
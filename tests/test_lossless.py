@@ -0,0 +1,118 @@
+import cv2
+import numpy as np
+import pytest
+
+from inteliver.image.image_processor import ImageProcessor
+from inteliver.image.lossless import (
+    LosslessJpeg,
+    LosslessPlanner,
+    NotLosslessException,
+    jpegtran_path,
+)
+from inteliver.image.orientation import apply_orientation
+
+requires_jpegtran = pytest.mark.skipif(
+    jpegtran_path() is None, reason="jpegtran is not installed"
+)
+
+# jpegtran transforms replayed on the pixels
+TRANSFORMS = {
+    ("-flip", "horizontal"): lambda image: cv2.flip(image, 1),
+    ("-flip", "vertical"): lambda image: cv2.flip(image, 0),
+    ("-rotate", "90"): lambda image: cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE),
+    ("-rotate", "180"): lambda image: cv2.rotate(image, cv2.ROTATE_180),
+    ("-rotate", "270"): lambda image: cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE),
+    ("-transpose",): cv2.transpose,
+    ("-transverse",): lambda image: cv2.rotate(cv2.transpose(image), cv2.ROTATE_180),
+}
+
+
+@pytest.fixture
+def jpeg_data() -> bytes:
+    # iMCU aligned, so every flip is exact under -perfect
+    image = cv2.imread("tests/assets/images/jpg_test_image.jpeg")[:320, :320]
+    return cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def decode(data: bytes) -> np.ndarray:
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+@requires_jpegtran
+def test_lossless_flip(jpeg_data: bytes):
+    result = LosslessJpeg.render(jpeg_data, "i_o_flip_h")
+    # the lossless path ran
+    assert result is not None
+    flipped, image_format = result
+    assert image_format.startswith("image/jpeg")
+    assert decode(flipped).shape == decode(jpeg_data).shape
+
+    # flipping back restores the DCT coefficients, so the decoded pixels
+    # are bit-exact, a re-encode would lose a generation
+    restored, _ = LosslessJpeg.render(flipped, "i_o_flip_h")
+    assert np.array_equal(decode(restored), decode(jpeg_data))
+
+
+@requires_jpegtran
+def test_lossless_fallback(jpeg_data: bytes):
+    # blur has no lossless equivalent
+    assert LosslessJpeg.render(jpeg_data, "i_o_blur_5") is None
+
+
+def jpegtran(image: np.ndarray, steps: list[list[str]]) -> np.ndarray:
+    for args in steps:
+        if args[0] == "-crop":
+            size, x1, y1 = args[1].split("+")
+            width, height = map(int, size.split("x"))
+            image = image[int(y1) : int(y1) + height, int(x1) : int(x1) + width]
+        else:
+            image = TRANSFORMS[tuple(args[1:])](image)
+    return image
+
+
+def decode_path(image: np.ndarray, orientation: int, commands: str) -> np.ndarray:
+    _, result = ImageProcessor().process(
+        commands.split(","), "image/jpeg", apply_orientation(image, orientation)
+    )
+    return result
+
+
+@pytest.fixture
+def pixels() -> np.ndarray:
+    # not square, so a missed width and height swap changes the shape
+    return np.random.default_rng(0).integers(0, 256, (48, 32, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("orientation", range(1, 9))
+@pytest.mark.parametrize(
+    "commands",
+    ["i_o_format_jpg", "i_o_flip_h", "i_o_rotate_90", "i_o_flip_v,i_o_rotate_270"],
+)
+def test_plan_orientation(pixels: np.ndarray, orientation: int, commands: str):
+    height, width = pixels.shape[:2]
+    planner = LosslessPlanner(width, height, (8, 8), orientation)
+    steps = planner.plan(commands)
+    # the stored image transformed by the plan is the oriented image
+    # transformed by the pixel pipeline
+    assert np.array_equal(
+        jpegtran(pixels, steps), decode_path(pixels, orientation, commands)
+    )
+
+
+@pytest.mark.parametrize("orientation", [1, 6, 7])
+def test_plan_rotate_crop(pixels: np.ndarray, orientation: int):
+    commands = "i_o_rotate_90,i_w_16,i_h_16,i_c_x_16,i_c_y_16,i_o_crop"
+    height, width = pixels.shape[:2]
+    steps = LosslessPlanner(width, height, (8, 8), orientation).plan(commands)
+    # the rotation is flushed before the crop
+    assert steps[-1] == ["-crop", "16x16+8+8"]
+    assert np.array_equal(
+        jpegtran(pixels, steps), decode_path(pixels, orientation, commands)
+    )
+
+
+def test_plan_unaligned_crop(pixels: np.ndarray):
+    commands = "i_o_rotate_90,i_w_16,i_h_16,i_c_x_12,i_c_y_16,i_o_crop"
+    height, width = pixels.shape[:2]
+    with pytest.raises(NotLosslessException):
+        LosslessPlanner(width, height, (8, 8)).plan(commands)
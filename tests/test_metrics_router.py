@@ -0,0 +1,17 @@
+from fastapi.testclient import TestClient
+
+from inteliver.main import app
+
+client = TestClient(app)
+
+
+def test_metrics():
+    client.get("/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert (
+        'inteliver_http_request_duration_seconds_count{method="GET",route="/",'
+        'status="200"}' in response.text
+    )
+    assert "# TYPE inteliver_image_stage_seconds histogram" in response.text
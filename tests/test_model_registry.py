@@ -0,0 +1,60 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from inteliver.image.exceptions import ModelUnavailableException
+from inteliver.image.model_registry import ModelRegistry
+
+
+@pytest.fixture
+def loads(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    loads = []
+
+    def load_model():
+        loads.append("model")
+        # concurrent first uses wait for this load
+        time.sleep(0.05)
+        return object()
+
+    def load_missing():
+        loads.append("missing")
+        raise ImportError("No module named 'missing'")
+
+    loaders = {"model": load_model, "missing": load_missing}
+    monkeypatch.setattr(ModelRegistry, "_loaders", loaders)
+    monkeypatch.setattr(ModelRegistry, "_models", {})
+    monkeypatch.setattr(
+        ModelRegistry, "_locks", {name: threading.Lock() for name in loaders}
+    )
+    return loads
+
+
+def test_lazy_load(loads: list[str]):
+    assert ModelRegistry.loaded() == []
+    assert not loads
+
+    with ThreadPoolExecutor(4) as executor:
+        models = list(executor.map(ModelRegistry.get, ["model"] * 4))
+    # loaded once, on first use
+    assert loads == ["model"]
+    assert all(model is models[0] for model in models)
+    assert ModelRegistry.loaded() == ["model"]
+
+
+def test_model_unavailable(loads: list[str]):
+    with pytest.raises(ModelUnavailableException):
+        ModelRegistry.get("missing")
+    with pytest.raises(ModelUnavailableException):
+        ModelRegistry.get("unknown")
+    # a failed load is retried on the next use
+    with pytest.raises(ModelUnavailableException):
+        ModelRegistry.get("missing")
+    assert loads == ["missing", "missing"]
+    assert ModelRegistry.loaded() == []
+
+
+def test_warmup_skips_unavailable_models(loads: list[str]):
+    ModelRegistry.warmup(["missing", "model"])
+    assert ModelRegistry.loaded() == ["model"]
@@ -0,0 +1,81 @@
+import cv2
+import numpy as np
+import pytest
+
+from inteliver.config import settings
+from inteliver.image import detector_backends
+from inteliver.image.detector_backends import DetectorBackend
+from inteliver.image.object_detection import ObjectDetection
+
+TEST_IMAGE = "tests/assets/images/jpg_test_image.jpeg"
+IMGSZ = 64
+
+
+# a model boxing the whole image it sees, with its input size
+class FakeDetector(DetectorBackend):
+    fixed_imgsz = IMGSZ
+
+    def __init__(self, model_path: str):
+        self.shapes = []
+
+    def predict(self, images, classes):
+        self.shapes.extend(image.shape for image in images)
+        return [
+            [(0, 0, image.shape[1], image.shape[0], "thing", 0.9)] for image in images
+        ]
+
+
+@pytest.fixture
+def detector(monkeypatch: pytest.MonkeyPatch) -> ObjectDetection:
+    monkeypatch.setitem(detector_backends.BACKENDS, "fake", FakeDetector)
+    monkeypatch.setattr(ObjectDetection, "_model", None)
+    monkeypatch.setattr(ObjectDetection, "_batcher", None)
+    monkeypatch.setattr(settings, "image_detect_batch_size", 1)
+    return ObjectDetection("fake.onnx", "fake")
+
+
+def test_detect_rescales_boxes(detector: ObjectDetection):
+    image = cv2.imread(TEST_IMAGE)
+    height, width = image.shape[:2]
+    [(x1, y1, x2, y2, label, _)] = detector._detect(image)
+
+    # the model sees the image downscaled to its input size, the boxes are
+    # scaled back to the image
+    seen_height, seen_width = ObjectDetection._model.shapes[0][:2]
+    assert max(seen_height, seen_width) == IMGSZ
+    assert (x1, y1, label) == (0, 0, "thing")
+    assert x2 == pytest.approx(width, rel=0.02)
+    assert y2 == pytest.approx(height, rel=0.02)
+
+
+def test_detect_small_image(detector: ObjectDetection):
+    image = np.zeros((20, 30, 3), dtype=np.uint8)
+    [(x1, y1, x2, y2, _, _)] = detector._detect(image)
+    # smaller images are not upscaled
+    assert ObjectDetection._model.shapes[0] == (20, 30, 3)
+    assert (x1, y1, x2, y2) == (0, 0, 30, 20)
+
+
+def test_detect_grayscale_image(detector: ObjectDetection):
+    image = np.zeros((20, 30), dtype=np.uint8)
+    [(x1, y1, x2, y2, _, _)] = detector._detect(image)
+    # the model always sees three channels
+    assert ObjectDetection._model.shapes[0] == (20, 30, 3)
+    assert (x1, y1, x2, y2) == (0, 0, 30, 20)
+
+
+def test_default_model_path(monkeypatch: pytest.MonkeyPatch):
+    paths = []
+
+    class PathDetector(FakeDetector):
+        def __init__(self, model_path: str):
+            super().__init__(model_path)
+            paths.append(model_path)
+
+    monkeypatch.setitem(detector_backends.BACKENDS, "fake", PathDetector)
+    monkeypatch.setattr(ObjectDetection, "_model", None)
+    monkeypatch.setattr(ObjectDetection, "_batcher", None)
+    # the setting is read when the detector is created, not at import
+    monkeypatch.setattr(settings, "image_yolo_model_path", "changed.pt")
+    ObjectDetection(backend="fake")
+    assert paths == ["changed.pt"]
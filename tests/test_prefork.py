@@ -0,0 +1,95 @@
+import pytest
+
+from inteliver import prefork
+from inteliver.config import settings
+from inteliver.prefork import PreforkServer
+
+
+@pytest.fixture
+def server(monkeypatch: pytest.MonkeyPatch) -> PreforkServer:
+    server = PreforkServer("127.0.0.1", 0, 2)
+    server.spawned = []
+    monkeypatch.setattr(server, "_spawn", server.spawned.append)
+    monkeypatch.setattr(settings, "server_worker_crash_limit", 3)
+    return server
+
+
+def test_crashing_worker_backoff(
+    server: PreforkServer, monkeypatch: pytest.MonkeyPatch
+):
+    now = 1000.0
+    monkeypatch.setattr(prefork.time, "monotonic", lambda: now)
+    server._spawned_at[0] = now
+
+    # a crash right after the spawn delays the respawn, longer every time
+    server._schedule_respawn(0, True)
+    first_delay = server._respawn_at[0] - now
+    server._schedule_respawn(0, True)
+    assert server._respawn_at[0] - now == 2 * first_delay
+    assert server.spawned == []
+    assert not server._stopping
+
+    # the crash limit stops the master with an error
+    server._schedule_respawn(0, True)
+    assert server._failed
+    assert server._stopping
+    assert server.spawned == []
+
+
+def test_respawn_after_backoff(server: PreforkServer, monkeypatch: pytest.MonkeyPatch):
+    clock = [1000.0]
+    monkeypatch.setattr(prefork.time, "monotonic", lambda: clock[0])
+    server._spawned_at[0] = clock[0]
+    server._schedule_respawn(0, True)
+    server._respawn()
+    assert server.spawned == []
+
+    clock[0] += prefork.MAX_RESPAWN_DELAY_SECONDS
+    server._respawn()
+    assert server.spawned == [0]
+
+
+def test_worker_exit_after_uptime(
+    server: PreforkServer, monkeypatch: pytest.MonkeyPatch
+):
+    now = 1000.0
+    monkeypatch.setattr(prefork.time, "monotonic", lambda: now)
+    server._crashes[1] = 2
+    server._spawned_at[1] = now - prefork.WORKER_MIN_UPTIME_SECONDS
+    # e.g. recycled after server_max_requests, respawned at once
+    server._schedule_respawn(1, True)
+    assert server.spawned == [1]
+    assert server._crashes[1] == 0
+
+
+def test_clean_fast_exit(server: PreforkServer, monkeypatch: pytest.MonkeyPatch):
+    now = 1000.0
+    monkeypatch.setattr(prefork.time, "monotonic", lambda: now)
+    server._crashes[0] = 2
+    server._spawned_at[0] = now
+    # a worker recycled after server_max_requests under load is no crash
+    server._schedule_respawn(0, False)
+    assert server.spawned == [0]
+    assert server._crashes[0] == 0
+    assert not server._stopping
+
+
+@pytest.mark.parametrize(
+    "status,crashed",
+    [(0, False), (1 << 8, True), (9, True)],
+    ids=["exit-0", "exit-1", "sigkill"],
+)
+def test_reap_exit_status(
+    server: PreforkServer, monkeypatch: pytest.MonkeyPatch, status: int, crashed: bool
+):
+    now = 1000.0
+    monkeypatch.setattr(prefork.time, "monotonic", lambda: now)
+    exits = [(4242, status)]
+    monkeypatch.setattr(
+        prefork.os, "waitpid", lambda pid, options: exits.pop() if exits else (0, 0)
+    )
+    server._slots[4242] = 0
+    server._spawned_at[0] = now
+    server._reap()
+    assert server._crashes.get(0, 0) == int(crashed)
+    assert server.spawned == ([] if crashed else [0])
@@ -0,0 +1,28 @@
+from inteliver.image.roi import clamp_window, merge_windows
+
+
+def test_clamp_window():
+    # windows inside the image are kept
+    assert clamp_window((10, 20, 30, 40), 100, 50) == (10, 20, 30, 40)
+    # windows past the edges are cut at them
+    assert clamp_window((-5, -10, 30, 40), 100, 50) == (0, 0, 30, 40)
+    assert clamp_window((90, 40, 120, 70), 100, 50) == (90, 40, 100, 50)
+    # windows outside the image or without area are empty
+    assert clamp_window((100, 0, 120, 10), 100, 50) is None
+    assert clamp_window((-20, 0, 0, 10), 100, 50) is None
+    assert clamp_window((10, 10, 10, 20), 100, 50) is None
+
+
+def test_merge_windows():
+    assert merge_windows([]) == []
+
+    # touching windows share no pixel and are not merged
+    apart = [(0, 0, 10, 10), (10, 0, 20, 10)]
+    assert merge_windows(apart) == [(window, [window]) for window in apart]
+
+    # windows overlapping through a third one end up in one group
+    chain = [(0, 0, 10, 10), (20, 0, 30, 10), (8, 5, 22, 8), (50, 50, 60, 60)]
+    assert merge_windows(chain) == [
+        ((0, 0, 30, 10), [(0, 0, 10, 10), (8, 5, 22, 8), (20, 0, 30, 10)]),
+        ((50, 50, 60, 60), [(50, 50, 60, 60)]),
+    ]
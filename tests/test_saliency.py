@@ -0,0 +1,60 @@
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from inteliver.config import settings
+from inteliver.image import saliency
+from inteliver.image.saliency import SaliencyCrop, best_window
+
+
+def test_best_window_bright_patch():
+    saliency_map = np.zeros((40, 60), dtype=np.float32)
+    saliency_map[10:18, 35:45] = 1
+    assert best_window(saliency_map, 10, 8) == (35, 10)
+
+
+def test_best_window_flat_map_is_centered():
+    saliency_map = np.zeros((40, 60), dtype=np.float32)
+    assert best_window(saliency_map, 20, 10) == (20, 15)
+
+
+def test_inside():
+    # windows inside the image keep their center
+    assert SaliencyCrop._inside(50, 20, 100) == 50
+    # windows past an edge are moved back inside
+    assert SaliencyCrop._inside(3, 20, 100) == 10
+    assert SaliencyCrop._inside(97, 20, 100) == 90
+    assert SaliencyCrop._inside(97, 21, 100) == 89
+    # windows larger than the image are centered on it
+    assert SaliencyCrop._inside(3, 120, 100) == 50
+
+
+def test_gravity_cache(monkeypatch: pytest.MonkeyPatch):
+    calls = []
+
+    def counting_best_window(*args):
+        calls.append(args[1:])
+        return best_window(*args)
+
+    monkeypatch.setattr(saliency, "best_window", counting_best_window)
+    monkeypatch.setattr(SaliencyCrop, "_cache", OrderedDict())
+    monkeypatch.setattr(settings, "image_saliency_cache_size", 2)
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, (60, 80, 3), dtype=np.uint8) for _ in range(3)]
+
+    first = SaliencyCrop.gravity(images[0], 40, 30)
+    # the second crop is a cache hit
+    assert SaliencyCrop.gravity(images[0], 40, 30) == first
+    assert len(calls) == 1
+
+    # another window size of the same image is not
+    SaliencyCrop.gravity(images[0], 20, 30)
+    assert len(calls) == 2
+
+    # the least recently used gravity is evicted
+    SaliencyCrop.gravity(images[1], 40, 30)
+    SaliencyCrop.gravity(images[2], 40, 30)
+    assert len(SaliencyCrop._cache) == 2
+    assert SaliencyCrop.gravity(images[0], 40, 30) == first
+    assert len(calls) == 5
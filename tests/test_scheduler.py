@@ -0,0 +1,105 @@
+import threading
+from collections import Counter
+
+import pytest
+
+from inteliver.config import settings
+from inteliver.image.scheduler import FairScheduler, JobSchedule, Lane
+
+TIMEOUT = 5
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = FairScheduler(1, thread_name_prefix="test")
+    yield scheduler
+    scheduler.shutdown(wait=False)
+
+
+def run_order(scheduler: FairScheduler, schedules: list[JobSchedule]) -> list[str]:
+    """
+    Queue the jobs behind a blocked worker and return the order they ran
+        in, each job is named by its lane and cloudname.
+    """
+    gate = threading.Event()
+    scheduler.submit(gate.wait, JobSchedule(cloudname="gate", lane=Lane.PRECOMPUTE))
+    order = []
+    futures = [
+        scheduler.submit(
+            lambda schedule=schedule: order.append(
+                f"{schedule.lane.value}/{schedule.cloudname}"
+            ),
+            schedule,
+        )
+        for schedule in schedules
+    ]
+    gate.set()
+    for future in futures:
+        future.result(timeout=TIMEOUT)
+    return order
+
+
+def test_lane_shares(scheduler: FairScheduler, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "image_lane_weights", {"interactive": 3, "batch": 1})
+    schedules = [JobSchedule(lane=Lane.INTERACTIVE)] * 12 + [
+        JobSchedule(lane=Lane.BATCH)
+    ] * 12
+    order = run_order(scheduler, schedules)
+    # while both lanes are backlogged the workers are shared 3 to 1
+    assert Counter(order[:12]) == {"interactive/": 9, "batch/": 3}
+
+
+def test_tenant_shares(scheduler: FairScheduler, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "image_tenant_weights", {"big": 2})
+    schedules = [JobSchedule(cloudname="big")] * 12 + [
+        JobSchedule(cloudname="small")
+    ] * 12
+    order = run_order(scheduler, schedules)
+    assert Counter(order[:12]) == {"interactive/big": 8, "interactive/small": 4}
+
+
+def test_cap_holds_jobs_back():
+    scheduler = FairScheduler(2, thread_name_prefix="test")
+    gate = threading.Event()
+    capped = JobSchedule(cloudname="capped", max_concurrency=1)
+    blocking = scheduler.submit(gate.wait, capped)
+    held = scheduler.submit(lambda: "held", capped)
+    # the other worker is idle, it runs other tenants but not the held job
+    assert scheduler.submit(lambda: "other", JobSchedule()).result(TIMEOUT) == "other"
+    assert not held.done()
+    assert scheduler.queue_depth() == 1
+
+    gate.set()
+    assert held.result(TIMEOUT) == "held"
+    assert blocking.done()
+    scheduler.shutdown()
+
+
+def test_cancelled_jobs(scheduler: FairScheduler):
+    gate = threading.Event()
+    capped = JobSchedule(cloudname="capped", max_concurrency=1)
+    scheduler.submit(gate.wait, capped)
+    ran = []
+    cancelled = scheduler.submit(lambda: ran.append("cancelled"), capped)
+    assert cancelled.cancel()
+    gate.set()
+    # the cancelled job is skipped and frees its slot of the cap
+    assert scheduler.submit(lambda: "next", capped).result(TIMEOUT) == "next"
+    assert cancelled.cancelled()
+    assert not ran
+
+
+def test_shutdown_runs_queued_capped_jobs():
+    scheduler = FairScheduler(2, thread_name_prefix="test")
+    gate = threading.Event()
+    capped = JobSchedule(cloudname="capped", max_concurrency=1)
+    scheduler.submit(gate.wait, capped)
+    held = scheduler.submit(lambda: "held", capped)
+    scheduler.shutdown(wait=False)
+    with pytest.raises(RuntimeError):
+        scheduler.submit(lambda: None, capped)
+
+    gate.set()
+    scheduler.shutdown()
+    assert held.result(timeout=0) == "held"
+    assert not any(thread.is_alive() for thread in scheduler._threads)
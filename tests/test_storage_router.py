@@ -222,6 +222,33 @@ async def test_list_images_empty(
     assert len(data) == 0
 
 
+@pytest.mark.asyncio
+async def test_list_images_skips_derived_objects(
+    test_client: AsyncClient,
+    auth_token: Token,
+    pre_existing_user: User,
+    minio_client: Minio,
+    uploaded_image: ObjectUploaded,
+):
+    # a tile of the image pyramid, listed as the '{object_key}_files/' prefix
+    tile = b"tile"
+    minio_client.put_object(
+        pre_existing_user.cloudname,
+        f"{uploaded_image.object_key}_files/0/0_0.jpeg",
+        BytesIO(tile),
+        len(tile),
+        content_type="image/jpeg",
+    )
+    response = await test_client.get(
+        f"{settings.api_prefix}/storage/images",
+        headers={"Authorization": f"Bearer {auth_token.access_token}"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert [item["object_key"] for item in response.json()] == [
+        uploaded_image.object_key
+    ]
+
+
 @pytest.mark.asyncio
 async def test_list_images_unauthorized(
     test_client: AsyncClient,
@@ -329,6 +356,33 @@ async def test_delete_image_success(
     }
 
 
+@pytest.mark.asyncio
+async def test_delete_image_derived_objects(
+    test_client: AsyncClient,
+    auth_token: Token,
+    pre_existing_user: User,
+    minio_client: Minio,
+    uploaded_image: ObjectUploaded,
+):
+    derived_prefix = f"{uploaded_image.object_key}_files/"
+    for key in ("0/0_0.jpeg", "jpeg.dzi", "analysis/signature.json"):
+        minio_client.put_object(
+            pre_existing_user.cloudname,
+            f"{derived_prefix}{key}",
+            BytesIO(b"derived"),
+            len(b"derived"),
+        )
+    response = await test_client.delete(
+        f"{settings.api_prefix}/storage/images/{uploaded_image.object_key}",
+        headers={"Authorization": f"Bearer {auth_token.access_token}"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    remaining = minio_client.list_objects(
+        pre_existing_user.cloudname, prefix=derived_prefix, recursive=True
+    )
+    assert list(remaining) == []
+
+
 @pytest.mark.asyncio
 async def test_delete_image_not_found(
     test_client: AsyncClient,
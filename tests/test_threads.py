@@ -0,0 +1,43 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from inteliver.config import settings
+from inteliver.image.threads import ThreadBudget
+from inteliver.metrics.registry import MetricsRegistry
+
+
+def test_library_threads(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(ThreadBudget, "cpus", 16)
+    monkeypatch.setattr(settings, "image_worker_pool_size", 4)
+    # a configured value wins, 0 is the share of one image worker thread
+    assert ThreadBudget.library_threads(3) == 3
+    assert ThreadBudget.library_threads(0) == 4
+
+    # never less than one thread
+    monkeypatch.setattr(settings, "image_worker_pool_size", 32)
+    assert ThreadBudget.library_threads(0) == 1
+
+    # the pool defaults to one thread per cpu
+    monkeypatch.setattr(settings, "image_worker_pool_size", 0)
+    assert ThreadBudget.pool_size() == 16
+    assert ThreadBudget.library_threads(0) == 1
+
+
+def test_thread_budget_multiprocess_merge(tmp_path: Path):
+    registry = MetricsRegistry()
+    registry.multiprocess_dir = str(tmp_path)
+    budget = registry.gauge("budget", "", ("library",), multiprocess_mode="max")
+    in_flight = registry.gauge("in_flight", "", ("library",))
+    budget.set(4, library="opencv")
+    in_flight.set(1, library="opencv")
+
+    # another live worker process with the same thread budget
+    other = {"budget": [[["opencv"], 4]], "in_flight": [[["opencv"], 2]]}
+    (tmp_path / f"metrics_{os.getppid()}.json").write_text(json.dumps(other))
+
+    samples = registry.collect()
+    assert samples["budget"] == {("opencv",): 4}
+    assert samples["in_flight"] == {("opencv",): 3}
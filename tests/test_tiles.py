@@ -0,0 +1,39 @@
+import math
+
+import cv2
+import numpy as np
+
+from inteliver.image.tiles import TileService
+
+TEST_IMAGE = "tests/assets/images/jpg_test_image.jpeg"
+
+
+def decode(tile: bytes) -> np.ndarray:
+    return cv2.imdecode(np.frombuffer(tile, np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+def test_build_levels():
+    image = cv2.imread(TEST_IMAGE)
+    height, width = image.shape[:2]
+    tile_size, overlap = 128, 1
+
+    level_image = image
+    levels = {}
+    for level in range(TileService.max_level(width, height), -1, -1):
+        tiles, level_image = TileService.build_level(
+            level_image, "a.jpg", "png", level, tile_size, overlap
+        )
+        levels[level] = tiles
+
+    # every level halves the one above, down to a single pixel
+    assert len(levels) == math.ceil(math.log2(max(width, height))) + 1
+    assert level_image.shape[:2] == (1, 1)
+    full = levels[max(levels)]
+    assert len(full) == math.ceil(width / tile_size) * math.ceil(height / tile_size)
+
+    # inner tiles overlap their neighbours on both sides, edge tiles on one
+    tile = decode(full[TileService.tile_key("a.jpg", max(levels), 1, 1, "png")])
+    assert tile.shape[:2] == (tile_size + 2 * overlap, tile_size + 2 * overlap)
+    assert np.array_equal(tile, image[127:257, 127:257])
+    corner = decode(full[TileService.tile_key("a.jpg", max(levels), 0, 0, "png")])
+    assert corner.shape[:2] == (tile_size + overlap, tile_size + overlap)
@@ -0,0 +1,66 @@
+import cv2
+import numpy as np
+import pytest
+
+from inteliver.image import tiling
+from inteliver.image.image_processor import ImageProcessor
+from inteliver.image.tiling import band_height, process_in_bands
+
+TEST_IMAGE = "tests/assets/images/jpg_test_image.jpeg"
+
+
+def process(commands: str, image: np.ndarray) -> np.ndarray:
+    _, result = ImageProcessor().process(commands.split(","), "image/jpeg", image)
+    return result
+
+
+@pytest.mark.parametrize("halo", [0, 1, 7, 40])
+@pytest.mark.parametrize("align", [1, 5, 16])
+def test_bands_match_whole_image(
+    halo: int, align: int, monkeypatch: pytest.MonkeyPatch
+):
+    image = np.random.default_rng(halo + align).integers(0, 255, (301, 97, 3), np.uint8)
+
+    def op(band):
+        return cv2.blur(band, (2 * halo + 1, 2 * halo + 1))
+
+    expected = op(image)
+    # a tiny budget gives the smallest bands, MIN_BAND_HEIGHT or halo rows
+    monkeypatch.setattr(tiling, "memory_budget", lambda: 1)
+    rows = band_height(image, halo, align)
+    assert rows % align == 0 and halo <= rows < image.shape[0]
+
+    result = process_in_bands(image, op, halo, align)
+    # written back into the image itself
+    assert result is image
+    assert np.array_equal(result, expected)
+
+
+def test_bands_changing_channels():
+    image = np.random.default_rng(0).integers(0, 255, (100, 40, 3), np.uint8)
+    expected = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    result = process_in_bands(
+        image, lambda band: cv2.cvtColor(band, cv2.COLOR_BGR2GRAY), 0, 1
+    )
+    assert result.shape == (100, 40)
+    assert np.array_equal(result, expected)
+
+
+@pytest.mark.parametrize(
+    "commands",
+    [
+        "i_o_blur_9",
+        "i_o_blur_101",
+        "i_o_pixelate_7",
+        "i_o_pixelate_64",
+        "i_o_sharpen",
+        "i_o_gray",
+    ],
+)
+def test_banded_operators(commands: str, monkeypatch: pytest.MonkeyPatch):
+    image = cv2.imread(TEST_IMAGE)
+    expected = process(commands, image.copy())
+    # every image is over a 1 byte budget, so it is processed in bands
+    monkeypatch.setattr(tiling, "memory_budget", lambda: 1)
+    assert tiling.should_tile(image)
+    assert np.array_equal(process(commands, image.copy()), expected)
@@ -0,0 +1,16 @@
+from inteliver.metrics.timing import StageTimer
+
+
+def test_server_timing_operators():
+    timer = StageTimer()
+    timer.record("fetch", 0.012)
+    timer.record("operator", 0.0034, operator="blur")
+    timer.record("operator", 0.002, operator="resize")
+
+    entries = timer.server_timing().split(", ")
+    assert entries[:3] == [
+        "fetch;dur=12.0",
+        'op-blur;desc="blur";dur=3.4',
+        'op-resize;desc="resize";dur=2.0',
+    ]
+    assert entries[3].startswith("total;dur=")